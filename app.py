@@ -18,6 +18,8 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 # Upload settings
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
+# Recorded videos posted to /attendance/video may be far larger (default 2GB); they are streamed to disk
+app.config['VIDEO_MAX_UPLOAD_BYTES'] = int(os.environ.get('VIDEO_MAX_UPLOAD_BYTES', 2 * 1024 * 1024 * 1024))
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Database path
@@ -45,10 +47,29 @@ app.register_blueprint(chatbot_bp, url_prefix='/chatbot')
 app.register_blueprint(alerts_bp, url_prefix='/alerts')
 app.register_blueprint(logs_bp, url_prefix='/logs')
 
+# ========== Cross-process Change Detection ==========
+# One PRAGMA data_version per DB_CHANGE_POLL_SECONDS; subscribed caches refresh what other processes changed
+from utils.db_changes import poll_changes
+
+@app.before_request
+def _poll_db_changes():
+    poll_changes(app.config['DB_PATH'])
+
+# ========== Streaming Endpoint (WebSocket) ==========
+from routes.stream import init_stream
+init_stream(app)
+
 # ========== Initialize SQLite Database ==========
 from utils.db_handler import initialize_data_files
 initialize_data_files(db_path=app.config['DB_PATH'])
 
+# ========== Optional FaceNet Warmup ==========
+# The embedding backend (FACE_BACKEND) loads lazily on the first recognition request unless warmed up here
+if os.environ.get('FACENET_WARMUP', '0').lower() in ('1', 'true', 'yes', 'on'):
+    from utils.inference_backends import get_backend
+    get_backend().warmup()
+
 # Run the app
 if __name__ == '__main__':
+    # Development server only; in production run `python serve.py`
     app.run(debug=True)
\ No newline at end of file
@@ -1,23 +1,97 @@
+import os
+import math
 import cv2
 import numpy as np
-from keras_facenet import FaceNet
-from keras.utils import img_to_array
 from PIL import Image
-
-# Load FaceNet model
-face_net = FaceNet()
+from utils.image_decode import decode_upload
+from utils.inference_scheduler import INFERENCE_SCHEDULER, get_scheduler
+from utils.inference_backends import get_backend
+from utils.inference_server import INFERENCE_SERVER, embed_via_server
+from utils.face_quality import check_face, check_faces
 
 # Haar cascade for face detection
 FACE_DETECTOR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
 face_cascade = cv2.CascadeClassifier(FACE_DETECTOR_PATH)
 
 
+def _parse_roi(value):
+    try:
+        x, y, w, h = (int(v) for v in value.split(','))
+        return x, y, w, h
+    except (AttributeError, ValueError):
+        return None
+
+
+# Haar detection runs on a copy whose longest side is at most this many pixels
+DETECT_MAX_SIDE = int(os.environ.get('DETECT_MAX_SIDE', 640))
+
+# Smallest face (in full-resolution pixels) the detector looks for
+DETECT_MIN_FACE = int(os.environ.get('DETECT_MIN_FACE', 48))
+
+# Optional "x,y,w,h" region of interest for fixed-mount kiosk cameras, in the camera's full-resolution pixels.
+# Only the kiosk and the live stream pass it to detect_faces; uploads are always searched whole.
+DETECT_ROI = _parse_roi(os.environ.get('DETECT_ROI'))
+
+
+def scale_roi(roi, scale):
+    """
+    Map an x,y,w,h region given in full-resolution pixels onto a frame decoded at scale.
+    """
+    if not roi or scale == 1.0:
+        return roi
+    return tuple(int(round(v * scale)) for v in roi)
+
+
+def detect_faces(frame, max_side=None, min_face=None, roi=None):
+    """
+    Detect all faces in the frame and return their (x, y, w, h) boxes, largest first.
+    The cascade runs on a copy downscaled to max_side (optionally restricted to an
+    x,y,w,h region of interest in the frame's pixel coordinates, e.g. DETECT_ROI for
+    a kiosk camera); boxes are mapped back to full-resolution coordinates. The roi
+    is clipped to the frame, and nothing is found when none of it is left.
+    """
+    max_side = DETECT_MAX_SIDE if max_side is None else max_side
+    min_face = DETECT_MIN_FACE if min_face is None else min_face
+
+    offset_x = offset_y = 0
+    if roi:
+        roi_x, roi_y, roi_w, roi_h = roi
+        frame_h, frame_w = frame.shape[:2]
+        offset_x, offset_y = max(0, roi_x), max(0, roi_y)
+        end_x, end_y = min(frame_w, roi_x + roi_w), min(frame_h, roi_y + roi_h)
+        frame = frame[offset_y:end_y, offset_x:end_x]
+
+    height, width = frame.shape[:2]
+    if not height or not width:
+        return []
+    scale = min(1.0, max_side / max(height, width)) if max_side else 1.0
+    small = frame if scale == 1.0 else cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+    gray = small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    # Rounded up both ways, so every box is at least min_face (and QUALITY_MIN_FACE) full-resolution pixels
+    min_size = max(1, math.ceil(min_face * scale))
+    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5, minSize=(min_size, min_size))
+
+    boxes = []
+    for x, y, w, h in faces:
+        x, y = int(x / scale), int(y / scale)
+        w, h = min(math.ceil(w / scale), width - x), min(math.ceil(h / scale), height - y)
+        boxes.append((x + offset_x, y + offset_y, w, h))
+    return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+
+def get_faces_from_frame(frame):
+    """
+    Detect every face in the frame and return a list of (box, cropped face) pairs.
+    """
+    return [((x, y, w, h), frame[y:y+h, x:x+w]) for x, y, w, h in detect_faces(frame)]
+
+
 def get_face_from_frame(frame) -> np.ndarray:
     """
     Detect the largest face in the frame and return the cropped face region.
     """
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5)
+    faces = detect_faces(frame)
 
     if len(faces) == 0:
         print("⚠️ No faces detected.")
@@ -25,7 +99,7 @@ def get_face_from_frame(frame) -> np.ndarray:
 
     print(f"✅ Detected {len(faces)} face(s). Using the largest.")
     # Use the largest face detected
-    x, y, w, h = sorted(faces, key=lambda b: b[2] * b[3], reverse=True)[0]
+    x, y, w, h = faces[0]
     return frame[y:y+h, x:x+w]
 
 
@@ -40,6 +114,29 @@ def preprocess_face(face_img):
     return np.expand_dims(face_img, axis=0)
 
 
+def embed_faces(faces) -> np.ndarray:
+    """
+    Run FaceNet on a (N, 160, 160, 3) batch of preprocessed faces.
+    Goes to the shared inference server when INFERENCE_SERVER is set (falling back
+    to in-process inference while it is down), otherwise through the
+    micro-batching scheduler when INFERENCE_SCHEDULER is enabled.
+    """
+    if INFERENCE_SERVER:
+        return embed_via_server(faces, fallback=_local_embeddings)
+    return _local_embeddings(faces)
+
+
+def _local_embeddings(faces) -> np.ndarray:
+    if INFERENCE_SCHEDULER:
+        return get_scheduler(_facenet_embeddings).embed(faces)
+    return _facenet_embeddings(faces)
+
+
+def _facenet_embeddings(faces) -> np.ndarray:
+    # The configured backend (FACE_BACKEND) loads lazily on first use
+    return get_backend().embed(faces)
+
+
 def l2_normalize(x):
     """
     Normalize a vector using L2 norm.
@@ -47,6 +144,20 @@ def l2_normalize(x):
     return x / np.linalg.norm(x)
 
 
+def to_bgr_array(image) -> np.ndarray:
+    """
+    Convert FileStorage, BytesIO, NumPy array or PIL Image to a NumPy (BGR) array.
+    Returns None for unsupported input types.
+    """
+    if hasattr(image, 'read'):  # FileStorage or BytesIO
+        return decode_upload(image)  # reduced-scale decode straight to contiguous BGR
+    elif isinstance(image, Image.Image):  # PIL image
+        return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    elif isinstance(image, np.ndarray):  # Already a NumPy array
+        return image
+    return None
+
+
 def get_embedding_from_image(image) -> np.ndarray:
     """
     Extract face from an image and return FaceNet embedding.
@@ -54,14 +165,8 @@ def get_embedding_from_image(image) -> np.ndarray:
     """
     try:
         # Step 1: Convert to NumPy (BGR) regardless of input type
-        if hasattr(image, 'read'):  # FileStorage or BytesIO
-            image = Image.open(image).convert("RGB")
-            image = np.array(image)[:, :, ::-1]  # Convert RGB to BGR
-        elif isinstance(image, Image.Image):  # PIL image
-            image = np.array(image.convert("RGB"))[:, :, ::-1]
-        elif isinstance(image, np.ndarray):  # Already a NumPy array
-            pass
-        else:
+        image = to_bgr_array(image)
+        if image is None:
             print("❌ Unsupported image type")
             return None
 
@@ -71,9 +176,15 @@ def get_embedding_from_image(image) -> np.ndarray:
             print("⚠️ No face detected in the image.")
             return None
 
-        # Step 3: Preprocess face and get embedding
+        # Step 3: Reject crops FaceNet can't match anyway (tiny, blurred, badly exposed)
+        reason = check_face(face_img)
+        if reason:
+            print(f"⚠️ Face rejected by quality gate: {reason}.")
+            return None
+
+        # Step 4: Preprocess face and get embedding
         processed_face = preprocess_face(face_img)
-        embedding = face_net.embeddings(processed_face)[0]
+        embedding = embed_faces(processed_face)[0]
         return embedding
 
     except Exception as e:
@@ -81,24 +192,100 @@ def get_embedding_from_image(image) -> np.ndarray:
         return None
 
 
-def get_average_embedding_from_images(image_list) -> np.ndarray:
+def get_embeddings_from_images(image_list):
     """
-    Accepts a list of images (PIL or np.ndarray), extracts L2-normalized face embeddings from each,
-    and returns their average embedding.
-    Skips images where no face is detected.
+    Detect a face in every image and embed all crops with a single batched
+    FaceNet forward pass.
+    Returns (embeddings, failures): embeddings is a list aligned with image_list
+    holding an embedding or None, failures maps image index -> reason.
     """
-    embeddings = []
+    embeddings = [None] * len(image_list)
+    failures = {}
+    batch, batch_indices = [], []
 
     for idx, img in enumerate(image_list):
-        if not isinstance(img, np.ndarray):
-            img = np.array(img.convert('RGB'))
+        try:
+            image = to_bgr_array(img)
+            if image is None:
+                failures[idx] = "unsupported image type"
+                continue
+
+            face_img = get_face_from_frame(image)
+            if face_img is None:
+                failures[idx] = "no face detected"
+                continue
+
+            reason = check_face(face_img)
+            if reason:
+                failures[idx] = f"low quality face ({reason})"
+                continue
+
+            batch.append(preprocess_face(face_img))
+            batch_indices.append(idx)
+        except Exception as e:
+            failures[idx] = f"failed to process image: {e}"
+
+    if batch:
+        try:
+            batch_embeddings = embed_faces(np.concatenate(batch, axis=0))
+            for idx, embedding in zip(batch_indices, batch_embeddings):
+                embeddings[idx] = embedding
+        except Exception as e:
+            for idx in batch_indices:
+                failures[idx] = f"embedding failed: {e}"
+
+    return embeddings, failures
+
+
+def get_all_embeddings_from_image(image):
+    """
+    Detect every face in an image and embed all crops in one batched forward pass.
+    Returns (boxes, embeddings) where embeddings has one row per box.
+    """
+    image = to_bgr_array(image)
+    if image is None:
+        print("❌ Unsupported image type")
+        return [], None
+
+    faces = get_faces_from_frame(image)
+    if not faces:
+        print("⚠️ No faces detected.")
+        return [], None
+
+    print(f"✅ Detected {len(faces)} face(s).")
+    reasons = check_faces([face_img for _, face_img in faces])
+    faces = [face for face, reason in zip(faces, reasons) if reason is None]
+    if not faces:
+        print(f"⚠️ All faces rejected by quality gate: {reasons}")
+        return [], None
+
+    boxes = [box for box, _ in faces]
+    batch = np.concatenate([preprocess_face(face_img) for _, face_img in faces], axis=0)
+    return boxes, embed_faces(batch)
+
+
+def get_template_embeddings_from_images(image_list):
+    """
+    Accepts a list of images (PIL or np.ndarray) and extracts one face embedding
+    per image in a single batch. Skips images where no usable face is found.
+    Returns the list of embeddings (one enrollment template per usable image).
+    """
+    image_list = [img if isinstance(img, np.ndarray) else np.array(img.convert('RGB')) for img in image_list]
+    results, failures = get_embeddings_from_images(image_list)
+
+    for idx, reason in sorted(failures.items()):
+        print(f"⚠️ Skipping image {idx+1}: {reason}.")
 
-        embedding = get_embedding_from_image(img)
-        if embedding is not None:
-            embeddings.append(embedding)
-        else:
-            print(f"⚠️ Skipping image {idx+1}: no valid face detected.")
+    return [embedding for embedding in results if embedding is not None]
 
+
+def get_average_embedding_from_images(image_list) -> np.ndarray:
+    """
+    Accepts a list of images (PIL or np.ndarray), extracts face embeddings from all
+    of them in one batch, and returns their average embedding.
+    Skips images where no face is detected.
+    """
+    embeddings = get_template_embeddings_from_images(image_list)
     if not embeddings:
         print("❌ No valid embeddings found.")
         return None
@@ -110,10 +297,15 @@ def get_embedding_from_camera() -> np.ndarray:
     """
     Capture face from webcam and return L2-normalized FaceNet embedding vector.
     Press 'c' to capture, 'q' to quit.
+    Faces are tracked across frames, so a face that was already embedded is not
+    sent through FaceNet again.
     """
+    from utils.face_tracker import FaceTracker
+
     cap = cv2.VideoCapture(0)
     print("📸 Capturing face. Press 'c' to capture or 'q' to quit.")
 
+    tracker = FaceTracker()
     embedding = None
     while True:
         ret, frame = cap.read()
@@ -121,18 +313,22 @@ def get_embedding_from_camera() -> np.ndarray:
             break
 
         display_frame = frame.copy()
-        face_img = get_face_from_frame(frame)
-        if face_img is not None:
-            x, y, w, h = cv2.boundingRect(cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY))
+        tracks = tracker.update(detect_faces(frame))
+        for track in tracks:
+            x, y, w, h = track.box
             cv2.rectangle(display_frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            cv2.putText(display_frame, f"#{track.track_id}", (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
 
         cv2.imshow("Face Capture", display_frame)
 
         key = cv2.waitKey(1)
-        if key == ord('c') and face_img is not None:
-            processed_face = preprocess_face(face_img)
-            embedding = face_net.embeddings(processed_face)[0]
-            embedding = l2_normalize(embedding)
+        if key == ord('c') and tracks:
+            track = tracks[0]
+            if track.embedding is None:
+                x, y, w, h = track.box
+                processed_face = preprocess_face(frame[y:y+h, x:x+w])
+                tracker.set_identity(track, embed_faces(processed_face)[0], None, 0.0)
+            embedding = l2_normalize(track.embedding)
             print("✅ Face captured and embedding generated.")
             break
         elif key == ord('q'):
@@ -140,4 +336,4 @@ def get_embedding_from_camera() -> np.ndarray:
 
     cap.release()
     cv2.destroyAllWindows()
-    return embedding
\ No newline at end of file
+    return embedding
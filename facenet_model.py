@@ -1,14 +1,10 @@
-import os
 import numpy as np
-from keras.models import load_model
-from keras.utils import img_to_array
 import cv2
+from utils.model_registry import FACENET_H5_PATH, get_model, get_engine
+from utils.inference_engine import INFERENCE_ENGINE
 
-# Load FaceNet model
-FACENET_MODEL_PATH = os.path.join('models', 'facenet_keras.h5')
-
-# Load the model globally
-facenet_model = load_model(FACENET_MODEL_PATH)
+# Load FaceNet model lazily through the shared model registry
+FACENET_MODEL_PATH = FACENET_H5_PATH
 
 def preprocess_face(face_img, target_size=(160, 160)) -> np.ndarray:
     """
@@ -24,5 +20,7 @@ def get_face_embedding(face_img: np.ndarray) -> np.ndarray:
     Given a face image (RGB), return its FaceNet embedding vector.
     """
     preprocessed = preprocess_face(face_img)
-    embedding = facenet_model.predict(preprocessed)[0]  # Get the 128-d vector
-    return embedding
\ No newline at end of file
+    if INFERENCE_ENGINE:
+        return get_engine('facenet_h5').embed(preprocessed)[0]
+    embedding = get_model('facenet_h5').predict(preprocessed, verbose=0)[0]  # Get the 128-d vector
+    return embedding
@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import json
+import argparse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from utils.face_tracker import FaceTracker
+from utils.face_quality import check_face
+from face_utils import DETECT_ROI, detect_faces
+
+# Attendance server the kiosk submits face crops to; it runs the only recognition
+KIOSK_API_URL = os.environ.get('KIOSK_API_URL', 'http://127.0.0.1:5000')
+
+# This kiosk's token from the server's STREAM_KIOSK_TOKENS (the kiosk must be in STREAM_IDENTIFY_KIOSKS)
+KIOSK_TOKEN = os.environ.get('KIOSK_TOKEN', '')
+
+# Location recorded with every attendance entry
+KIOSK_LOCATION = os.environ.get('KIOSK_LOCATION', 'Kiosk')
+
+# Upper bound on face detections per second
+KIOSK_DETECT_FPS = float(os.environ.get('KIOSK_DETECT_FPS', 5))
+
+# Fraction of pixels that must change between frames to count as motion
+KIOSK_MOTION_THRESHOLD = float(os.environ.get('KIOSK_MOTION_THRESHOLD', 0.01))
+
+# Seconds before a track whose submission was rejected is submitted again
+KIOSK_RETRY_SECONDS = float(os.environ.get('KIOSK_RETRY_SECONDS', 30))
+
+# Context kept around a face when cropping it for submission, as a fraction of the box size per side
+KIOSK_CROP_MARGIN = float(os.environ.get('KIOSK_CROP_MARGIN', 0.4))
+
+# Motion is measured on a grayscale copy this many pixels wide
+KIOSK_MOTION_WIDTH = 160
+
+# Per-pixel gray level change that counts as "changed"
+KIOSK_PIXEL_DELTA = 25
+
+
+class MotionGate:
+    """
+    Cheap frame differencing on a tiny blurred grayscale copy. Detection only
+    runs when enough pixels changed since the last frame that was looked at.
+    """
+
+    def __init__(self, threshold=KIOSK_MOTION_THRESHOLD, width=KIOSK_MOTION_WIDTH):
+        self.threshold = threshold
+        self.width = width
+        self._previous = None
+
+    def moved(self, frame) -> bool:
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self._previous = self._previous, gray
+        if previous is None:
+            return True
+        changed = cv2.countNonZero(cv2.threshold(cv2.absdiff(gray, previous), KIOSK_PIXEL_DELTA, 255, cv2.THRESH_BINARY)[1])
+        return changed >= self.threshold * gray.size
+
+
+def _multipart(fields, files):
+    """
+    Encode form fields and (name, filename, bytes, content type) files as multipart/form-data.
+    """
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode('utf-8')
+    for name, filename, data, content_type in files:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        body += data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode('utf-8')
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+
+def crop_face(frame, box, margin=KIOSK_CROP_MARGIN):
+    """
+    Cut one tracked face (x, y, w, h) out of the frame with some context around it,
+    so the server's detector finds that face and not a larger one next to it.
+    """
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    height, width = frame.shape[:2]
+    return frame[max(0, y - dy):min(height, y + h + dy), max(0, x - dx):min(width, x + w + dx)]
+
+
+def submit_attendance(api_url, frame, location, token=KIOSK_TOKEN, timeout=10):
+    """
+    POST a tracked face crop to /attendance/kiosk, where the server identifies it
+    (1:N) and marks attendance, refusing a second mark on the same day.
+    Returns (ok, message, faculty_id or None).
+    """
+    ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        return False, 'Failed to encode frame', None
+
+    body, content_type = _multipart(
+        {'location': location},
+        [('image', 'kiosk.jpg', jpeg.tobytes(), 'image/jpeg')]
+    )
+    req = urllib.request.Request(f'{api_url.rstrip("/")}/attendance/kiosk', data=body, method='POST',
+                                 headers={'Content-Type': content_type, 'Authorization': f'Bearer {token}'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            result = json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        try:
+            result = json.loads(e.read() or b'{}')
+        except ValueError:
+            result = {'success': False, 'message': f'HTTP {e.code}'}
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return False, f'Request failed: {e}', None
+    return bool(result.get('success')), result.get('message', ''), (result.get('data') or {}).get('faculty_id')
+
+
+class KioskRunner:
+    """
+    Unattended entrance camera: motion gate -> throttled detection -> face tracking
+    -> quality gate -> one submission per track to the attendance API. The kiosk
+    needs no model or gallery: the server identifies each submitted face.
+    """
+
+    def __init__(self, source, api_url=KIOSK_API_URL, location=KIOSK_LOCATION, token=KIOSK_TOKEN,
+                 detect_fps=KIOSK_DETECT_FPS, motion_threshold=KIOSK_MOTION_THRESHOLD, dry_run=False):
+        self.source = source
+        self.api_url = api_url
+        self.location = location
+        self.token = token
+        self.detect_interval = 1.0 / detect_fps if detect_fps > 0 else 0.0
+        self.motion = MotionGate(motion_threshold)
+        self.tracker = FaceTracker()
+        self.dry_run = dry_run
+        self._submitted = {}  # track_id -> monotonic time it may be submitted again (None: never)
+        self._submitter = ThreadPoolExecutor(max_workers=1)
+        self.stats = {'frames': 0, 'motion_skipped': 0, 'throttled': 0, 'detections': 0,
+                      'quality_rejected': 0, 'submitted': 0, 'marked': 0}
+
+    def _clock(self, cap, is_file):
+        # Video files are throttled on their own timeline so tests run faster than real time
+        if is_file:
+            return cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        return time.monotonic()
+
+    def _submit(self, track_id, frame):
+        ok, message, faculty_id = submit_attendance(self.api_url, frame, self.location, self.token)
+        if ok:
+            self.stats['marked'] += 1
+            print(f"✅ {faculty_id}: {message}")
+        else:
+            # Try the same person again on a later frame, but don't hammer the server every frame
+            self._submitted[track_id] = time.monotonic() + KIOSK_RETRY_SECONDS
+            print(f"❌ Track {track_id}: {message}")
+
+    def handle_frame(self, frame):
+        tracks = self.tracker.update(detect_faces(frame, roi=DETECT_ROI))
+        active = {track.track_id for track in self.tracker.tracks}
+        self._submitted = {tid: until for tid, until in self._submitted.items() if tid in active}
+        for track in tracks:
+            if track.track_id in self._submitted:
+                until = self._submitted[track.track_id]
+                if until is None or time.monotonic() < until:
+                    continue
+            x, y, w, h = track.box
+            reason = check_face(frame[y:y+h, x:x+w])
+            if reason:
+                # A later frame of the same track may be sharper or better lit
+                self.stats['quality_rejected'] += 1
+                continue
+            self._submitted[track.track_id] = None
+            if not self.dry_run:
+                self.stats['submitted'] += 1
+                self._submitter.submit(self._submit, track.track_id, crop_face(frame, track.box).copy())
+
+    def run(self, max_frames=None):
+        is_file = not str(self.source).isdigit()
+        cap = cv2.VideoCapture(self.source if is_file else int(self.source))
+        if not cap.isOpened():
+            print(f"❌ Could not open video source {self.source}")
+            return self.stats
+
+        print(f"📸 Kiosk running on {self.source} – press Ctrl+C to stop.")
+        last_detect = None
+        try:
+            while max_frames is None or self.stats['frames'] < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                self.stats['frames'] += 1
+
+                # Keep looking while someone is tracked, even if they stand still
+                if not self.motion.moved(frame) and not self.tracker.tracks:
+                    self.stats['motion_skipped'] += 1
+                    continue
+
+                now = self._clock(cap, is_file)
+                if last_detect is not None and now - last_detect < self.detect_interval:
+                    self.stats['throttled'] += 1
+                    continue
+                last_detect = now
+
+                self.stats['detections'] += 1
+                self.handle_frame(frame)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cap.release()
+            self._submitter.shutdown(wait=True)
+
+        print(f"📊 Kiosk stats: {self.stats} tracker: {self.tracker.stats()}")
+        return self.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless attendance kiosk.')
+    parser.add_argument('--source', default='0', help='camera index or video file path')
+    parser.add_argument('--api-url', default=KIOSK_API_URL)
+    parser.add_argument('--location', default=KIOSK_LOCATION)
+    parser.add_argument('--token', default=KIOSK_TOKEN, help="this kiosk's token from STREAM_KIOSK_TOKENS")
+    parser.add_argument('--fps', type=float, default=KIOSK_DETECT_FPS, help='max detections per second')
+    parser.add_argument('--motion-threshold', type=float, default=KIOSK_MOTION_THRESHOLD)
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='detect and quality-gate only, do not submit')
+    args = parser.parse_args(argv)
+
+    runner = KioskRunner(args.source, api_url=args.api_url, location=args.location, token=args.token,
+                         detect_fps=args.fps, motion_threshold=args.motion_threshold, dry_run=args.dry_run)
+    runner.run(max_frames=args.max_frames)
+
+
+if __name__ == '__main__':
+    main()
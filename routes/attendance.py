@@ -1,11 +1,14 @@
-from flask import Blueprint, render_template, request, flash, jsonify
+from flask import Blueprint, render_template, request, flash, jsonify, current_app
 from routes.auth import login_required
-from utils.face_recognition import recognize_faces
+from utils.face_recognition import recognize_faces, recognize_all_faces, verify_face, schedule_template_learning
 from utils.db_handler import (
     get_all_attendance, create_attendance,
-    get_attendance_by_faculty, get_faculty_by_id, get_all_faculty, get_attendance_by_date
+    get_attendance_by_faculty, get_faculty_by_id, get_all_faculty, get_attendance_by_date,
+    has_attendance_on, create_attendance_bulk, get_faculty_names
 )
 from utils.db_handler import get_attendance_by_date
+from utils.video_ingest import start_job, get_job, queue_full, VideoQueueFull
+from routes.stream import authorize_stream
 import uuid
 from datetime import datetime, date
 
@@ -30,6 +33,10 @@ def capture():
         existing_ids = {r['faculty_id'] for r in existing_today}
 
         try:
+            # Group photo: mark every recognized face in one transaction
+            if request.form.get('multi', '').lower() in ('1', 'true', 'on', 'yes'):
+                return capture_group(captured_image, existing_ids, current_date, current_time, location)
+
             recognized_faculty_ids = recognize_faces(captured_image)
             print("📸 Recognized faculty IDs:", recognized_faculty_ids)
 
@@ -79,6 +86,48 @@ def capture():
 
     return render_template('attendance/capture.html')
 
+
+def capture_group(captured_image, existing_ids, current_date, current_time, location):
+    """
+    Recognize all faces in a group photo and mark attendance for every matched faculty.
+    """
+    recognized = recognize_all_faces(captured_image)
+    print("📸 Recognized faculty in group photo:", [r['faculty_id'] for r in recognized])
+
+    if not recognized:
+        return jsonify({'success': False, 'message': 'No known faces recognized'}), 404
+
+    names = get_faculty_names(r['faculty_id'] for r in recognized)
+    new_records = [{
+        'faculty_id': r['faculty_id'],
+        'date': current_date,
+        'time': current_time,
+        'location': location,
+        'status': 'Present'
+    } for r in recognized if r['faculty_id'] in names and r['faculty_id'] not in existing_ids]
+
+    if new_records and not create_attendance_bulk(new_records):
+        return jsonify({'success': False, 'message': 'Failed to save attendance'}), 500
+
+    marked_ids = {r['faculty_id'] for r in new_records}
+    faces = [{
+        'faculty_id': r['faculty_id'],
+        'faculty_name': names.get(r['faculty_id']),
+        'similarity': round(r['similarity'], 4),
+        'box': r['box'],
+        'status': 'Marked' if r['faculty_id'] in marked_ids else 'Already marked'
+    } for r in recognized if r['faculty_id'] in names]
+
+    return jsonify({
+        'success': True,
+        'message': f"Attendance marked for {len(marked_ids)} faculty",
+        'data': {
+            'faces': faces,
+            'time': current_time,
+            'location': location
+        }
+    }), 200
+
 @attendance_bp.route('/mark', methods=['POST'])
 def mark():
     try:
@@ -89,31 +138,29 @@ def mark():
         if not image_file or not faculty_id:
             return jsonify({'success': False, 'message': 'Missing image or faculty ID'}), 400
 
-        # ✅ Step 1: Recognize face from image
-        recognized_ids = recognize_faces(image_file)
-
-        if not recognized_ids:
-            return jsonify({'success': False, 'message': 'No face recognized!'}), 400
-
-        # ✅ Step 2: Face must match the entered Faculty ID
-        if faculty_id not in recognized_ids:
-            return jsonify({'success': False, 'message': '❌ Face does not match the Faculty ID!'}), 400
-
-        # ✅ Step 3: Prevent double marking
+        # ✅ Step 1: Prevent double marking before any decode or inference
         current_date = date.today().strftime('%Y-%m-%d')
         current_time = datetime.now().strftime('%H:%M:%S')
-        existing_today = get_attendance_by_date(current_date)
-        existing_ids = {r['faculty_id'] for r in existing_today}
 
-        if faculty_id in existing_ids:
+        if has_attendance_on(faculty_id, current_date):
             return jsonify({'success': True, 'message': '⚠️ Attendance already marked today!'}), 200
 
-        # ✅ Step 4: Validate faculty ID exists in DB
+        # ✅ Step 2: Validate faculty ID exists in DB
         faculty = get_faculty_by_id(faculty_id)
         if not faculty:
             return jsonify({'success': False, 'message': 'Invalid Faculty ID'}), 404
 
-        # ✅ Step 5: Save attendance
+        # ✅ Step 3: Verify the face against the claimed Faculty ID only (1:1)
+        idempotency_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        matched, similarity, embedding = verify_face(image_file, faculty_id, idempotency_key, with_embedding=True)
+
+        if similarity is None:
+            return jsonify({'success': False, 'message': 'No face recognized!'}), 400
+
+        if not matched:
+            return jsonify({'success': False, 'message': '❌ Face does not match the Faculty ID!'}), 400
+
+        # ✅ Step 4: Save attendance
         attendance_data = {
             'faculty_id': faculty_id,
             'date': current_date,
@@ -123,6 +170,7 @@ def mark():
         }
 
         if create_attendance(attendance_data):
+            schedule_template_learning(faculty_id, embedding, similarity)
             return jsonify({
                 'success': True,
                 'message': f'✅ Attendance marked successfully for {faculty["name"]}.',
@@ -139,6 +187,54 @@ def mark():
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
 
+@attendance_bp.route('/kiosk', methods=['POST'])
+def kiosk_mark():
+    """
+    Submission from a headless kiosk (kiosk.py): one tracked, quality-gated face
+    crop. The kiosk runs no recognition itself; the face is identified here (1:N)
+    and marked. Kiosks authenticate like /attendance/stream, with
+    "Authorization: Bearer <token>", and must be listed in STREAM_IDENTIFY_KIOSKS.
+    """
+    try:
+        allowed, identify = authorize_stream(request.form)
+        if not allowed or not identify:
+            return jsonify({'success': False, 'message': 'Not authorized'}), 403
+
+        image_file = request.files.get('image')
+        location = request.form.get('location', 'Unknown')
+        if not image_file:
+            return jsonify({'success': False, 'message': 'Missing image'}), 400
+
+        recognized_ids = recognize_faces(image_file)
+        if not recognized_ids:
+            return jsonify({'success': False, 'message': 'No known face recognized'}), 404
+        faculty_id = recognized_ids[0]
+
+        faculty = get_faculty_by_id(faculty_id)
+        if not faculty:
+            return jsonify({'success': False, 'message': 'Invalid Faculty ID'}), 404
+
+        current_date = date.today().strftime('%Y-%m-%d')
+        current_time = datetime.now().strftime('%H:%M:%S')
+        data = {'faculty_id': faculty_id, 'faculty_name': faculty['name'], 'time': current_time, 'location': location}
+        if has_attendance_on(faculty_id, current_date):
+            return jsonify({'success': True, 'message': '⚠️ Attendance already marked today!', 'data': data}), 200
+
+        if not create_attendance({
+            'faculty_id': faculty_id,
+            'date': current_date,
+            'time': current_time,
+            'location': location,
+            'status': 'Present'
+        }):
+            return jsonify({'success': False, 'message': 'Failed to mark attendance.'}), 500
+        return jsonify({'success': True, 'message': f'✅ Attendance marked successfully for {faculty["name"]}.',
+                        'data': data}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+
 @attendance_bp.route('/logs')
 @login_required
 def logs():
@@ -199,6 +295,60 @@ def api_today_summary():
     })
 
 
+@attendance_bp.route('/video', methods=['POST'])
+@login_required
+def ingest_video():
+    """
+    Queue a recorded entrance video for background recognition.
+    Send it as the 'video' field of a multipart form, or as the raw request body
+    (Content-Type video/* or application/octet-stream, with location,
+    recorded_at and filename as query parameters), which is streamed straight
+    to disk. Uploads may be up to VIDEO_MAX_UPLOAD_BYTES instead of the app-wide
+    MAX_CONTENT_LENGTH. Optional recorded_at (ISO datetime) is when the
+    recording started.
+    """
+    # Checked before the body is read, so a full queue doesn't cost a multi-GB upload
+    if queue_full():
+        return jsonify({'success': False, 'message': 'Too many videos queued, try again later'}), 503
+    request.max_content_length = current_app.config['VIDEO_MAX_UPLOAD_BYTES']
+
+    raw_body = request.mimetype.startswith('video/') or request.mimetype == 'application/octet-stream'
+    if raw_body:
+        fields, video_file = request.args, request.stream
+        if request.content_length == 0:
+            return jsonify({'success': False, 'message': 'No video uploaded'}), 400
+    else:
+        fields, video_file = request.form, request.files.get('video')
+        if not video_file or not video_file.filename:
+            return jsonify({'success': False, 'message': 'No video uploaded'}), 400
+    location = fields.get('location', 'Unknown')
+
+    recorded_at = None
+    if fields.get('recorded_at'):
+        try:
+            recorded_at = datetime.fromisoformat(fields['recorded_at'])
+        except ValueError:
+            return jsonify({'success': False, 'message': 'recorded_at must be an ISO datetime'}), 400
+
+    try:
+        job = start_job(video_file, current_app.config['UPLOAD_FOLDER'], location=location, recorded_at=recorded_at,
+                        filename=request.args.get('filename') if raw_body else None)
+    except VideoQueueFull as e:
+        return jsonify({'success': False, 'message': f'Too many videos queued ({e}), try again later'}), 503
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'message': 'Video queued for processing', 'data': job.to_dict()}), 202
+
+
+@attendance_bp.route('/video/<job_id>')
+@login_required
+def video_job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify({'success': True, 'data': job.to_dict()})
+
+
 @attendance_bp.route('/liveattendance')
 def live_attendance():
     return render_template('liveattendance.html')
\ No newline at end of file
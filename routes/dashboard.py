@@ -1,9 +1,14 @@
 from flask import Blueprint, render_template, jsonify
 from routes.auth import login_required
-from utils.db_handler import (
-    get_all_faculty, get_all_attendance, get_attendance_by_date,
-    get_faculty_count, get_attendance_stats
-)
+from utils.db_handler import get_attendance_by_date, get_attendance_stats
+from utils.db_changes import cached_all_attendance, cached_faculty_directory, cached_faculty_count, change_stats
+from utils.inference_scheduler import scheduler_stats
+from utils.model_registry import model_status
+from utils.inference_backends import get_backend
+from utils.inference_server import server_status
+from utils.recognition_cache import recognition_cache
+from utils.face_quality import quality_stats
+from utils.gallery import get_gallery
 from datetime import date, datetime, timedelta
 from collections import defaultdict, Counter
 import calendar
@@ -18,20 +23,20 @@ def show_logs():
 @login_required
 def admin_dashboard():
     # Get basic stats
-    total_faculty = get_faculty_count()
+    total_faculty = cached_faculty_count()
     today = date.today().strftime('%Y-%m-%d')
     today_attendance = get_attendance_by_date(today)
     present_today = len(today_attendance)
     absent_today = total_faculty - present_today
     
     # Get recent attendance records
-    all_attendance = get_all_attendance()
-    recent_attendance = sorted(all_attendance, 
+    all_attendance = cached_all_attendance()
+    recent_attendance = [dict(r) for r in sorted(all_attendance, 
                               key=lambda x: f"{x['date']} {x['time']}", 
-                              reverse=True)[:10]
+                              reverse=True)[:10]]  # copies: the cached rows are shared
     
     # Enrich with faculty info
-    faculty_map = {f['faculty_id']: f for f in get_all_faculty()}
+    faculty_map = {f['faculty_id']: f for f in cached_faculty_directory()}
     for record in recent_attendance:
         faculty = faculty_map.get(record['faculty_id'])
         if faculty:
@@ -44,7 +49,7 @@ def admin_dashboard():
     
     # Get department-wise stats
     departments = defaultdict(int)
-    for faculty in get_all_faculty():
+    for faculty in cached_faculty_directory():
         departments[faculty['department']] += 1
     
     stats = {
@@ -67,8 +72,8 @@ def api_weekly_stats():
     end_date = date.today()
     start_date = end_date - timedelta(days=6)  # Last 7 days
     
-    all_attendance = get_all_attendance()
-    total_faculty = get_faculty_count()
+    all_attendance = cached_all_attendance()
+    total_faculty = cached_faculty_count()
     
     weekly_data = []
     current_date = start_date
@@ -95,8 +100,8 @@ def api_weekly_stats():
 def api_monthly_stats():
     """API endpoint for monthly attendance statistics"""
     current_month = date.today().replace(day=1)
-    all_attendance = get_all_attendance()
-    total_faculty = get_faculty_count()
+    all_attendance = cached_all_attendance()
+    total_faculty = cached_faculty_count()
     
     # Get this month's data
     month_attendance = [r for r in all_attendance 
@@ -132,8 +137,8 @@ def api_monthly_stats():
 @login_required
 def api_department_stats():
     """API endpoint for department-wise attendance statistics"""
-    all_faculty = get_all_faculty()
-    all_attendance = get_all_attendance()
+    all_faculty = cached_faculty_directory()
+    all_attendance = cached_all_attendance()
     today = date.today().strftime('%Y-%m-%d')
     
     # Get today's attendance
@@ -169,8 +174,8 @@ def api_department_stats():
 @login_required
 def api_attendance_trends():
     """API endpoint for attendance trends over time"""
-    all_attendance = get_all_attendance()
-    total_faculty = get_faculty_count()
+    all_attendance = cached_all_attendance()
+    total_faculty = cached_faculty_count()
     
     # Group attendance by date
     daily_attendance = defaultdict(int)
@@ -197,4 +202,42 @@ def api_attendance_trends():
         
         current_date += timedelta(days=1)
     
-    return jsonify(trend_data)
\ No newline at end of file
+    return jsonify(trend_data)
+
+@dashboard_bp.route('/api/inference-stats')
+@login_required
+def api_inference_stats():
+    """API endpoint for inference scheduler queue and batch statistics"""
+    return jsonify(scheduler_stats())
+
+@dashboard_bp.route('/api/inference-server')
+@login_required
+def api_inference_server():
+    """API endpoint for the shared inference server's health as seen from this worker"""
+    status = server_status()
+    return jsonify(status), (503 if status.get('enabled') and not status.get('reachable') else 200)
+
+@dashboard_bp.route('/api/model-status')
+@login_required
+def api_model_status():
+    """API endpoint for model load and warmup timings"""
+    return jsonify(dict(model_status(), backend=get_backend().status()))
+
+@dashboard_bp.route('/api/cache-stats')
+@login_required
+def api_cache_stats():
+    """API endpoint for recognition cache hit/miss counters and database change polling"""
+    return jsonify(dict(recognition_cache.stats(), db_changes=change_stats()))
+
+
+@dashboard_bp.route('/api/quality-stats')
+@login_required
+def api_quality_stats():
+    """API endpoint for face quality gate rejections and inference saved"""
+    return jsonify(quality_stats())
+
+@dashboard_bp.route('/api/gallery-stats')
+@login_required
+def api_gallery_stats():
+    """API endpoint for gallery size, quantization mode and memory footprint"""
+    return jsonify(get_gallery().memory_stats())
@@ -3,12 +3,13 @@ from werkzeug.security import generate_password_hash
 from routes.auth import login_required
 from utils.db_handler import (
     get_all_faculty, get_faculty_by_id, create_faculty, 
-    update_faculty, delete_faculty
+    update_faculty, delete_faculty, add_face_templates,
+    delete_face_templates, get_template_info
 )
-from face_utils import get_average_embedding_from_images, get_embedding_from_image, l2_normalize
+from utils.gallery import MAX_FACE_TEMPLATES
+from face_utils import get_template_embeddings_from_images, get_embedding_from_image, l2_normalize
 import uuid
 from datetime import datetime
-import os
 import numpy as np
 from PIL import Image
 
@@ -63,18 +64,12 @@ def register():
                 flash('No valid images uploaded.', 'error')
                 return render_template('faculty/register.html')
 
-            # ✅ Generate average embedding
-            mean_embedding = get_average_embedding_from_images(image_objs)
-            if mean_embedding is None:
+            # ✅ Generate one template per image plus their average as the primary embedding
+            templates = get_template_embeddings_from_images(image_objs)
+            if not templates:
                 flash('No face detected in uploaded images.', 'error')
                 return render_template('faculty/register.html')
-            mean_embedding = l2_normalize(mean_embedding)
-
-            # ✅ Optional .npy backup
-            embeddings_dir = os.path.join(os.path.dirname(current_app.config['DB_PATH']), 'faces')
-            os.makedirs(embeddings_dir, exist_ok=True)
-            embedding_path = os.path.join(embeddings_dir, f"{faculty_id}.npy")
-            np.save(embedding_path, mean_embedding)
+            mean_embedding = l2_normalize(np.mean(templates, axis=0))
 
             # ✅ Prepare DB payload
             faculty_data = {
@@ -88,8 +83,15 @@ def register():
                 'registered_on': datetime.now().isoformat()
             }
 
-            # ✅ Save to DB
+            # ✅ Save to DB (the packed gallery file is updated by the embedding listener)
             if create_faculty(faculty_data, db_path=current_app.config['DB_PATH']):
+                if len(templates) > 1:
+                    add_face_templates(
+                        faculty_id,
+                        [l2_normalize(t).astype(np.float32).tobytes() for t in templates],
+                        source='enroll', max_templates=MAX_FACE_TEMPLATES,
+                        db_path=current_app.config['DB_PATH']
+                    )
                 flash(f'Faculty {name} registered successfully with ID: {faculty_id}', 'success')
                 return redirect(url_for('faculty.register'))
             else:
@@ -158,7 +160,9 @@ def api_save_faculty():
         if embedding_bytes:
             updated_fields['face_embedding'] = embedding_bytes
 
-        success = update_faculty(faculty_id, updated_fields, db_path=current_app.config['DB_PATH'])
+        # A new face replaces the old one outright: templates enrolled or learned from it are dropped with it
+        success = update_faculty(faculty_id, updated_fields, replace_templates=bool(embedding_bytes),
+                                 db_path=current_app.config['DB_PATH'])
         message = "Faculty updated successfully." if success else "Failed to update faculty."
         return jsonify({'success': success, 'message': message})
 
@@ -186,4 +190,18 @@ def api_save_faculty():
 @login_required
 def api_delete_faculty(faculty_id):
     success = delete_faculty(faculty_id, db_path=current_app.config['DB_PATH'])
-    return jsonify({'success': success, 'message': 'Deleted.' if success else 'Deletion failed.'})
\ No newline at end of file
+    return jsonify({'success': success, 'message': 'Deleted.' if success else 'Deletion failed.'})
+
+@faculty_bp.route('/api/<faculty_id>/templates', methods=['GET'])
+@login_required
+def api_list_templates(faculty_id):
+    return jsonify(get_template_info(faculty_id, db_path=current_app.config['DB_PATH']))
+
+@faculty_bp.route('/api/<faculty_id>/templates', methods=['DELETE'])
+@faculty_bp.route('/api/<faculty_id>/templates/<int:template_id>', methods=['DELETE'])
+@login_required
+def api_delete_templates(faculty_id, template_id=None):
+    template_ids = None if template_id is None else [template_id]
+    deleted = delete_face_templates(faculty_id, template_ids, db_path=current_app.config['DB_PATH'])
+    return jsonify({'success': deleted > 0, 'deleted': deleted,
+                    'message': f'Deleted {deleted} template(s).' if deleted else 'No templates deleted.'})
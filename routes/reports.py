@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, send_file, flash, redirect, url_for
 from routes.auth import login_required
-from utils.db_handler import get_all_attendance, get_all_faculty, get_attendance_by_date
+from utils.db_handler import get_attendance_by_date
+from utils.db_changes import cached_all_attendance, cached_faculty_directory
 from datetime import datetime, date, timedelta
 import csv
 import json
@@ -67,8 +68,8 @@ def generate():
 
 def get_filtered_attendance_data(date_from, date_to, faculty_filter, department_filter):
     """Get attendance data based on filters"""
-    all_attendance = get_all_attendance()
-    all_faculty = get_all_faculty()
+    all_attendance = cached_all_attendance()
+    all_faculty = cached_faculty_directory()
     
     # Create faculty lookup
     faculty_map = {f['faculty_id']: f for f in all_faculty}
@@ -0,0 +1,239 @@
+import os
+import hmac
+import json
+import threading
+from datetime import datetime, date
+from flask import request, session as login_session
+from utils.db_handler import create_attendance, get_faculty_by_id, has_attendance_on
+from utils.image_decode import decode_image_bytes
+from utils.face_tracker import FaceTracker
+from face_utils import DETECT_ROI, scale_roi
+from utils.face_recognition import schedule_template_learning
+
+try:
+    from flask_sock import Sock, ConnectionClosed
+except ImportError:  # optional dependency: streaming endpoint is disabled without it
+    Sock = None
+    ConnectionClosed = Exception
+
+# Large stream frames are decoded at reduced scale, keeping the longest side at least this many pixels
+STREAM_MAX_SIDE = int(os.environ.get('STREAM_MAX_SIDE', 640))
+
+# Kiosk credentials for streams without an admin login: "name:token,name:token"
+STREAM_KIOSK_TOKENS = {
+    name.strip(): token.strip()
+    for name, token in (entry.split(':', 1) for entry in os.environ.get('STREAM_KIOSK_TOKENS', '').split(',') if ':' in entry)
+}
+
+# Kiosks (by name) allowed to identify faces without a claimed faculty_id (1:N)
+STREAM_IDENTIFY_KIOSKS = {name.strip() for name in os.environ.get('STREAM_IDENTIFY_KIOSKS', '').split(',') if name.strip()}
+
+# Close a stream after this many seconds without frames
+STREAM_IDLE_TIMEOUT = float(os.environ.get('STREAM_IDLE_TIMEOUT', 30))
+
+sock = Sock() if Sock else None
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox between the socket reader and the recognizer.
+    A new frame overwrites any frame not yet processed, so the recognizer
+    always works on the newest one and never builds a backlog.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, data):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = data
+            self.received += 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        with self._cond:
+            if self._frame is None and not self.closed:
+                self._cond.wait(timeout)
+            data, self._frame = self._frame, None
+            return data
+
+
+def _kiosk_for_token(token):
+    """
+    Name of the kiosk a token belongs to, or None.
+    """
+    if not token:
+        return None
+    for name, expected in STREAM_KIOSK_TOKENS.items():
+        if hmac.compare_digest(str(token).encode(), expected.encode()):
+            return name
+    return None
+
+
+def authorize_stream(message):
+    """
+    Who may stream: a logged-in admin (like /attendance/capture) or a kiosk
+    presenting its token as "Authorization: Bearer <token>" or as "token" in the
+    session message. Returns (allowed, may_identify); kiosks not listed in
+    STREAM_IDENTIFY_KIOSKS must claim a faculty_id (1:1).
+    """
+    if 'admin' in login_session:
+        return True, True
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else message.get('token')
+    kiosk = _kiosk_for_token(token)
+    if kiosk is None:
+        return False, False
+    return True, kiosk in STREAM_IDENTIFY_KIOSKS
+
+
+def _session_update(message):
+    # Only these keys come from the kiosk; authorization is never part of the session
+    return {key: message[key] for key in ('faculty_id', 'location') if key in message}
+
+
+def _read_frames(ws, slot, session):
+    """
+    Reader thread: binary messages are JPEG frames, text messages update the session.
+    """
+    try:
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            if isinstance(message, (bytes, bytearray)):
+                slot.put(bytes(message))
+                continue
+            update = json.loads(message)
+            if isinstance(update, dict):
+                session.update(_session_update(update))
+    except (ConnectionClosed, ValueError):
+        pass
+    finally:
+        slot.close()
+
+
+def process_frame(data, session, tracker, identify=False):
+    """
+    Recognize the largest face in one frame and mark attendance on a match.
+    FaceNet only runs for new tracks (or periodic refreshes); a person standing
+    still in front of the kiosk keeps the identity from their first frame.
+    Without identify, the frame is only verified against the claimed faculty_id.
+    Returns the event pushed back to the kiosk.
+    """
+    claimed_id = session.get('faculty_id')
+    if not claimed_id and not identify:
+        return {'type': 'error', 'message': 'faculty_id is required'}
+    current_date = date.today().strftime('%Y-%m-%d')
+    if claimed_id and has_attendance_on(claimed_id, current_date):
+        return {'type': 'already_marked', 'faculty_id': claimed_id}
+
+    frame, scale = decode_image_bytes(data, max_side=STREAM_MAX_SIDE, with_scale=True)
+    if frame is None:
+        return {'type': 'error', 'message': 'Invalid frame'}
+
+    # Stream frames come from fixed cameras; DETECT_ROI is in their full-resolution pixels
+    tracks = tracker.recognize(frame, claimed_id, roi=scale_roi(DETECT_ROI, scale))
+    if not tracks:
+        return {'type': 'no_face'}
+
+    if tracks[0].embedding is None and tracks[0].quality:
+        return {'type': 'low_quality', 'reason': tracks[0].quality}
+
+    matched_id, similarity = tracks[0].faculty_id, tracks[0].similarity
+    if not matched_id:
+        return {'type': 'no_match', 'similarity': round(similarity, 4)}
+
+    current_time = datetime.now().strftime('%H:%M:%S')
+    faculty = get_faculty_by_id(matched_id)
+    if not faculty:
+        return {'type': 'error', 'message': 'Invalid Faculty ID'}
+
+    event = {
+        'faculty_id': matched_id,
+        'faculty_name': faculty['name'],
+        'similarity': round(similarity, 4),
+        'time': current_time,
+        'location': session.get('location', 'Unknown')
+    }
+    if has_attendance_on(matched_id, current_date):
+        return dict(event, type='already_marked')
+
+    if not create_attendance({
+        'faculty_id': matched_id,
+        'date': current_date,
+        'time': current_time,
+        'location': event['location'],
+        'status': 'Present'
+    }):
+        return {'type': 'error', 'message': 'Failed to mark attendance.'}
+    schedule_template_learning(matched_id, tracks[0].embedding, similarity)
+    return dict(event, type='marked')
+
+
+def attendance_stream(ws):
+    """
+    WebSocket kiosk stream. The first text message is a JSON session
+    ({"faculty_id": ..., "location": ..., "token": ...}); see authorize_stream
+    for who may connect and when faculty_id is optional. After "ready" the kiosk
+    pushes JPEG frames as binary messages and receives recognition events as JSON.
+    """
+    try:
+        message = json.loads(ws.receive(timeout=STREAM_IDLE_TIMEOUT) or '{}')
+    except (ConnectionClosed, ValueError):
+        return
+    if not isinstance(message, dict):
+        ws.send(json.dumps({'type': 'error', 'message': 'Invalid session message'}))
+        return
+
+    allowed, identify = authorize_stream(message)
+    session = _session_update(message)
+    if not allowed:
+        ws.send(json.dumps({'type': 'error', 'message': 'Not authorized'}))
+        return
+    if not identify and not session.get('faculty_id'):
+        ws.send(json.dumps({'type': 'error', 'message': 'faculty_id is required'}))
+        return
+
+    slot = LatestFrame()
+    tracker = FaceTracker()
+    threading.Thread(target=_read_frames, args=(ws, slot, session), daemon=True).start()
+    ws.send(json.dumps({'type': 'ready'}))
+
+    while True:
+        data = slot.take(timeout=STREAM_IDLE_TIMEOUT)
+        if data is None:
+            break  # closed by the kiosk or idle
+
+        try:
+            event = process_frame(data, session, tracker, identify)
+        except Exception as e:
+            event = {'type': 'error', 'message': f'Error: {str(e)}'}
+        event.update(received=slot.received, dropped=slot.dropped)
+
+        try:
+            ws.send(json.dumps(event))
+        except ConnectionClosed:
+            break
+
+
+def init_stream(app):
+    """
+    Register the streaming endpoint when flask-sock is installed.
+    """
+    if sock is None:
+        print("⚠️ flask-sock not installed – /attendance/stream disabled.")
+        return
+    sock.init_app(app)
+    sock.route('/attendance/stream')(attendance_stream)
@@ -0,0 +1,446 @@
+import os
+import sys
+import time
+import select
+import signal
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Address the workers serve on
+SERVE_HOST = os.environ.get('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.environ.get('SERVE_PORT', 5000))
+
+# Forked worker processes, and request threads per worker
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 2))
+SERVE_THREADS = int(os.environ.get('SERVE_THREADS', 8))
+
+# WebSocket streams per worker; they run on threads of their own, so long-lived streams never take request threads
+SERVE_STREAM_THREADS = int(os.environ.get('SERVE_STREAM_THREADS', 4))
+
+# Seconds a stopping worker gets to finish in-flight requests before SIGKILL
+SERVE_GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+
+# Seconds a new worker may take to warm up before it is killed
+SERVE_WARMUP_TIMEOUT = float(os.environ.get('SERVE_WARMUP_TIMEOUT', 600))
+
+# Load model weights in the master so workers share them copy-on-write
+SERVE_PRELOAD_MODEL = os.environ.get('SERVE_PRELOAD_MODEL', '1').lower() in ('1', 'true', 'yes', 'on')
+
+LISTEN_BACKLOG = 2048
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # One request per connection: an idle keep-alive client would otherwise pin a pool thread
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Werkzeug server on an inherited listening socket with a fixed pool of request
+    threads. A worker only accepts a connection when a thread is free, so busy
+    workers leave new connections to idle ones.
+
+    A WebSocket upgrade hands its request slot back and runs on one of
+    stream_threads extra threads instead; past that, new streams get a 503.
+    """
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd, stream_threads=SERVE_STREAM_THREADS):
+        self._app = app
+        super().__init__(host, port, self._route, handler=_RequestHandler, fd=fd)
+        self._pool = ThreadPoolExecutor(max_workers=threads + stream_threads, thread_name_prefix='request')
+        self._slots = threading.Semaphore(threads)
+        self._streams = threading.Semaphore(stream_threads)
+        self._local = threading.local()
+        self._accepted = False
+
+    def _route(self, environ, start_response):
+        if environ.get('HTTP_UPGRADE', '').lower() != 'websocket':
+            return self._app(environ, start_response)
+        if not self._streams.acquire(blocking=False):
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Retry-After', '5')])
+            return [b'Too many open streams, retry shortly']
+        # The stream holds this thread until it closes: give the request slot back
+        self._local.slot_released = True
+        self._slots.release()
+        try:
+            return self._app(environ, start_response)
+        finally:
+            self._streams.release()
+
+    def _handle_request_noblock(self):
+        self._slots.acquire()
+        self._accepted = False
+        try:
+            super()._handle_request_noblock()  # another worker may win the accept
+        finally:
+            if not self._accepted:
+                self._slots.release()
+
+    def get_request(self):
+        request, client_address = self.socket.accept()
+        request.setblocking(True)  # the shared listening socket is non-blocking
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        self._accepted = True
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        self._local.slot_released = False
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if not self._local.slot_released:
+                self._slots.release()
+
+    def drain(self):
+        self._pool.shutdown(wait=True)
+
+
+def _notify_systemd(state):
+    """
+    sd_notify for Type=notify units; a no-op outside systemd.
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), address)
+    except OSError:
+        pass
+
+
+def preload(app, db_path):
+    """
+    Master-side, before forking: the app is already imported; map the gallery and
+    load the model weights so every worker shares those pages copy-on-write.
+    Nothing here runs a forward pass: TensorFlow graphs traced before fork()
+    hang in the children, so tracing and warmup happen per worker.
+    """
+    from utils.gallery import get_gallery
+    from utils.inference_backends import get_backend
+    from utils.inference_server import INFERENCE_SERVER
+
+    started = time.time()
+    gallery = get_gallery(db_path)
+    gallery.reload()
+    backend = get_backend()
+    if INFERENCE_SERVER:
+        print(f"🧵 Embeddings served by the inference server on {INFERENCE_SERVER}; not loading the model here")
+    elif SERVE_PRELOAD_MODEL and backend.preload_before_fork:
+        backend.load()
+    print(f"📦 Preloaded app, gallery ({len(gallery)} faculty) and model in {time.time() - started:.1f}s")
+
+
+def reload_master(app, db_path) -> bool:
+    """
+    SIGHUP, before the new generation forks: drop the loaded weights and preload
+    again, so it serves the weights and gallery now on disk. Environment and app
+    config are fixed at master start; changing those needs a restart. Returns
+    False (keep the old generation) when the new weights don't load.
+    """
+    from utils.inference_backends import reset_backends
+
+    reset_backends()
+    try:
+        preload(app, db_path)
+    except Exception as e:
+        print(f"❌ Reload failed, keeping the current workers: {e}")
+        return False
+    return True
+
+
+def warm_worker(app, db_path):
+    """
+    Worker-side, after fork and before it serves: trace and run the model once
+    and pick up any gallery generation published since the master mapped it.
+    """
+    from utils.gallery import get_gallery
+    from utils.inference_backends import get_backend
+    from utils.inference_server import INFERENCE_SERVER
+
+    get_gallery(db_path).refresh()
+    if not INFERENCE_SERVER:
+        get_backend().warmup()
+
+
+class _Worker:
+    def __init__(self, pid, generation, ready_fd, go_fd):
+        self.pid = pid
+        self.generation = generation
+        self.ready_fd = ready_fd
+        self.go_fd = go_fd
+        self.spawned = time.monotonic()
+        self.ready = False
+        self.serving = False
+        self.stopping_since = None
+
+
+class Arbiter:
+    """
+    Pre-forking master: binds the socket, preloads, forks workers and keeps their
+    count up. The socket only starts listening once the first generation of
+    workers has warmed up, so until then connections are refused (not ready).
+    SIGHUP reloads the weights and gallery in the master, then rolls in a new
+    generation of workers and retires the old one once the new one is warm;
+    SIGTERM/SIGINT stop gracefully.
+    """
+
+    def __init__(self, app, host=SERVE_HOST, port=SERVE_PORT, workers=SERVE_WORKERS, threads=SERVE_THREADS,
+                 stream_threads=SERVE_STREAM_THREADS, graceful_timeout=SERVE_GRACEFUL_TIMEOUT,
+                 warmup_timeout=SERVE_WARMUP_TIMEOUT, ready_file=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.stream_threads = max(0, stream_threads)
+        self.graceful_timeout = graceful_timeout
+        self.warmup_timeout = warmup_timeout
+        self.ready_file = ready_file
+        self.generation = 0
+        self.workers = {}
+        self.listening = False
+        self._stop = False
+        self._reload = False
+
+    # -- master ---------------------------------------------------------------
+
+    def _bind(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)  # workers race for accept(); losers must not block
+        return sock
+
+    def run(self):
+        self.socket = self._bind()
+        preload(self.app, self.app.config['DB_PATH'])
+
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, '_reload', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, '_stop', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, '_stop', True))
+
+        print(f"🚀 Master {os.getpid()}: {self.num_workers} worker(s) x {self.threads} thread(s) "
+              f"+ {self.stream_threads} stream(s) on {self.host}:{self.port}")
+        self._spawn_generation()
+        try:
+            while not self._stop:
+                if self._reload:
+                    self._reload = False
+                    print("🔄 SIGHUP: reloading weights and gallery, then starting a new generation of workers")
+                    _notify_systemd('RELOADING=1')
+                    if reload_master(self.app, self.app.config['DB_PATH']):
+                        self._spawn_generation()
+                    else:
+                        _notify_systemd('READY=1')
+                self._poll(timeout=0.5)
+                self._reap()
+                self._maintain()
+        finally:
+            self._shutdown()
+
+    def _spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.num_workers):
+            self._spawn()
+
+    def _spawn(self):
+        ready_r, ready_w = os.pipe()
+        go_r, go_w = os.pipe()
+        sys.stdout.flush()  # or the child repeats whatever the master had buffered
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(go_w)
+            for worker in self.workers.values():
+                os.close(worker.ready_fd)
+                os.close(worker.go_fd)
+            code = 1
+            try:
+                code = self._worker_main(ready_w, go_r)
+            except BaseException as e:
+                print(f"❌ Worker {os.getpid()} failed: {e}", file=sys.stderr)
+            finally:
+                os._exit(code)
+        os.close(ready_w)
+        os.close(go_r)
+        self.workers[pid] = _Worker(pid, self.generation, ready_r, go_w)
+
+    def _poll(self, timeout):
+        waiting = {w.ready_fd: w for w in self.workers.values() if not w.ready}
+        try:
+            readable, _, _ = select.select(list(waiting), [], [], timeout) if waiting else ([], [], [])
+        except InterruptedError:
+            return
+        if not waiting:
+            time.sleep(timeout)
+        for fd in readable:
+            worker = waiting[fd]
+            if os.read(fd, 1) == b'R':
+                worker.ready = True
+                print(f"✅ Worker {worker.pid} warmed up in {time.monotonic() - worker.spawned:.1f}s")
+
+    def _go(self, worker):
+        try:
+            os.write(worker.go_fd, b'G')
+            worker.serving = True
+        except OSError:
+            pass
+
+    def _maintain(self):
+        current = [w for w in self.workers.values() if w.generation == self.generation]
+
+        if not self.listening and current and all(w.ready for w in current):
+            self.socket.listen(LISTEN_BACKLOG)
+            self.listening = True
+            self._mark_ready()
+        if self.listening:
+            for worker in current:
+                if worker.ready and not worker.serving:
+                    self._go(worker)
+
+        # Retire older generations once the current one is fully serving
+        if len(current) >= self.num_workers and all(w.serving for w in current):
+            retired = [w for w in self.workers.values()
+                       if w.generation < self.generation and w.stopping_since is None]
+            for worker in retired:
+                self._stop_worker(worker)
+            if retired:
+                print(f"🔁 Generation {self.generation} serving; retiring {len(retired)} old worker(s)")
+                _notify_systemd('READY=1')
+
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if not worker.ready and now - worker.spawned > self.warmup_timeout:
+                print(f"⏱️ Worker {worker.pid} did not warm up in {self.warmup_timeout:.0f}s – killing it")
+                self._kill(worker)
+            elif worker.stopping_since is not None and now - worker.stopping_since > self.graceful_timeout:
+                self._kill(worker)
+
+        # Keep the current generation at full strength
+        for _ in range(self.num_workers - len(current)):
+            self._spawn()
+
+    def _mark_ready(self):
+        print(f"🟢 Ready: listening on {self.host}:{self.port}")
+        _notify_systemd('READY=1')
+        if self.ready_file:
+            with open(self.ready_file, 'w') as f:
+                f.write(str(os.getpid()))
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+            os.close(worker.go_fd)
+            if worker.stopping_since is None:
+                print(f"⚠️ Worker {pid} exited unexpectedly (status {status})")
+                if not self.listening and not worker.ready:
+                    raise SystemExit("❌ Worker failed to boot – not starting")
+
+    def _stop_worker(self, worker):
+        worker.stopping_since = time.monotonic()
+        self._signal(worker, signal.SIGTERM)
+
+    def _kill(self, worker):
+        if worker.stopping_since is None:
+            worker.stopping_since = time.monotonic()
+        self._signal(worker, signal.SIGKILL)
+
+    def _signal(self, worker, signum):
+        try:
+            os.kill(worker.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self):
+        print("👋 Stopping workers")
+        _notify_systemd('STOPPING=1')
+        for worker in self.workers.values():
+            if worker.stopping_since is None:
+                self._stop_worker(worker)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            self._kill(worker)
+        while self.workers:
+            self._reap()
+            time.sleep(0.05)
+        self.socket.close()
+        if self.ready_file and os.path.exists(self.ready_file):
+            os.remove(self.ready_file)
+
+    # -- worker ---------------------------------------------------------------
+
+    def _worker_main(self, ready_fd, go_fd) -> int:
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole group; the master decides
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+        warm_worker(self.app, self.app.config['DB_PATH'])
+        os.write(ready_fd, b'R')
+        while not stop.is_set():
+            readable, _, _ = select.select([go_fd], [], [], 0.5)
+            if readable:
+                if os.read(go_fd, 1) != b'G':
+                    return 0  # master went away before we started serving
+                break
+        if stop.is_set():
+            return 0
+
+        server = PooledWSGIServer(self.host, self.port, self.app, self.threads, fd=self.socket.fileno(),
+                                  stream_threads=self.stream_threads)
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+        server.serve_forever(poll_interval=0.5)
+        server.drain()  # finish in-flight requests
+        server.server_close()
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Production server: preloaded master with forked workers.')
+    parser.add_argument('--host', default=SERVE_HOST)
+    parser.add_argument('--port', type=int, default=SERVE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS)
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS, help='request threads per worker')
+    parser.add_argument('--stream-threads', type=int, default=SERVE_STREAM_THREADS, help='WebSocket streams per worker')
+    parser.add_argument('--graceful-timeout', type=float, default=SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument('--warmup-timeout', type=float, default=SERVE_WARMUP_TIMEOUT)
+    parser.add_argument('--ready-file', help='written once workers are warm, removed on exit')
+    args = parser.parse_args(argv)
+
+    # Warmup belongs to the workers: a forward pass in the master would not survive fork()
+    os.environ['FACENET_WARMUP'] = '0'
+    from app import app
+
+    Arbiter(app, host=args.host, port=args.port, workers=args.workers, threads=args.threads,
+            stream_threads=args.stream_threads, graceful_timeout=args.graceful_timeout,
+            warmup_timeout=args.warmup_timeout, ready_file=args.ready_file).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import threading
+import numpy as np
+from utils.ann_index import IVFIndex
+from conftest import unit_rows, noisy
+
+
+def test_ivf_recall_against_exact_search(db_path, rng):
+    centers = unit_rows(rng, 40)
+    matrix = noisy(np.repeat(centers, 50, axis=0), rng, 0.15)
+    ids = [f'F{i}' for i in range(len(matrix))]
+    index = IVFIndex(db_path, nprobe=8)
+    index.build(ids, matrix, nlist=32)
+
+    probes = noisy(matrix[::10], rng, 0.03)
+    exact = [ids[i] for i in np.argmax(probes @ matrix.T, axis=1)]
+    found = [(index.search(probe, threshold=0.0) or [(None, 0.0)])[0][0] for probe in probes]
+    recall = np.mean([a == b for a, b in zip(exact, found)])
+    assert recall >= 0.95
+
+
+def test_ivf_add_and_remove(db_path, rng):
+    matrix = unit_rows(rng, 50)
+    index = IVFIndex(db_path, nprobe=4)
+    index.build([f'F{i}' for i in range(50)], matrix, nlist=4)
+
+    new = unit_rows(rng, 1)
+    index.add('NEW', new)
+    assert index.search(new[0], threshold=0.9, nprobe=4)[0][0] == 'NEW'
+    index.remove('NEW')
+    assert all(faculty_id != 'NEW' for faculty_id, _ in index.search(new[0], threshold=0.0, nprobe=4))
+
+
+def test_search_during_concurrent_updates_sees_consistent_lists(db_path, rng):
+    matrix = unit_rows(rng, 200)
+    index = IVFIndex(db_path, nprobe=4)
+    index.build([f'F{i}' for i in range(200)], matrix, nlist=4)
+    churn = unit_rows(rng, 20)
+    errors = []
+
+    def writer():
+        for _ in range(20):
+            for i, vector in enumerate(churn):
+                index.add(f'C{i}', vector)
+            for i in range(len(churn)):
+                index.remove(f'C{i}')
+
+    def reader():
+        try:
+            for probe in matrix[:100]:
+                for faculty_id, score in index.search(probe, threshold=0.5):
+                    expected = churn[int(faculty_id[1:])] if faculty_id[0] == 'C' else matrix[int(faculty_id[1:])]
+                    assert abs(score - float(expected @ probe)) < 1e-4
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_concurrent_saves_leave_a_loadable_index_and_no_temp_files(db_path, tmp_path, rng):
+    matrix = unit_rows(rng, 50)
+    ids = [f'F{i}' for i in range(50)]
+    indexes = [IVFIndex(db_path, nprobe=4) for _ in range(4)]
+    for index in indexes:
+        index.build(ids, matrix, nlist=4)
+
+    errors = []
+
+    def save(index):
+        try:
+            index.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(index,)) for index in indexes for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    assert IVFIndex(db_path).load(ids, matrix)
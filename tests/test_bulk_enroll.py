@@ -0,0 +1,51 @@
+import json
+import numpy as np
+
+from utils import packed_gallery
+from utils.bulk_enroll import BulkEnroller, read_journal, _encode
+from utils.db_handler import create_faculty, get_all_faculty
+
+
+def _journal_entry(faculty_id, email, vector):
+    return {'faculty_id': faculty_id, 'name': faculty_id, 'email': email, 'images': ['x.jpg'],
+            'password_hash': 'hash', 'face_embedding': _encode(vector), 'templates': []}
+
+
+def _manifest(*rows):
+    return [{'faculty_id': faculty_id, 'name': faculty_id, 'email': email, 'images': ['x.jpg'], 'password': 'pw'}
+            for faculty_id, email in rows]
+
+
+def test_read_journal_ignores_torn_last_line(tmp_path):
+    path = tmp_path / 'enroll.jsonl'
+    path.write_text(json.dumps(_journal_entry('F1', 'a@x', np.ones(4))) + '\n{"faculty_id": "F2", "na')
+    assert list(read_journal(str(path))) == ['F1']
+
+
+def test_pending_treats_journaled_emails_as_taken(tmp_path, db_path):
+    create_faculty({'faculty_id': 'OLD', 'name': 'Old', 'email': 'old@x', 'password_hash': 'hash',
+                    'face_embedding': np.ones(4, dtype=np.float32).tobytes(), 'registered_on': '2024-01-01'},
+                   db_path=db_path)
+    journaled = {'J1': _journal_entry('J1', 'j1@x', np.ones(4)),
+                 'OLD': _journal_entry('OLD', 'old@x', np.ones(4))}
+    entries = _manifest(('OLD', 'old@x'), ('J1', 'j1@x'), ('DUP', 'j1@x'), ('NEW', 'new@x'))
+
+    pending, skipped = BulkEnroller(str(tmp_path / 'j.jsonl'), db_path)._pending(entries, journaled)
+
+    assert [e['faculty_id'] for e in pending] == ['NEW']
+    assert skipped == 2
+    # OLD was committed before the crash, so only J1 is still waiting to be written
+    assert list(journaled) == ['J1']
+
+
+def test_resume_writes_journal_and_skips_duplicate_email(tmp_path, db_path, monkeypatch, rng):
+    monkeypatch.setattr(packed_gallery, 'PACKED_GALLERY', False)
+    journal = tmp_path / 'enroll.jsonl'
+    journal.write_text(json.dumps(_journal_entry('J1', 'j1@x', rng.standard_normal(4))) + '\n')
+
+    report = BulkEnroller(str(journal), db_path, workers=1).run(_manifest(('J1', 'j1@x'), ('DUP', 'j1@x')))
+
+    assert report['enrolled'] == 1
+    assert report['skipped'] == 1
+    assert [f['faculty_id'] for f in get_all_faculty(db_path=db_path)] == ['J1']
+    assert not journal.exists()
@@ -0,0 +1,85 @@
+import sqlite3
+import numpy as np
+import pytest
+from utils import db_changes, db_handler
+from utils.db_changes import ChangeWatcher, cached_query, get_watcher
+from utils.db_handler import create_faculty
+
+
+@pytest.fixture
+def received(monkeypatch):
+    monkeypatch.setattr(db_changes, '_subscribers', [])
+    calls = {'all': [], 'remote': []}
+    db_changes.subscribe('faculty', lambda topic, keys, db: calls['all'].append(keys))
+    db_changes.subscribe('faculty', lambda topic, keys, db: calls['remote'].append(keys), skip_local=True)
+    return calls
+
+
+def _add_faculty(db_path, faculty_id):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO faculty (faculty_id, name) VALUES (?, ?)", (faculty_id, faculty_id))
+
+
+def test_watcher_sees_commits_from_another_connection(db_path, received):
+    watcher = ChangeWatcher(db_path)
+    assert watcher.poll(force=True) == 0  # baseline
+    assert watcher.poll(force=True) == 0
+
+    _add_faculty(db_path, 'F1')
+    _add_faculty(db_path, 'F2')
+    assert watcher.poll(force=True) == 2
+    assert received['all'] == [{'F1', 'F2'}]
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO attendance (faculty_id, date) VALUES ('F1', '2024-01-01')")
+    assert watcher.poll(force=True) == 1
+    assert len(received['all']) == 1  # attendance isn't a faculty change
+
+
+def _create(db_path, faculty_id):
+    create_faculty({'faculty_id': faculty_id, 'name': faculty_id, 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': np.ones(4, dtype=np.float32).tobytes()}, db_path=db_path)
+
+
+def test_locally_applied_changes_are_skipped(db_path, received):
+    watcher = get_watcher(db_path)
+
+    _create(db_path, 'LOCAL')
+    watcher.poll(force=True)
+    assert received['all'] == [{'LOCAL'}] and received['remote'] == []
+
+    _add_faculty(db_path, 'REMOTE')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE faculty SET name = 'x' WHERE faculty_id = 'LOCAL'")
+    watcher.poll(force=True)
+    assert received['remote'] == [{'REMOTE', 'LOCAL'}]
+
+
+def test_a_remote_change_racing_a_local_write_is_not_skipped(db_path, received, monkeypatch):
+    watcher = get_watcher(db_path)
+
+    def remote_write(action, faculty_id, embedding, db, change_id=None):
+        # Another process changes the same faculty after the local commit, before it is marked applied
+        with sqlite3.connect(db) as conn:
+            conn.execute("UPDATE faculty SET name = 'remote' WHERE faculty_id = ?", (faculty_id,))
+
+    monkeypatch.setattr(db_handler, '_embedding_listeners', [remote_write] + db_handler._embedding_listeners)
+    _create(db_path, 'A')
+    watcher.poll(force=True)
+    assert received['remote'] == [{'A'}]
+
+
+def test_cached_query_drops_results_invalidated_while_running(db_path, monkeypatch):
+    monkeypatch.setattr(db_changes, '_subscribers', [])
+    calls = []
+
+    def reader(db_path='attendance.db'):
+        calls.append(db_path)
+        if len(calls) == 1:
+            cached.invalidate()  # a change lands while the first read runs
+        return len(calls)
+
+    cached = cached_query('faculty')(reader)
+    assert cached(db_path=db_path) == 1
+    assert cached(db_path=db_path) == 2
+    assert cached(db_path=db_path) == 2
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from utils import face_quality
+from utils.face_quality import BLURRY, TOO_DARK, TOO_SMALL, check_faces
+
+
+@pytest.fixture(autouse=True)
+def quality_gate_on(monkeypatch):
+    monkeypatch.setattr(face_quality, 'QUALITY_GATE', True)
+
+
+def _textured(rng, side, low=40, high=220):
+    return rng.integers(low, high, size=(side, side, 3), dtype=np.uint8)
+
+
+def test_check_faces_reasons(rng):
+    side = face_quality.QUALITY_MIN_FACE * 2
+    crops = [
+        _textured(rng, side),
+        _textured(rng, face_quality.QUALITY_MIN_FACE // 2),
+        np.full((side, side, 3), 128, dtype=np.uint8),
+        _textured(rng, side, low=0, high=30),
+    ]
+    assert check_faces(crops) == [None, TOO_SMALL, BLURRY, TOO_DARK]
+    assert check_faces([]) == []
+
+
+def test_gate_off_passes_everything(monkeypatch):
+    monkeypatch.setattr(face_quality, 'QUALITY_GATE', False)
+    assert check_faces([np.zeros((4, 4, 3), dtype=np.uint8)]) == [None]
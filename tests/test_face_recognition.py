@@ -0,0 +1,77 @@
+import io
+import numpy as np
+import pytest
+from werkzeug.datastructures import FileStorage
+from utils import face_recognition
+from utils.db_handler import create_faculty, initialize_data_files, update_faculty
+from utils.face_recognition import verify_face
+from utils.recognition_cache import recognition_cache
+from conftest import unit_rows
+
+
+@pytest.fixture
+def probe(tmp_path, monkeypatch):
+    """
+    Every upload embeds to probe['embedding']; probe['calls'] counts the uploads actually embedded.
+    """
+    # verify_face reads the default database in the working directory
+    monkeypatch.chdir(tmp_path)
+    initialize_data_files('attendance.db')
+    recognition_cache.clear()
+    state = {'embedding': None, 'calls': 0}
+
+    def fake_embedding(image_file):
+        state['calls'] += 1
+        return state['embedding']
+
+    monkeypatch.setattr(face_recognition, 'get_embedding_from_image', fake_embedding)
+    yield state
+    recognition_cache.clear()
+
+
+def _upload(data=b'jpeg bytes'):
+    return FileStorage(stream=io.BytesIO(data), filename='capture.jpg')
+
+
+def _enroll(faculty_id, embedding):
+    create_faculty({'faculty_id': faculty_id, 'name': faculty_id, 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': embedding.tobytes()})
+
+
+def test_verify_matches_only_the_claimed_faculty(probe, rng):
+    rows = unit_rows(rng, 2)
+    _enroll('A', rows[0])
+    _enroll('B', rows[1])
+    probe['embedding'] = rows[0] * 3  # unnormalized, as FaceNet returns it
+
+    matched, similarity, embedding = verify_face(_upload(), 'A', with_embedding=True)
+    assert matched and similarity == pytest.approx(1.0, abs=1e-5)
+    assert np.allclose(embedding, rows[0], atol=1e-6)
+
+    matched, similarity = verify_face(_upload(b'other bytes'), 'B')
+    assert not matched and similarity < face_recognition.THRESHOLD
+
+
+def test_verify_without_a_face_or_enrollment(probe, rng):
+    _enroll('A', unit_rows(rng, 1)[0])
+
+    assert verify_face(_upload(), 'A') == (False, None)
+    assert verify_face(_upload(), 'NOBODY') == (False, 0.0)
+    assert verify_face(FileStorage(stream=io.BytesIO(b''), filename=''), 'A') == (False, None)
+
+
+def test_verify_reuses_cached_results_until_the_faculty_changes(probe, rng):
+    rows = unit_rows(rng, 2)
+    _enroll('A', rows[0])
+    probe['embedding'] = rows[0]
+
+    assert verify_face(_upload(), 'A')[0]
+    assert verify_face(_upload(), 'A')[0]
+    assert probe['calls'] == 1
+
+    # A new face drops the cached verdict but keeps the cached upload embedding
+    update_faculty('A', {'face_embedding': rows[1].tobytes()}, replace_templates=True)
+    matched, similarity, embedding = verify_face(_upload(), 'A', with_embedding=True)
+    assert not matched and similarity < face_recognition.THRESHOLD
+    assert embedding is not None
+    assert probe['calls'] == 1
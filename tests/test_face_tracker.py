@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from utils.face_tracker import FaceTracker, iou_matrix
+
+
+def test_iou_matrix():
+    overlaps = iou_matrix([(0, 0, 10, 10)], [(0, 0, 10, 10), (5, 0, 10, 10), (50, 50, 10, 10)])
+    assert overlaps[0] == pytest.approx([1.0, 50 / 150, 0.0])
+    assert iou_matrix([], [(0, 0, 1, 1)]).shape == (0, 1)
+
+
+def test_tracker_follows_moving_boxes_and_drops_lost_tracks():
+    tracker = FaceTracker(iou_threshold=0.3, max_missed=1)
+    first = tracker.update([(0, 0, 100, 100), (300, 0, 50, 50)])
+    moved = tracker.update([(10, 5, 100, 100), (305, 0, 50, 50)])
+    assert [t.track_id for t in moved] == [t.track_id for t in first]  # largest first, same tracks
+
+    fresh = tracker.update([(600, 0, 80, 80)])
+    assert fresh[0].track_id not in {t.track_id for t in first}
+    tracker.update([(600, 0, 80, 80)])
+    assert [t.box for t in tracker.tracks] == [(600, 0, 80, 80)]
+
+
+def test_tracker_embeds_new_tracks_and_refreshes_on_schedule():
+    tracker = FaceTracker(refresh_frames=3, retry_frames=1)
+    track = tracker.update([(0, 0, 100, 100)])[0]
+    assert tracker.needs_embedding(track)
+    tracker.set_identity(track, np.zeros(4), 'A', 0.9)
+    track.last_embedded = tracker.frame_index
+    tracker.update([(0, 0, 100, 100)])
+    assert not tracker.needs_embedding(track)
+    tracker.update([(0, 0, 100, 100)])
+    tracker.update([(0, 0, 100, 100)])
+    assert tracker.needs_embedding(track)
@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+import pytest
+import face_utils
+from face_utils import detect_faces, scale_roi
+from utils.image_decode import decode_image_bytes
+
+
+class FakeCascade:
+    """Reports one fixed box (in the coordinates of the image it is given) and records that image's size."""
+
+    def __init__(self, box):
+        self.box = box
+        self.shapes = []
+
+    def detectMultiScale(self, gray, **kwargs):
+        self.shapes.append(gray.shape)
+        return [self.box]
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    cascade = FakeCascade((10, 20, 30, 30))
+    monkeypatch.setattr(face_utils, 'face_cascade', cascade)
+    return cascade
+
+
+def test_detect_faces_searches_the_whole_frame_by_default(cascade, monkeypatch):
+    monkeypatch.setattr(face_utils, 'DETECT_ROI', (0, 0, 5, 5))
+    frame = np.zeros((200, 300, 3), dtype=np.uint8)
+    assert detect_faces(frame, max_side=0) == [(10, 20, 30, 30)]
+    assert cascade.shapes == [(200, 300)]
+
+
+def test_roi_is_clipped_to_the_frame_and_offsets_the_boxes(cascade):
+    frame = np.zeros((200, 300, 3), dtype=np.uint8)
+    assert detect_faces(frame, max_side=0, roi=(-50, 100, 200, 500)) == [(10, 120, 30, 30)]
+    assert cascade.shapes == [(100, 150)]
+
+
+def test_roi_outside_the_frame_finds_nothing(cascade):
+    frame = np.zeros((200, 300, 3), dtype=np.uint8)
+    assert detect_faces(frame, roi=(400, 0, 100, 100)) == []
+    assert detect_faces(frame, roi=(0, 0, 0, 100)) == []
+    assert cascade.shapes == []
+
+
+def test_roi_follows_a_reduced_scale_decode():
+    image = np.random.default_rng(0).integers(0, 255, size=(1600, 2400, 3), dtype=np.uint8)
+    data = cv2.imencode('.jpg', image)[1].tobytes()
+    frame, scale = decode_image_bytes(data, max_side=600, with_scale=True)
+    assert frame.shape[:2] == (400, 600) and scale == 0.25
+    assert scale_roi((400, 200, 800, 1200), scale) == (100, 50, 200, 300)
+    assert decode_image_bytes(b'not an image', with_scale=True) == (None, 1.0)
+
+
+class SmallestFaceCascade:
+    """Reports a single face of exactly the minimum size the detector was asked for."""
+
+    def detectMultiScale(self, gray, minSize, **kwargs):
+        return [(0, 0, minSize[0], minSize[1])]
+
+
+@pytest.mark.parametrize('side', [641, 700, 999, 1280, 1919, 3000])
+def test_smallest_detected_face_passes_the_quality_size_check(side, monkeypatch):
+    from utils.face_quality import QUALITY_MIN_FACE, TOO_SMALL, check_faces
+    monkeypatch.setattr(face_utils, 'face_cascade', SmallestFaceCascade())
+    frame = np.random.default_rng(0).integers(40, 220, size=(side, side, 3), dtype=np.uint8)
+
+    x, y, w, h = detect_faces(frame, max_side=640, min_face=QUALITY_MIN_FACE)[0]
+    assert min(w, h) >= QUALITY_MIN_FACE
+    assert check_faces([frame[y:y+h, x:x+w]]) != [TOO_SMALL]
+
+
+def test_enrollment_images_are_embedded_in_one_batch(monkeypatch):
+    faces = {1: np.full((40, 40, 3), 1, np.uint8), 2: np.full((40, 40, 3), 2, np.uint8),
+             3: np.full((40, 40, 3), 3, np.uint8)}
+    monkeypatch.setattr(face_utils, 'get_face_from_frame', lambda image: faces.get(int(image[0, 0, 0])))
+    monkeypatch.setattr(face_utils, 'check_face', lambda face: 'blurry' if face[0, 0, 0] == 3 else None)
+    monkeypatch.setattr(face_utils, 'preprocess_face', lambda face: face[:1, :1].astype(np.float32)[np.newaxis])
+    batches = []
+    monkeypatch.setattr(face_utils, 'embed_faces', lambda batch: batches.append(len(batch)) or batch.reshape(len(batch), -1))
+    images = [np.full((10, 10, 3), value, np.uint8) for value in (1, 0, 2, 3)]
+
+    embeddings, failures = face_utils.get_embeddings_from_images(images)
+
+    assert batches == [2]
+    assert [None if e is None else e[0] for e in embeddings] == [1.0, None, 2.0, None]
+    assert failures == {1: 'no face detected', 3: 'low quality face (blurry)'}
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import utils.gallery as gallery_module
+from utils.gallery import FaceGallery, claim_matches
+from conftest import unit_rows
+
+
+@pytest.fixture
+def gallery(db_path, monkeypatch):
+    monkeypatch.setattr(gallery_module, 'PACKED_GALLERY', False)
+    gallery = FaceGallery(db_path, quantization='none')
+    gallery.reload()
+    return gallery
+
+
+def test_match_takes_the_best_template_of_each_faculty(gallery, rng):
+    a, b = unit_rows(rng, 3), unit_rows(rng, 2)
+    gallery.upsert('A', a)
+    gallery.upsert('B', b)
+
+    matches = gallery.match(a[2], threshold=0.5)
+    assert matches[0][0] == 'A'
+    assert matches[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert gallery.best_match(b[1])[0] == 'B'
+    assert gallery.score('A', a[1]) == pytest.approx(1.0, abs=1e-5)
+    assert len(gallery) == 2 and gallery.template_count() == 5
+
+
+def test_upsert_replaces_and_remove_drops(gallery, rng):
+    old, new = unit_rows(rng, 2), unit_rows(rng, 1)
+    gallery.upsert('A', old)
+    gallery.upsert('A', new)
+    assert gallery.get('A').shape == (1, new.shape[1])
+    assert gallery.match(old[0], threshold=0.9) == []
+
+    gallery.remove('A')
+    assert gallery.get('A') is None and len(gallery) == 0
+
+
+def test_match_batch_gives_each_faculty_to_its_closest_probe(gallery, rng):
+    a, b = unit_rows(rng, 1), unit_rows(rng, 1)
+    gallery.upsert('A', a)
+    gallery.upsert('B', b)
+    # Both probes are closest to A; the weaker one falls through to B
+    strong = a[0]
+    weak = a[0] + 0.9 * b[0]
+    weak /= np.linalg.norm(weak)
+
+    assert [m[0] for m in gallery.match_batch(np.vstack([weak, strong]), threshold=0.5)] == ['B', 'A']
+
+
+def test_claim_matches_is_score_ordered():
+    candidates = [(0, 'A', 0.7), (1, 'A', 0.9), (0, 'B', 0.6), (1, 'B', 0.8)]
+    assert claim_matches(candidates, 3) == [('B', 0.6), ('A', 0.9), None]
@@ -0,0 +1,48 @@
+import io
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from utils.image_decode import decode_image_bytes, decode_upload, reduction_factor
+
+
+def _encode(width, height, fmt='.jpg'):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :width // 2] = (255, 0, 0)  # left half blue in BGR
+    ok, data = cv2.imencode(fmt, image)
+    assert ok
+    return data.tobytes()
+
+
+@pytest.mark.parametrize('width, height, max_side, factor', [
+    (640, 480, 1280, 1),
+    (2560, 1920, 1280, 2),
+    (4000, 3000, 640, 4),
+    (12000, 9000, 640, 8),
+    (4000, 3000, 0, 1),
+])
+def test_reduction_factor_keeps_the_longest_side_above_max_side(width, height, max_side, factor):
+    assert reduction_factor(width, height, max_side) == factor
+
+
+def test_large_jpegs_decode_at_reduced_scale_as_contiguous_bgr():
+    image, scale = decode_image_bytes(_encode(2560, 1920), max_side=1280, with_scale=True)
+
+    assert image.shape == (960, 1280, 3) and scale == 0.5
+    assert image.flags['C_CONTIGUOUS']
+    assert image[480, 100, 0] > 200 and image[480, 100, 2] < 50
+
+
+def test_grayscale_and_gif_uploads():
+    assert decode_image_bytes(_encode(800, 600), grayscale=True).shape == (600, 800)
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (255, 0, 0)).save(buffer, format='GIF')
+    image = decode_upload(io.BytesIO(buffer.getvalue()))
+    assert image.shape == (48, 64, 3) and image[0, 0, 2] > 200
+
+
+def test_undecodable_bytes_return_none():
+    assert decode_image_bytes(b'') is None
+    assert decode_image_bytes(b'not an image') is None
+    assert decode_image_bytes(b'not an image', with_scale=True) == (None, 1.0)
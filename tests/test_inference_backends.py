@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from utils.inference_backends import StubBackend, get_backend
+from utils.model_registry import FACENET_INPUT_SHAPE
+
+
+def _faces(rng, n):
+    return rng.standard_normal((n,) + FACENET_INPUT_SHAPE).astype(np.float32)
+
+
+def test_stub_embeds_each_face_the_same_in_any_batch(rng):
+    backend = StubBackend(dim=32)
+    faces = _faces(rng, 5)
+
+    batch = backend.embed(faces)
+    assert batch.shape == (5, 32) and batch.dtype == np.float32
+    assert np.array_equal(backend.embed(faces[2]), batch[2:3])
+    assert np.array_equal(StubBackend(dim=32).embed(faces), batch)
+
+
+def test_stub_version_tracks_seed_and_dim():
+    assert StubBackend().dim == 512
+    assert StubBackend(dim=32, seed=1).version == 'stub-1-32'
+    assert StubBackend(seed=1).version != StubBackend(seed=2).version
+
+
+def test_get_backend_is_shared_and_rejects_unknown_names():
+    assert get_backend('stub') is get_backend('STUB')
+    with pytest.raises(ValueError, match='Unknown embedding backend'):
+        get_backend('caffe')
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from utils.inference_engine import InferenceEngine, facenet_normalizer
+
+tf = pytest.importorskip('tensorflow')
+
+
+@pytest.fixture(scope='module')
+def model():
+    inputs = tf.keras.Input((8, 8, 3))
+    outputs = tf.keras.layers.Dense(4)(tf.keras.layers.Flatten()(inputs))
+    return tf.keras.Model(inputs, outputs)
+
+
+@pytest.mark.parametrize('n', [1, 3, 5, 9])
+def test_padded_buckets_match_plain_predict(model, rng, n):
+    engine = InferenceEngine(model, input_shape=(8, 8, 3), buckets=(1, 4))
+    faces = rng.standard_normal((n, 8, 8, 3)).astype(np.float32)
+
+    assert np.allclose(engine.embed(faces), model.predict(faces, verbose=0), atol=1e-5)
+    stats = engine.stats()
+    assert stats['faces'] == n
+    assert sum(b * calls for b, calls in stats['bucket_calls'].items()) == n + stats['padded_faces']
+
+
+def test_single_face_and_normalization(model, rng):
+    engine = InferenceEngine(model, input_shape=(8, 8, 3), buckets=(1, 4), normalize=facenet_normalizer(True))
+    face = rng.uniform(0, 255, (8, 8, 3)).astype(np.float32)
+
+    expected = model.predict(((face - 127.5) / 127.5)[np.newaxis], verbose=0)
+    assert np.allclose(engine.embed(face), expected, atol=1e-5)
+
+
+def test_per_image_standardization():
+    faces = np.stack([np.full((2, 2, 3), 7.0), np.arange(12.0).reshape(2, 2, 3)]).astype(np.float32)
+    out = np.empty_like(faces)
+
+    facenet_normalizer(False)(faces, out)
+    assert np.allclose(out[0], 0.0)  # a flat image has no spread to scale by
+    assert np.allclose(out[1].mean(), 0.0, atol=1e-6) and np.allclose(out[1].std(), 1.0, atol=1e-5)
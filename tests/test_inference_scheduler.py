@@ -0,0 +1,98 @@
+import threading
+import numpy as np
+import pytest
+from utils.inference_scheduler import InferenceScheduler
+
+
+class RecordingModel:
+    """
+    Embeds each face to its first pixel and records the size of every batch.
+    The first batch blocks until release() so later submits pile up in the queue.
+    """
+
+    def __init__(self, hold_first=False):
+        self.batches = []
+        self.started = threading.Event()
+        self._gate = threading.Event()
+        if not hold_first:
+            self._gate.set()
+
+    def __call__(self, faces):
+        self.batches.append(len(faces))
+        self.started.set()
+        self._gate.wait(timeout=5)
+        return faces.reshape(len(faces), -1)[:, :1] * 2
+
+    def release(self):
+        self._gate.set()
+
+
+def _faces(value, n=1):
+    return np.full((n, 2, 2, 3), value, dtype=np.float32)
+
+
+@pytest.fixture
+def scheduler_for():
+    schedulers = []
+
+    def make(model, **kwargs):
+        schedulers.append(InferenceScheduler(model, **kwargs))
+        return schedulers[-1]
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+
+def test_concurrent_submits_share_one_batch_and_get_their_own_rows(scheduler_for):
+    model = RecordingModel(hold_first=True)
+    scheduler = scheduler_for(model, max_batch_size=8, max_wait_ms=50)
+
+    first = scheduler.submit(_faces(0))
+    assert model.started.wait(timeout=5)
+    futures = [scheduler.submit(_faces(i, n=2)) for i in range(1, 4)]
+    model.release()
+
+    assert first.result(timeout=5).tolist() == [[0.0]]
+    for i, future in enumerate(futures, start=1):
+        assert future.result(timeout=5).tolist() == [[2.0 * i], [2.0 * i]]
+    assert model.batches == [1, 6]
+    assert scheduler.stats()['requests'] == 4
+
+
+def test_no_batch_exceeds_max_batch_size(scheduler_for):
+    model = RecordingModel(hold_first=True)
+    scheduler = scheduler_for(model, max_batch_size=4, max_wait_ms=50)
+
+    futures = [scheduler.submit(_faces(0))]
+    assert model.started.wait(timeout=5)
+    futures += [scheduler.submit(_faces(i, n=3)) for i in range(1, 4)]
+    model.release()
+
+    for future in futures:
+        future.result(timeout=5)
+    assert model.batches == [1, 3, 3, 3]
+    assert scheduler.stats()['max_batch_size_seen'] == 3
+
+
+def test_large_submits_are_chunked_and_reassembled_in_order(scheduler_for):
+    model = RecordingModel()
+    scheduler = scheduler_for(model, max_batch_size=4, max_wait_ms=0)
+    faces = np.concatenate([_faces(i) for i in range(10)])
+
+    embeddings = scheduler.embed(faces)
+
+    assert embeddings[:, 0].tolist() == [2.0 * i for i in range(10)]
+    assert max(model.batches) <= 4 and sum(model.batches) == 10
+
+
+def test_model_errors_reach_every_caller_in_the_batch(scheduler_for):
+    def broken(faces):
+        raise RuntimeError('out of memory')
+
+    scheduler = scheduler_for(broken, max_batch_size=2, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError, match='out of memory'):
+        scheduler.embed(_faces(1))
+    with pytest.raises(RuntimeError, match='out of memory'):
+        scheduler.embed(_faces(1, n=5))
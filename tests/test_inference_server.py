@@ -0,0 +1,74 @@
+import threading
+import numpy as np
+import pytest
+from utils import inference_backends, inference_scheduler, inference_server
+from utils.inference_server import InferenceClient, InferenceServer, InferenceServerUnavailable, embed_via_server
+from utils.model_registry import FACENET_INPUT_SHAPE
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # The server embeds with the process-wide backend and scheduler: use the stub and a fresh scheduler
+    monkeypatch.setattr(inference_backends, 'FACE_BACKEND', 'stub')
+    monkeypatch.setattr(inference_scheduler, '_scheduler', None)
+    server = InferenceServer(str(tmp_path / 'inference.sock'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.scheduler.close()
+
+
+@pytest.fixture
+def client_state(monkeypatch):
+    # embed_via_server keeps one client and the server's down/fallback state per process
+    monkeypatch.setattr(inference_server, '_client', None)
+    monkeypatch.setattr(inference_server, '_down_until', 0.0)
+    monkeypatch.setattr(inference_server, '_fallbacks', 0)
+    monkeypatch.setattr(inference_server, 'INFERENCE_SERVER_FALLBACK', True)
+
+
+def _faces(rng, n):
+    return rng.standard_normal((n,) + FACENET_INPUT_SHAPE).astype(np.float32)
+
+
+def test_embeddings_round_trip_through_the_server(server, rng):
+    faces = _faces(rng, 3)
+    client = InferenceClient(server.server_address, timeout=5)
+    try:
+        assert np.array_equal(client.embed(faces), server.backend.embed(faces))
+        health = client.health()
+    finally:
+        client.close()
+
+    assert health['status'] == 'ok'
+    assert health['model']['backend'] == 'stub'
+    assert health['scheduler']['faces'] == 3
+
+
+def test_server_errors_are_raised_without_dropping_the_connection(server, rng):
+    client = InferenceClient(server.server_address, timeout=5)
+    try:
+        with pytest.raises(RuntimeError, match='Inference server error'):
+            client.embed(np.zeros((1, 4, 4, 3), dtype=np.float32))
+        assert client.embed(_faces(rng, 1)).shape == (1, server.backend.dim)
+    finally:
+        client.close()
+
+
+def test_embed_via_server_falls_back_and_backs_off(tmp_path, monkeypatch, client_state, rng):
+    monkeypatch.setattr(inference_server, 'INFERENCE_SERVER', str(tmp_path / 'missing.sock'))
+    connects = []
+    connect = InferenceClient._socket
+    monkeypatch.setattr(InferenceClient, '_socket', lambda self: connects.append(1) or connect(self))
+    faces = _faces(rng, 2)
+    fallback = lambda batch: np.ones((len(batch), 4), dtype=np.float32)
+
+    assert embed_via_server(faces, fallback).shape == (2, 4)
+    assert embed_via_server(faces, fallback).shape == (2, 4)
+    assert len(connects) == 1  # the second call skipped the server while it is marked down
+    assert inference_server._fallbacks == 2
+
+    with pytest.raises(InferenceServerUnavailable):
+        embed_via_server(faces)
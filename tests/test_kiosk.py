@@ -0,0 +1,99 @@
+import io
+import numpy as np
+import pytest
+from flask import Flask
+import kiosk
+from routes import attendance as attendance_routes, stream
+from utils.db_handler import create_faculty, get_attendance_by_faculty, initialize_data_files
+
+FACE = (40, 40, 100, 100)
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    submissions = []
+
+    def submit_attendance(api_url, frame, location, token, timeout=10):
+        submissions.append(frame.shape)
+        return runner.accept, 'ok', 'A'
+
+    monkeypatch.setattr(kiosk, 'submit_attendance', submit_attendance)
+    monkeypatch.setattr(kiosk, 'detect_faces', lambda frame, roi=None: [FACE] if frame.any() else [])
+    runner = kiosk.KioskRunner('clip.mp4', token='secret')
+    runner._submitter = ImmediateExecutor()
+    runner.accept = True
+    runner.submissions = submissions
+    return runner
+
+
+def _frame(rng, sharp=True):
+    if not sharp:
+        return np.full((240, 320, 3), 128, dtype=np.uint8)
+    return rng.integers(40, 220, size=(240, 320, 3), dtype=np.uint8)
+
+
+def test_kiosk_submits_each_track_once_and_never_recognizes_locally(runner, rng, monkeypatch):
+    monkeypatch.setattr(kiosk.FaceTracker, 'recognize', lambda *args, **kwargs: pytest.fail('local recognition'))
+    for _ in range(5):
+        runner.handle_frame(_frame(rng))
+    assert len(runner.submissions) == 1 and runner.stats['marked'] == 1
+
+    for _ in range(kiosk.FaceTracker().max_missed + 1):  # nobody in view for a while: the track ends
+        runner.handle_frame(np.zeros((240, 320, 3), dtype=np.uint8))
+    runner.handle_frame(_frame(rng))
+    assert len(runner.submissions) == 2  # a new track is a new submission
+
+
+def test_kiosk_waits_for_a_good_crop_and_retries_rejected_tracks(runner, rng):
+    frame = _frame(rng)
+    frame[FACE[1]:FACE[1] + FACE[3], FACE[0]:FACE[0] + FACE[2]] = 128  # flat, i.e. blurry, face
+    runner.handle_frame(frame)
+    assert runner.submissions == [] and runner.stats['quality_rejected'] == 1
+
+    runner.accept = False
+    runner.handle_frame(_frame(rng))
+    runner.handle_frame(_frame(rng))
+    assert len(runner.submissions) == 1
+    runner.accept = True
+    runner._submitted = {tid: 0 for tid in runner._submitted}  # KIOSK_RETRY_SECONDS have passed
+    runner.handle_frame(_frame(rng))
+    assert len(runner.submissions) == 2 and runner.stats['marked'] == 1
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    initialize_data_files('attendance.db')
+    create_faculty({'faculty_id': 'A', 'name': 'Ada', 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': np.ones(512, dtype=np.float32).tobytes()}, db_path='attendance.db')
+    monkeypatch.setitem(stream.STREAM_KIOSK_TOKENS, 'gate', 'secret')
+    monkeypatch.setitem(stream.STREAM_KIOSK_TOKENS, 'lab', 'lab-secret')
+    monkeypatch.setattr(stream, 'STREAM_IDENTIFY_KIOSKS', {'gate'})
+    monkeypatch.setattr(attendance_routes, 'recognize_faces', lambda image: ['A'])
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(attendance_routes.attendance_bp, url_prefix='/attendance')
+    return app.test_client()
+
+
+def _post(client, token):
+    return client.post('/attendance/kiosk', headers={'Authorization': f'Bearer {token}'},
+                       data={'image': (io.BytesIO(b'jpeg'), 'kiosk.jpg'), 'location': 'Gate'})
+
+
+def test_kiosk_endpoint_identifies_and_marks_once(client):
+    assert _post(client, 'wrong').status_code == 403
+    assert _post(client, 'lab-secret').status_code == 403  # not allowed to identify
+
+    response = _post(client, 'secret')
+    assert response.status_code == 200 and response.get_json()['data']['faculty_id'] == 'A'
+    assert 'already' in _post(client, 'secret').get_json()['message']
+    assert len(get_attendance_by_faculty('A', db_path='attendance.db')) == 1
@@ -0,0 +1,48 @@
+import threading
+import time
+import pytest
+from utils import model_registry
+from utils.model_registry import FACENET_INPUT_SHAPE, get_model, unload, warmup
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Registers 'fake', whose loader is slow and counts loads; its warmup records the batch shape."""
+    calls = {'loads': 0, 'warmups': []}
+
+    def load():
+        calls['loads'] += 1
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setitem(model_registry.MODELS, 'fake',
+                        (load, lambda model, batch: calls['warmups'].append(batch.shape), None))
+    monkeypatch.setattr(model_registry, 'INFERENCE_ENGINE', False)
+    yield calls
+    unload('fake')
+
+
+def test_concurrent_first_use_loads_once(fake_model):
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(get_model('fake'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake_model['loads'] == 1
+    assert all(model is models[0] for model in models)
+
+
+def test_warmup_runs_one_dummy_batch_and_reports_timings(fake_model):
+    timings = warmup('fake')
+
+    assert fake_model['warmups'] == [(1,) + FACENET_INPUT_SHAPE]
+    assert set(timings) == {'load_seconds', 'warmup_seconds'}
+
+
+def test_unload_forces_a_fresh_load(fake_model):
+    first = get_model('fake')
+    unload('fake')
+    assert get_model('fake') is not first
+    assert fake_model['loads'] == 2
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+import utils.gallery as gallery_module
+from utils import packed_gallery
+from utils.db_handler import add_face_templates, create_faculty
+from utils.gallery import FaceGallery
+from utils.packed_gallery import PackedGallery, MIN_CAPACITY, get_packed_gallery, import_legacy_npy
+from conftest import unit_rows
+
+
+@pytest.fixture
+def packed(tmp_path):
+    return PackedGallery(str(tmp_path / 'test.gallery'), model_version='test-model')
+
+
+def test_write_and_open_publish_generations(packed, rng):
+    matrix = unit_rows(rng, 4)
+    packed.write(['A', 'A', 'B', 'C'], matrix)
+    first = packed.open()
+    assert first.ids == ['A', 'A', 'B', 'C'] and first.generation == first.epoch == 1
+    assert isinstance(first.matrix, np.memmap) and np.allclose(first.matrix, matrix)
+
+    packed.write(['A'], matrix[:1])
+    assert packed.open().generation == 2
+
+
+def test_replace_appends_in_place_and_tombstones_old_rows(packed, rng):
+    packed.write(['A', 'B'], unit_rows(rng, 2))
+    new = unit_rows(rng, 2)
+    assert packed.append('A', new)
+
+    loaded = packed.open()
+    assert loaded.ids == [None, 'B', 'A', 'A']
+    assert loaded.epoch == 1 and loaded.generation == 2  # no rewrite
+    assert np.allclose(loaded.matrix[2:], new)
+    assert packed.stats()['live'] == 3
+
+    assert packed.remove('B')
+    assert packed.open().ids == [None, None, 'A', 'A']
+
+
+def test_full_capacity_compacts_into_a_new_epoch(packed, monkeypatch, rng):
+    monkeypatch.setattr(packed_gallery, 'GALLERY_COMPACT_RATIO', 0)
+    packed.write(['A'], unit_rows(rng, 1))
+    for _ in range(MIN_CAPACITY):
+        packed.append('A', unit_rows(rng, 1))
+
+    loaded = packed.open()
+    assert loaded.ids == ['A'] and loaded.epoch == loaded.generation > 1
+
+
+def test_unusable_file_is_rebuilt_from_the_database(tmp_path, db_path, rng):
+    for faculty_id in ('A', 'B'):
+        create_faculty({'faculty_id': faculty_id, 'name': faculty_id, 'password_hash': 'x', 'registered_on': 'today',
+                        'face_embedding': unit_rows(rng, 1)[0].tobytes()}, db_path=db_path)
+    path = str(tmp_path / 'rebuilt.gallery')
+    PackedGallery(path, model_version='old-model').write(['A'], unit_rows(rng, 1))
+
+    without_db = PackedGallery(path, model_version='keras-facenet-20180402-114759')
+    assert without_db.open() is None
+    assert not without_db.append('B', unit_rows(rng, 1))
+
+    packed = PackedGallery(path, model_version='keras-facenet-20180402-114759', db_path=db_path)
+    assert packed.append('B', unit_rows(rng, 1))
+    assert sorted(packed.open().ids) == ['A', 'B']
+
+
+def test_gallery_refresh_quantizes_only_appended_rows(packed, db_path, monkeypatch, rng):
+    monkeypatch.setattr(gallery_module, 'PACKED_GALLERY', True)
+    monkeypatch.setattr(gallery_module, 'get_packed_gallery', lambda _: packed)
+    packed.write(['A', 'B'], unit_rows(rng, 2))
+    gallery = FaceGallery(db_path, quantization='int8')
+    loaded = packed.open()
+    gallery._set_state(loaded.ids, loaded.matrix, loaded.epoch)
+    gallery._generation, gallery._loaded = loaded.generation, True
+    codes = gallery._codes
+
+    new = unit_rows(rng, 1)
+    packed.append('A', new)
+    assert gallery.refresh()
+    assert gallery._codes is codes and codes.count == 3
+    assert gallery.match(new[0], threshold=0.9)[0][0] == 'A'
+    assert gallery.template_count() == 2 and len(gallery) == 2
+    assert gallery.snapshot()[1].shape == (2, new.shape[1])
+
+
+def test_file_from_another_model_is_not_opened(packed, tmp_path, rng):
+    packed.write(['A'], unit_rows(rng, 1))
+    assert PackedGallery(packed.path, model_version='other-model').open() is None
+    assert PackedGallery(str(tmp_path / 'missing.gallery'), model_version='test-model').open() is None
+
+
+def test_mostly_tombstoned_file_is_compacted(packed, rng):
+    packed.write([f'F{i}' for i in range(MIN_CAPACITY)], unit_rows(rng, MIN_CAPACITY))
+    for i in range(MIN_CAPACITY // 2):
+        packed.remove(f'F{i}')
+
+    loaded = packed.open()
+    assert len(loaded.ids) == MIN_CAPACITY // 2 and None not in loaded.ids
+    assert loaded.epoch == loaded.generation > 1
+
+
+def test_import_legacy_npy_fills_missing_embeddings_and_keeps_the_rest(tmp_path, db_path, rng):
+    from utils.gallery import load_embeddings_from_db
+    stored = unit_rows(rng, 3, dim=512)
+    create_faculty({'faculty_id': 'A', 'name': 'A', 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': stored[0].tobytes()}, db_path=db_path)
+    add_face_templates('A', [stored[1].tobytes()], db_path=db_path)
+    create_faculty({'faculty_id': 'B', 'name': 'B', 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': stored[2].tobytes(), 'model_version': 'retired-model'}, db_path=db_path)
+    faces_dir = tmp_path / 'faces'
+    faces_dir.mkdir()
+    legacy = unit_rows(rng, 3, dim=512)
+    for faculty_id, vector in zip(['A', 'B', 'GONE'], legacy):
+        np.save(faces_dir / f'{faculty_id}.npy', vector)
+
+    assert import_legacy_npy(str(faces_dir), db_path) == 1
+    loaded = get_packed_gallery(db_path).open()
+    assert loaded.ids == ['A', 'A', 'B']
+    assert np.allclose(loaded.matrix[:2], stored[:2]) and np.allclose(loaded.matrix[2], legacy[1])
+    assert load_embeddings_from_db(db_path)[0] == loaded.ids
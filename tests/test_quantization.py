@@ -0,0 +1,46 @@
+import numpy as np
+from utils.quantization import QuantizedRows, decision_diff, faculty_scores, quantize
+from conftest import unit_rows, noisy
+
+
+def test_int8_rerank_keeps_float32_decisions(rng):
+    matrix = unit_rows(rng, 400, dim=128)
+    row_ids = np.repeat([f'F{i}' for i in range(200)], 2)
+    probes = noisy(matrix[::3], rng, 0.05)
+
+    report = decision_diff(row_ids, matrix, probes, threshold=0.6, mode='int8')
+    assert report['decisions_changed'] == 0
+    assert report['quantized_bytes'] < report['float32_bytes'] / 3
+
+
+def test_faculty_scores_rerank_matches_exact_for_top_candidates(rng):
+    matrix = unit_rows(rng, 60)
+    starts = np.arange(0, 60, 3)
+    probes = noisy(matrix[[4, 31]], rng, 0.02)
+
+    exact = faculty_scores(matrix, starts, probes)
+    reranked = faculty_scores(matrix, starts, probes, threshold=0.5, quantized=quantize(matrix, 'int8'))
+    best = exact.argmax(axis=1)
+    assert list(reranked.argmax(axis=1)) == list(best)
+    assert np.allclose(reranked[[0, 1], best], exact[[0, 1], best])
+
+
+def test_faculty_scores_never_match_dead_segments(rng):
+    matrix = unit_rows(rng, 4)
+    starts = np.array([0, 2])
+    valid = np.array([False, True])
+    for quantized in (None, quantize(matrix, 'int8')):
+        scores = faculty_scores(matrix, starts, matrix[0], threshold=0.5, quantized=quantized, valid=valid)
+        assert scores[0, 0] == -np.inf
+
+
+def test_quantized_rows_extend_only_quantizes_new_rows(rng):
+    matrix = unit_rows(rng, 30)
+    rows = QuantizedRows('int8')
+    first_codes, _ = rows.extend(matrix[:10])
+    codes, scales = rows.extend(matrix[10:])
+
+    expected_codes, expected_scales = quantize(matrix, 'int8')
+    assert np.array_equal(codes, expected_codes) and np.allclose(scales, expected_scales)
+    assert np.array_equal(first_codes, expected_codes[:10])  # views handed out earlier are unchanged
+    assert QuantizedRows('none').extend(matrix) is None
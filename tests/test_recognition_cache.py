@@ -0,0 +1,52 @@
+import io
+from types import SimpleNamespace
+from utils import recognition_cache as cache_module
+from utils.recognition_cache import RecognitionCache, upload_digest
+
+
+def test_lru_eviction_and_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    cache = RecognitionCache(max_size=2, ttl=10)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None and cache.get('c') == 3
+
+    now[0] += 11
+    assert cache.get('a', default='gone') == 'gone'
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['size'] == 1
+
+
+def test_invalidate_faculty_keeps_unrelated_results():
+    cache = RecognitionCache()
+    cache.set(('embedding', 'd1'), 'vector')
+    cache.set(('verify', 'd1', 'A'), (True, 0.9))
+    cache.set(('verify', 'd1', 'B'), (False, 0.2))
+    cache.set(('recognize', 'd1'), ['A'])
+    cache.set(('recognize', 'd2'), ['B'])
+    cache.set(('recognize', 'd3'), [])
+
+    # A's new face can change A's verdicts and any 1:N result that matched A or nobody
+    assert cache.invalidate_faculty('A') == 3
+    assert cache.get(('embedding', 'd1')) == 'vector'
+    assert cache.get(('verify', 'd1', 'B')) == (False, 0.2)
+    assert cache.get(('recognize', 'd2')) == ['B']
+
+
+def test_disabled_cache_stores_nothing():
+    cache = RecognitionCache(max_size=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_upload_digest_rewinds_and_mixes_in_the_idempotency_key():
+    upload = io.BytesIO(b'same bytes')
+    digest = upload_digest(upload)
+
+    assert upload.read() == b'same bytes'
+    assert upload_digest(io.BytesIO(b'same bytes')) == digest
+    assert upload_digest(io.BytesIO(b'same bytes'), 'retry-1') != digest
@@ -0,0 +1,72 @@
+import socket
+import threading
+import http.client
+import pytest
+import serve
+from serve import PooledWSGIServer
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(app, threads=1, stream_threads=1):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(16)
+        server = PooledWSGIServer('127.0.0.1', listener.getsockname()[1], app, threads,
+                                  listener.fileno(), stream_threads=stream_threads)
+        servers.append((server, listener))
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        return server.server_address[1]
+
+    yield start
+    for server, listener in servers:
+        server.shutdown()
+        server.server_close()
+        listener.close()
+
+
+def _get(port, path='/', headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request('GET', path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def _upgrade():
+    return {'Upgrade': 'websocket', 'Connection': 'Upgrade'}
+
+
+def test_open_streams_do_not_hold_request_threads(start_server):
+    streaming, release = threading.Event(), threading.Event()
+
+    def app(environ, start_response):
+        if environ.get('HTTP_UPGRADE'):
+            streaming.set()
+            release.wait(timeout=5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    port = start_server(app, threads=1, stream_threads=1)
+    stream = threading.Thread(target=_get, args=(port, '/stream', _upgrade()))
+    stream.start()
+    try:
+        assert streaming.wait(timeout=5)
+        assert _get(port) == (200, b'ok')  # the only request thread is free again
+        status, _ = _get(port, '/stream', _upgrade())
+        assert status == 503  # stream threads are all taken
+    finally:
+        release.set()
+        stream.join(timeout=5)
+
+
+def test_reload_keeps_the_old_generation_when_weights_fail_to_load(monkeypatch):
+    def broken_preload(app, db_path):
+        raise OSError('missing weights')
+
+    monkeypatch.setattr(serve, 'preload', broken_preload)
+    assert serve.reload_master(None, 'attendance.db') is False
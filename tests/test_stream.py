@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import pytest
+from flask import Flask, session
+from routes import stream
+from routes.stream import LatestFrame, authorize_stream, process_frame
+from utils.db_handler import create_faculty, initialize_data_files
+
+
+def test_latest_frame_keeps_only_the_newest():
+    slot = LatestFrame()
+    for frame in (b'1', b'2', b'3'):
+        slot.put(frame)
+
+    assert slot.take(timeout=0) == b'3'
+    assert slot.take(timeout=0) is None
+    assert (slot.received, slot.dropped) == (3, 2)
+    slot.close()
+    assert slot.take() is None  # returns at once once the reader is gone
+
+
+def test_authorize_stream(monkeypatch):
+    monkeypatch.setattr(stream, 'STREAM_KIOSK_TOKENS', {'lobby': 'secret-1', 'lab': 'secret-2'})
+    monkeypatch.setattr(stream, 'STREAM_IDENTIFY_KIOSKS', {'lobby'})
+    app = Flask(__name__)
+    app.secret_key = 'test'
+
+    with app.test_request_context(headers={'Authorization': 'Bearer secret-1'}):
+        assert authorize_stream({}) == (True, True)
+    with app.test_request_context():
+        assert authorize_stream({'token': 'secret-2'}) == (True, False)
+        assert authorize_stream({'token': 'wrong'}) == (False, False)
+        assert authorize_stream({}) == (False, False)
+        session['admin'] = 'admin'
+        assert authorize_stream({}) == (True, True)
+
+
+class FakeTracker:
+    """Returns the given tracks for every frame and records the claimed faculty_id."""
+
+    def __init__(self, *tracks):
+        self.tracks = list(tracks)
+        self.claims = []
+
+    def recognize(self, frame, faculty_id=None, roi=None):
+        self.claims.append(faculty_id)
+        return self.tracks
+
+
+def _track(faculty_id=None, similarity=0.0, embedding=np.ones(4), quality=None):
+    return SimpleNamespace(faculty_id=faculty_id, similarity=similarity, embedding=embedding, quality=quality)
+
+
+@pytest.fixture
+def frame(tmp_path, monkeypatch):
+    # process_frame reads and writes the default database in the working directory
+    monkeypatch.chdir(tmp_path)
+    initialize_data_files('attendance.db')
+    create_faculty({'faculty_id': 'A', 'name': 'Ada', 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': np.ones(4, dtype=np.float32).tobytes()})
+    monkeypatch.setattr(stream, 'schedule_template_learning', lambda *args: False)
+    return cv2.imencode('.jpg', np.zeros((120, 160, 3), dtype=np.uint8))[1].tobytes()
+
+
+def test_process_frame_marks_once_per_day(frame):
+    tracker = FakeTracker(_track('A', 0.91))
+
+    event = process_frame(frame, {'faculty_id': 'A', 'location': 'Gate'}, tracker)
+    assert event['type'] == 'marked' and event['faculty_name'] == 'Ada' and event['location'] == 'Gate'
+    assert process_frame(frame, {'faculty_id': 'A'}, tracker)['type'] == 'already_marked'
+    assert tracker.claims == ['A']  # the second frame never reached the tracker
+
+
+def test_process_frame_requires_a_claim_unless_identifying(frame):
+    tracker = FakeTracker(_track('A', 0.91))
+
+    assert process_frame(frame, {}, tracker) == {'type': 'error', 'message': 'faculty_id is required'}
+    assert process_frame(frame, {}, tracker, identify=True)['type'] == 'marked'
+    assert tracker.claims == [None]
+
+
+@pytest.mark.parametrize('tracks, expected', [
+    ((), {'type': 'no_face'}),
+    ((_track(embedding=None, quality='blurry'),), {'type': 'low_quality', 'reason': 'blurry'}),
+    ((_track(similarity=0.41234),), {'type': 'no_match', 'similarity': 0.4123}),
+])
+def test_process_frame_reports_frames_without_a_match(frame, tracks, expected):
+    assert process_frame(frame, {'faculty_id': 'A'}, FakeTracker(*tracks)) == expected
+    assert process_frame(b'not a jpeg', {'faculty_id': 'A'}, FakeTracker()) == {'type': 'error', 'message': 'Invalid frame'}
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from utils.db_handler import (
+    add_face_templates, create_faculty, delete_face_templates, get_faculty_templates,
+    get_template_info, initialize_data_files, update_faculty
+)
+from utils.gallery import get_gallery
+from conftest import unit_rows
+
+
+def _enroll(db_path, faculty_id, embedding):
+    create_faculty({'faculty_id': faculty_id, 'name': faculty_id, 'password_hash': 'x', 'registered_on': 'today',
+                    'face_embedding': embedding.tobytes()}, db_path=db_path)
+
+
+def test_pruning_drops_the_oldest_capture_templates_first(db_path, rng):
+    rows = unit_rows(rng, 6)
+    _enroll(db_path, 'A', rows[0])
+    add_face_templates('A', [rows[1].tobytes()], source='enroll', db_path=db_path)
+    for row in rows[2:]:
+        add_face_templates('A', [row.tobytes()], source='capture', max_templates=3, db_path=db_path)
+
+    assert [t['source'] for t in get_template_info('A', db_path)] == ['enroll', 'capture', 'capture']
+    assert get_faculty_templates('A', db_path) == [rows[i].tobytes() for i in (0, 1, 4, 5)]
+
+
+def test_replacing_the_face_drops_every_template(db_path, rng):
+    old, new = unit_rows(rng, 3), unit_rows(rng, 1)
+    _enroll(db_path, 'A', old[0])
+    add_face_templates('A', [old[1].tobytes(), old[2].tobytes()], source='enroll', db_path=db_path)
+    gallery = get_gallery(db_path)
+    gallery.reload()
+    assert len(gallery.get('A')) == 3
+
+    assert update_faculty('A', {'face_embedding': new[0].tobytes()}, replace_templates=True, db_path=db_path)
+    assert get_template_info('A', db_path) == []
+    assert np.allclose(gallery.get('A'), new)
+    assert gallery.match(old[1], threshold=0.9) == []
+
+
+def test_replace_is_skipped_for_an_unknown_faculty(db_path, rng):
+    _enroll(db_path, 'A', unit_rows(rng, 1)[0])
+    add_face_templates('A', [unit_rows(rng, 1)[0].tobytes()], db_path=db_path)
+    assert not update_faculty('B', {'name': 'B'}, replace_templates=True, db_path=db_path)
+    assert len(get_template_info('A', db_path)) == 1
+
+
+def test_delete_face_templates_keeps_the_primary(db_path, rng):
+    rows = unit_rows(rng, 3)
+    _enroll(db_path, 'A', rows[0])
+    add_face_templates('A', [rows[1].tobytes(), rows[2].tobytes()], db_path=db_path)
+    first = get_template_info('A', db_path)[0]['template_id']
+
+    assert delete_face_templates('A', [first], db_path=db_path) == 1
+    assert get_faculty_templates('A', db_path) == [rows[0].tobytes(), rows[2].tobytes()]
+    assert delete_face_templates('A', db_path=db_path) == 1
+    assert delete_face_templates('A', db_path=db_path) == 0
+    assert get_faculty_templates('A', db_path) == [rows[0].tobytes()]
+
+
+@pytest.fixture
+def default_db(tmp_path, monkeypatch):
+    # learn_template writes to the default database in the working directory
+    monkeypatch.chdir(tmp_path)
+    initialize_data_files('attendance.db')
+    return 'attendance.db'
+
+
+def test_learn_template_accepts_only_new_confident_captures(default_db, rng):
+    from utils.face_recognition import learn_template
+    rows = unit_rows(rng, 3)
+    _enroll(default_db, 'A', rows[0])
+
+    assert not learn_template('A', rows[1], similarity=0.7)  # not confident enough
+    assert not learn_template('A', rows[1], similarity=0.97)  # adds nothing new
+    assert learn_template('A', rows[1], similarity=0.85)
+    assert not learn_template('A', rows[2], similarity=0.85)  # one capture template per interval
+    assert [t['source'] for t in get_template_info('A', default_db)] == ['capture']
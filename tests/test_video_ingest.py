@@ -0,0 +1,57 @@
+import io
+import os
+import pytest
+from flask import Flask
+from utils import video_ingest
+from routes.attendance import attendance_bp
+
+VIDEO = os.urandom(64 * 1024)
+
+
+@pytest.fixture
+def client(tmp_path, db_path, monkeypatch):
+    monkeypatch.setattr(video_ingest, '_jobs', {})
+    monkeypatch.setattr(video_ingest, 'run_job', lambda job: None)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config.update(MAX_CONTENT_LENGTH=16 * 1024, VIDEO_MAX_UPLOAD_BYTES=1024 * 1024,
+                      UPLOAD_FOLDER=str(tmp_path / 'uploads'), DB_PATH=db_path)
+    app.register_blueprint(attendance_bp, url_prefix='/attendance')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = 'admin'
+    return client
+
+
+def _saved(response):
+    assert response.status_code == 202, response.get_json()
+    path = video_ingest.get_job(response.get_json()['data']['job_id']).path
+    with open(path, 'rb') as f:
+        return path, f.read()
+
+
+def test_raw_body_larger_than_max_content_length_is_streamed_to_disk(client):
+    response = client.post('/attendance/video?location=Gate&recorded_at=2024-01-01T09:00:00&filename=lecture.mkv',
+                           data=VIDEO, content_type='video/x-matroska')
+    path, saved = _saved(response)
+    assert saved == VIDEO and path.endswith('.mkv')
+    assert video_ingest.get_job(response.get_json()['data']['job_id']).location == 'Gate'
+
+
+def test_multipart_upload_uses_the_video_limit(client):
+    response = client.post('/attendance/video', content_type='multipart/form-data',
+                           data={'video': (io.BytesIO(VIDEO), 'lecture.mp4'), 'recorded_at': '2024-01-01T09:00:00'})
+    assert _saved(response)[1] == VIDEO
+
+
+def test_uploads_over_the_video_limit_are_rejected(client):
+    response = client.post('/attendance/video?recorded_at=2024-01-01T09:00:00',
+                           data=b'\0' * (1024 * 1024 + 1), content_type='video/mp4')
+    assert response.status_code == 413
+    assert client.post('/attendance/video', data=b'', content_type='video/mp4').status_code == 400
+
+
+def test_full_queue_is_refused_before_the_upload_is_read(client, monkeypatch):
+    monkeypatch.setattr(video_ingest, 'VIDEO_MAX_QUEUED', 0)
+    response = client.post('/attendance/video?recorded_at=2024-01-01T09:00:00', data=VIDEO, content_type='video/mp4')
+    assert response.status_code == 503
@@ -0,0 +1,358 @@
+import os
+import time
+import tempfile
+import threading
+from collections import Counter
+import numpy as np
+from typing import List, Tuple, Optional
+from utils.db_handler import register_embedding_listener
+from utils.gallery import get_gallery, as_unit_vector, as_template_matrix, claim_matches
+from utils.db_changes import subscribe
+
+# Recognition search mode: 'exact' (brute-force gallery scan) or 'ivf'
+RECOGNITION_INDEX = os.environ.get('RECOGNITION_INDEX', 'exact').lower()
+
+# Number of IVF clusters; 0 picks ~4*sqrt(N) when the index is built
+IVF_NLIST = int(os.environ.get('IVF_NLIST', 0))
+
+# Clusters scanned per query: the recall/speed knob (higher = better recall, slower)
+IVF_NPROBE = int(os.environ.get('IVF_NPROBE', 8))
+
+# Galleries smaller than this are always searched exactly
+IVF_MIN_GALLERY_SIZE = int(os.environ.get('IVF_MIN_GALLERY_SIZE', 5000))
+
+# Minimum seconds between writes of the index file after incremental changes
+IVF_SAVE_INTERVAL = float(os.environ.get('IVF_SAVE_INTERVAL', 60))
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK = 8192
+
+
+def index_path_for(db_path) -> str:
+    """
+    The IVF index file lives next to the database, e.g. attendance.ivf.npz.
+    """
+    base, _ = os.path.splitext(os.path.abspath(db_path))
+    return base + '.ivf.npz'
+
+
+def _assign(matrix, centroids) -> np.ndarray:
+    """
+    Return the nearest centroid for each row, computed in chunks to bound memory.
+    """
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_CHUNK):
+        block = matrix[start:start + ASSIGN_CHUNK]
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(matrix, nlist, iterations=KMEANS_ITERATIONS, seed=0) -> np.ndarray:
+    """
+    Spherical k-means on (a sample of) the unit-normalized gallery matrix.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-normalized embeddings.
+
+    Vectors are grouped by their nearest k-means centroid; a query scans only
+    the nprobe closest groups. A faculty's templates may sit in different groups;
+    inserts and deletes only touch the groups holding that faculty, and
+    the centroids plus group assignments are persisted next to the database
+    so restarts skip training.
+
+    Writers replace a list's id and vector containers rather than mutating them,
+    and search() takes the lists it scans under the lock, so a concurrent
+    add/remove can't pair one version's ids with another's vectors.
+    """
+
+    def __init__(self, db_path='attendance.db', nprobe=IVF_NPROBE):
+        self.db_path = db_path
+        self.path = index_path_for(db_path)
+        self.nprobe = nprobe
+        self.centroids = None
+        self._lock = threading.Lock()
+        self._ids = []
+        self._vectors = []
+        self._where = {}
+        self._dirty = False
+        self._last_save = 0.0
+
+    def is_ready(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self._where)
+
+    def _reset_lists(self, dim):
+        nlist = len(self.centroids)
+        self._ids = [[] for _ in range(nlist)]
+        self._vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(nlist)]
+        self._where = {}
+
+    def _fill_lists(self, ids, matrix, labels):
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        for c in range(len(self.centroids)):
+            rows = order[bounds[c]:bounds[c + 1]]
+            self._vectors[c] = np.ascontiguousarray(matrix[rows])
+            self._ids[c] = [ids[r] for r in rows]
+            for fid in self._ids[c]:
+                self._where.setdefault(fid, set()).add(c)
+
+    def build(self, ids, matrix, nlist=None):
+        """
+        Train centroids on the given matrix and fill the inverted lists.
+        """
+        ids = list(ids)
+        if len(ids) == 0:
+            return
+        nlist = nlist or IVF_NLIST or int(4 * np.sqrt(len(ids)))
+        nlist = max(1, min(nlist, len(ids)))
+
+        started = time.time()
+        centroids = train_centroids(matrix, nlist)
+        with self._lock:
+            self.centroids = centroids
+            self._reset_lists(matrix.shape[1])
+            self._fill_lists(ids, matrix, _assign(matrix, centroids))
+            self._dirty = True
+        print(f"🧭 IVF index built: {len(ids)} vectors, {nlist} lists in {time.time() - started:.2f}s")
+        self.save()
+
+    def load(self, ids, matrix) -> bool:
+        """
+        Load persisted centroids/assignments and reconcile them with the current gallery.
+        Returns False when there is no usable index file.
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                centroids = data['centroids']
+                saved_ids = data['ids'].tolist()
+                saved_labels = data['labels']
+        except Exception as e:
+            print(f"⚠️ Could not read IVF index {self.path}: {e}")
+            return False
+        if matrix.size == 0 or centroids.shape[1] != matrix.shape[1]:
+            return False
+
+        # Rows are templates; reuse a faculty's saved assignments only if its template count is unchanged
+        saved = {}
+        for fid, label in zip(saved_ids, saved_labels):
+            saved.setdefault(fid, []).append(int(label))
+        counts, seen = Counter(ids), Counter()
+        labels = np.full(len(ids), -1, dtype=np.int32)
+        for row, fid in enumerate(ids):
+            if len(saved.get(fid, ())) == counts[fid]:
+                labels[row] = saved[fid][seen[fid]]
+            seen[fid] += 1
+        missing = np.flatnonzero(labels < 0)
+        if len(missing):
+            labels[missing] = _assign(matrix[missing], centroids)
+
+        with self._lock:
+            self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+            self._reset_lists(matrix.shape[1])
+            self._fill_lists(list(ids), matrix, labels)
+            self._dirty = len(missing) > 0 or len(saved_ids) != len(ids)
+            self._last_save = time.time()
+        print(f"🧭 IVF index loaded: {len(ids)} vectors ({len(missing)} newly assigned).")
+        return True
+
+    def save(self):
+        """
+        Atomically write centroids and list assignments next to the database.
+        """
+        with self._lock:
+            if self.centroids is None:
+                return
+            ids = [fid for list_ids in self._ids for fid in list_ids]
+            labels = np.repeat(np.arange(len(self._ids), dtype=np.int32), [len(list_ids) for list_ids in self._ids])
+            centroids = self.centroids
+            self._dirty = False
+            self._last_save = time.time()
+        # A private temp file per writer: several processes may save the same index
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=os.path.basename(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, centroids=centroids, ids=np.array(ids, dtype=str), labels=labels)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def save_if_due(self):
+        if self._dirty and time.time() - self._last_save >= IVF_SAVE_INTERVAL:
+            self.save()
+
+    def add(self, faculty_id, embeddings):
+        """
+        Insert or replace a faculty's templates, each in its nearest list.
+        """
+        vectors = as_template_matrix(embeddings)
+        if vectors is None or self.centroids is None or vectors.shape[1] != self.centroids.shape[1]:
+            return
+        self.remove(faculty_id)
+        with self._lock:
+            labels = np.argmax(vectors @ self.centroids.T, axis=1)
+            for c in np.unique(labels):
+                c = int(c)
+                self._vectors[c] = np.vstack([self._vectors[c], vectors[labels == c]])
+                self._ids[c] = self._ids[c] + [faculty_id] * int(np.sum(labels == c))
+            self._where[faculty_id] = {int(c) for c in labels}
+            self._dirty = True
+
+    def remove(self, faculty_id):
+        with self._lock:
+            lists = self._where.pop(faculty_id, None)
+            if lists is None:
+                return
+            for c in lists:
+                keep = [fid != faculty_id for fid in self._ids[c]]
+                self._ids[c] = [fid for fid in self._ids[c] if fid != faculty_id]
+                self._vectors[c] = self._vectors[c][np.asarray(keep, dtype=bool)]
+            self._dirty = True
+
+    def search(self, probe, threshold, nprobe=None) -> List[Tuple[str, float]]:
+        """
+        Return (faculty_id, similarity) pairs at or above threshold from the nprobe nearest lists.
+        A faculty whose templates hit several times is reported once, with its best score.
+        """
+        probe = as_unit_vector(probe)
+        if probe is None or self.centroids is None or probe.shape[0] != self.centroids.shape[1]:
+            return []
+
+        with self._lock:
+            nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+            centroid_scores = self.centroids @ probe
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            scanned = [(self._vectors[c], self._ids[c]) for c in lists]
+
+        best = {}
+        for vectors, ids in scanned:
+            if not ids:
+                continue
+            scores = vectors @ probe
+            for row in np.flatnonzero(scores >= threshold):
+                score = float(scores[row])
+                if score > best.get(ids[row], -1.0):
+                    best[ids[row]] = score
+
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_ann_index(db_path='attendance.db') -> Optional[IVFIndex]:
+    """
+    Return the shared IVF index for a database, loading or building it on first use.
+    Returns None when the gallery is too small to benefit from approximate search.
+    """
+    key = os.path.abspath(db_path)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            return index
+        gallery = get_gallery(db_path)
+        if len(gallery) < IVF_MIN_GALLERY_SIZE:
+            return None
+        ids, matrix = gallery.snapshot()
+        index = IVFIndex(db_path)
+        if not index.load(ids, matrix):
+            index.build(ids, matrix)
+        _indexes[key] = index
+    return index
+
+
+def search(probe, threshold, db_path='attendance.db', exact=False) -> List[Tuple[str, float]]:
+    """
+    Search the gallery using the configured mode. Exact search is used when
+    requested, when the mode is 'exact', or when no ANN index is available.
+    """
+    if not exact and RECOGNITION_INDEX == 'ivf':
+        index = get_ann_index(db_path)
+        if index is not None and index.is_ready():
+            return index.search(probe, threshold)
+    return get_gallery(db_path).match(probe, threshold)
+
+
+def search_batch(probes, threshold, db_path='attendance.db', exact=False) -> List[Optional[Tuple[str, float]]]:
+    """
+    Best match (or None) per probe, using the configured mode. Both modes resolve
+    a faculty matching several probes the same way (claim_matches).
+    """
+    if not exact and RECOGNITION_INDEX == 'ivf':
+        index = get_ann_index(db_path)
+        if index is not None and index.is_ready():
+            candidates = [(i, faculty_id, similarity)
+                          for i, probe in enumerate(probes)
+                          for faculty_id, similarity in index.search(probe, threshold)]
+            return claim_matches(candidates, len(probes))
+    return get_gallery(db_path).match_batch(probes, threshold)
+
+
+def _on_embedding_change(action, faculty_id, embedding, db_path, change_id=None):
+    index = _indexes.get(os.path.abspath(db_path))
+    if index is None:
+        return
+    if action == 'delete':
+        index.remove(faculty_id)
+    else:
+        # The gallery listener runs first and has already re-read every template
+        index.add(faculty_id, get_gallery(db_path).get(faculty_id))
+    index.save_if_due()
+
+
+register_embedding_listener(_on_embedding_change)
+
+
+def _on_db_change(topic, keys, db_path):
+    # Runs after the gallery subscriber, so the gallery already holds the new templates;
+    # this process's own writes were applied by the listener and are skipped
+    key = os.path.abspath(db_path)
+    index = _indexes.get(key)
+    if index is None:
+        return
+    if keys is None:
+        with _indexes_lock:
+            _indexes.pop(key, None)  # rebuilt from the gallery on next use
+        return
+    gallery = get_gallery(db_path)
+    for faculty_id in keys:
+        templates = gallery.get(faculty_id)
+        if templates is None:
+            index.remove(faculty_id)
+        else:
+            index.add(faculty_id, templates)
+
+
+subscribe('faculty', _on_db_change, skip_local=True)
@@ -0,0 +1,302 @@
+import os
+import csv
+import json
+import time
+import base64
+import multiprocessing
+from typing import Dict, List
+import cv2
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+# Processes decoding, detecting and preprocessing enrollment images
+ENROLL_WORKERS = int(os.environ.get('ENROLL_WORKERS', os.cpu_count() or 4))
+
+# Faces embedded per FaceNet forward pass
+ENROLL_BATCH_SIZE = int(os.environ.get('ENROLL_BATCH_SIZE', 256))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+DETAIL_FIELDS = ('name', 'email', 'phone', 'department', 'password')
+
+
+def _read_details(path) -> Dict[str, Dict]:
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['faculty_id'].strip(): row for row in csv.DictReader(f) if row.get('faculty_id')}
+
+
+def read_manifest(source, details=None) -> List[Dict]:
+    """
+    Collect faculty to enroll, in source order. source is either a directory with one
+    sub-directory of images per faculty (named after the faculty_id) or a CSV with a
+    faculty_id and an image column; a faculty may span several rows, and image may
+    list several paths separated by ';' (relative to the CSV). Name, email, phone,
+    department and password come from the CSV or from an optional details CSV.
+    """
+    faculty = {}
+    if os.path.isdir(source):
+        for faculty_id in sorted(os.listdir(source)):
+            folder = os.path.join(source, faculty_id)
+            if not os.path.isdir(folder):
+                continue
+            images = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+            faculty[faculty_id] = {'faculty_id': faculty_id, 'images': images}
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                faculty_id = (row.get('faculty_id') or '').strip()
+                if not faculty_id:
+                    continue
+                entry = faculty.setdefault(faculty_id, {'faculty_id': faculty_id, 'images': []})
+                for field in DETAIL_FIELDS:
+                    if row.get(field) and not entry.get(field):
+                        entry[field] = row[field].strip()
+                entry['images'] += [os.path.join(base, p.strip()) for p in (row.get('image') or '').split(';') if p.strip()]
+
+    extra = _read_details(details) if details else {}
+    for faculty_id, entry in faculty.items():
+        for field in DETAIL_FIELDS:
+            if not entry.get(field) and extra.get(faculty_id, {}).get(field):
+                entry[field] = extra[faculty_id][field].strip()
+        entry.setdefault('name', faculty_id)
+    return list(faculty.values())
+
+
+def _init_worker():
+    # One process per core already; keep OpenCV from spawning its own threads on top
+    cv2.setNumThreads(1)
+
+
+def _prepare_faculty(entry):
+    """
+    Pool worker: decode every image of one faculty, keep the largest face that passes
+    the quality gate and preprocess it. Password hashing (deliberately slow) runs here too.
+    Returns (entry, (N, 160, 160, 3) faces or None, {image path: reason}).
+    """
+    from face_utils import detect_faces, preprocess_face
+    from utils.face_quality import check_face
+    from utils.image_decode import decode_image_bytes
+
+    faces, failures = [], {}
+    for path in entry['images']:
+        try:
+            with open(path, 'rb') as f:
+                image = decode_image_bytes(f.read())
+            if image is None:
+                failures[path] = 'unreadable image'
+                continue
+            boxes = detect_faces(image)
+            if not boxes:
+                failures[path] = 'no face detected'
+                continue
+            x, y, w, h = boxes[0]
+            reason = check_face(image[y:y+h, x:x+w])
+            if reason:
+                failures[path] = f'low quality face ({reason})'
+                continue
+            faces.append(preprocess_face(image[y:y+h, x:x+w]))
+        except Exception as e:
+            failures[path] = f'failed to process image: {e}'
+
+    entry = dict(entry, password_hash=generate_password_hash(entry['password']))
+    del entry['password']
+    return entry, (np.concatenate(faces, axis=0) if faces else None), failures
+
+
+def _encode(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+
+
+def _decode(text) -> bytes:
+    return base64.b64decode(text)
+
+
+def read_journal(path) -> Dict[str, Dict]:
+    """
+    Faculty already embedded by an interrupted run. A torn last line (crash mid-write) is ignored.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[entry['faculty_id']] = entry
+    return done
+
+
+class BulkEnroller:
+    """
+    Enroll many faculty at once: a process pool decodes, detects and preprocesses,
+    the parent embeds faces in large batches and journals every embedded faculty,
+    then everything is written in one transaction and the packed gallery rebuilt once.
+    Rerunning after a crash picks up the journal and skips faculty already in the database.
+    """
+
+    def __init__(self, journal_path, db_path='attendance.db', workers=ENROLL_WORKERS,
+                 batch_size=ENROLL_BATCH_SIZE, default_password=None, max_templates=None):
+        from utils.gallery import MAX_FACE_TEMPLATES
+        self.db_path = db_path
+        self.journal_path = journal_path
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.default_password = default_password
+        self.max_templates = MAX_FACE_TEMPLATES if max_templates is None else max_templates
+        self.failures = {}  # faculty_id -> reason
+        self.timings = {'prepare': 0.0, 'embed': 0.0, 'write': 0.0, 'gallery': 0.0}
+
+    def _pending(self, entries, journaled):
+        """
+        Split the manifest into faculty still to embed and the number already registered.
+        Journaled faculty that were committed before a crash are dropped from journaled.
+        """
+        from utils.db_handler import get_all_faculty
+
+        existing = get_all_faculty(db_path=self.db_path)
+        taken_ids = {f['faculty_id'] for f in existing}
+        taken_emails = {f['email'] for f in existing if f.get('email')}
+        for faculty_id in taken_ids & set(journaled):
+            del journaled[faculty_id]
+        # Journaled faculty are written in the same batch, so their ids and emails are taken too
+        taken_ids |= set(journaled)
+        taken_emails |= {entry['email'] for entry in journaled.values() if entry.get('email')}
+        pending, skipped = [], 0
+        for entry in entries:
+            if entry['faculty_id'] in journaled:
+                continue
+            if entry['faculty_id'] in taken_ids or (entry.get('email') and entry['email'] in taken_emails):
+                skipped += 1
+                continue
+            if not entry['images']:
+                self.failures[entry['faculty_id']] = 'no images'
+                continue
+            if not entry.get('password'):
+                if not self.default_password:
+                    self.failures[entry['faculty_id']] = 'no password (pass --default-password)'
+                    continue
+                entry['password'] = self.default_password
+            taken_emails.add(entry.get('email'))
+            pending.append(entry)
+        return pending, skipped
+
+    def _embed(self, prepared, journal):
+        """
+        Embed the faces of several faculty in one forward pass and journal the results.
+        """
+        from face_utils import embed_faces, l2_normalize
+
+        started = time.time()
+        embeddings = embed_faces(np.concatenate([faces for _, faces in prepared], axis=0))
+        self.timings['embed'] += time.time() - started
+
+        offset = 0
+        for entry, faces in prepared:
+            templates = [l2_normalize(e) for e in embeddings[offset:offset + len(faces)]]
+            offset += len(faces)
+            entry['face_embedding'] = _encode(l2_normalize(np.mean(templates, axis=0)))
+            entry['templates'] = [_encode(t) for t in templates[:self.max_templates]] if len(templates) > 1 else []
+            journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def _write(self, journaled):
+        from utils.db_handler import create_faculty_bulk
+        from utils.packed_gallery import PACKED_GALLERY, rebuild
+
+        entries = list(journaled.values())
+        started = time.time()
+        written = create_faculty_bulk(
+            [dict(entry, face_embedding=_decode(entry['face_embedding'])) for entry in entries],
+            [(entry['faculty_id'], _decode(t)) for entry in entries for t in entry['templates']],
+            db_path=self.db_path
+        )
+        self.timings['write'] = time.time() - started
+
+        if PACKED_GALLERY and written:
+            started = time.time()
+            rebuild(self.db_path)
+            self.timings['gallery'] = time.time() - started
+        return written
+
+    def run(self, entries) -> Dict:
+        started = time.time()
+        journaled = read_journal(self.journal_path)
+        pending, skipped = self._pending(entries, journaled)
+        if journaled:
+            print(f"🔁 Resuming: {len(journaled)} faculty already embedded in {self.journal_path}")
+        print(f"👥 {len(pending)} faculty to embed with {self.workers} worker(s), {skipped} already registered")
+
+        with open(self.journal_path, 'a', encoding='utf-8') as journal:
+            batch, batch_faces = [], 0
+            # Create the pool before FaceNet loads in this process, so no worker inherits it
+            with multiprocessing.Pool(self.workers, initializer=_init_worker) as pool:
+                prepare_started = time.time()
+                for entry, faces, failures in pool.imap_unordered(_prepare_faculty, pending, chunksize=4):
+                    for path, reason in failures.items():
+                        print(f"⚠️ {entry['faculty_id']}: skipping {path}: {reason}.")
+                    if faces is None:
+                        self.failures[entry['faculty_id']] = 'no usable face in any image'
+                        continue
+                    batch.append((entry, faces))
+                    batch_faces += len(faces)
+                    if batch_faces >= self.batch_size:
+                        self._embed(batch, journal)
+                        journaled.update((e['faculty_id'], e) for e, _ in batch)
+                        batch, batch_faces = [], 0
+                if batch:
+                    self._embed(batch, journal)
+                    journaled.update((e['faculty_id'], e) for e, _ in batch)
+                self.timings['prepare'] = time.time() - prepare_started - self.timings['embed']
+
+        written = self._write(journaled)
+        os.remove(self.journal_path)
+
+        elapsed = time.time() - started
+        report = {
+            'enrolled': written,
+            'skipped': skipped,
+            'failed': len(self.failures),
+            'failures': self.failures,
+            'elapsed': round(elapsed, 2),
+            'faculty_per_second': round(written / elapsed, 2) if elapsed else 0.0,
+            'timings': {k: round(v, 2) for k, v in self.timings.items()},
+        }
+        return report
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Enroll many faculty from a directory tree or a CSV manifest.')
+    parser.add_argument('source', help='directory of <faculty_id>/ image folders, or a CSV manifest')
+    parser.add_argument('--details', help='CSV of faculty_id,name,email,phone,department,password')
+    parser.add_argument('--db', default='attendance.db')
+    parser.add_argument('--journal', help='resume journal (default: <source>.enroll.jsonl)')
+    parser.add_argument('--workers', type=int, default=ENROLL_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=ENROLL_BATCH_SIZE, help='faces per FaceNet forward pass')
+    parser.add_argument('--default-password', help='password for faculty without one in the manifest')
+    args = parser.parse_args(argv)
+
+    from utils.db_handler import initialize_data_files
+    initialize_data_files(args.db)
+
+    entries = read_manifest(args.source, args.details)
+    journal = args.journal or os.path.abspath(args.source).rstrip(os.sep) + '.enroll.jsonl'
+    enroller = BulkEnroller(journal, args.db, workers=args.workers, batch_size=args.batch_size,
+                            default_password=args.default_password)
+    report = enroller.run(entries)
+
+    for faculty_id, reason in report['failures'].items():
+        print(f"❌ {faculty_id}: {reason}")
+    timings = report['timings']
+    print(f"✅ Enrolled {report['enrolled']} faculty in {report['elapsed']}s "
+          f"({report['faculty_per_second']} faculty/s); {report['skipped']} skipped, {report['failed']} failed")
+    print(f"⏱️ prepare {timings['prepare']}s, embed {timings['embed']}s, "
+          f"write {timings['write']}s, gallery {timings['gallery']}s")
+
+
+if __name__ == '__main__':
+    main()
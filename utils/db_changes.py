@@ -0,0 +1,223 @@
+import os
+import time
+import sqlite3
+import inspect
+import functools
+import threading
+from typing import Dict, Optional
+from utils.db_handler import get_all_attendance, get_faculty_directory, get_faculty_count, register_embedding_listener
+
+# Minimum seconds between two change checks of the same database in one process
+DB_CHANGE_POLL_SECONDS = float(os.environ.get('DB_CHANGE_POLL_SECONDS', 0.5))
+
+TOPICS = ('faculty', 'attendance')
+
+# (topics, callback(topic, keys, db_path), skip_local) run when another connection changed a topic
+_subscribers = []
+
+
+def subscribe(topics, callback, skip_local=False):
+    """
+    Register callback(topic, keys, db_path) for changes to the given topics
+    ('faculty': faculty rows and face templates, 'attendance'). keys is the set
+    of changed faculty IDs, or None when the change log no longer reaches back
+    far enough and everything must be treated as changed.
+
+    With skip_local, keys this process's embedding listeners already applied
+    (see mark_applied) are left out, and the callback isn't run when none remain.
+    """
+    topics = (topics,) if isinstance(topics, str) else tuple(topics)
+    if not any(entry[:2] == (topics, callback) for entry in _subscribers):
+        _subscribers.append((topics, callback, skip_local))
+
+
+class ChangeWatcher:
+    """
+    Detects commits to one database from any connection in any process.
+
+    PRAGMA data_version on a long-lived, read-only-by-use connection changes only
+    when another connection commits, so an idle check is a single pragma. When it
+    moves, the trigger-maintained change_log is read past the last seen change_id.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._last_id = None
+        self._applied = {}  # (topic, key) -> newest change_id when a local listener applied it
+        self._checked_at = 0.0
+        self._stats = {'checks': 0, 'changes': 0, 'dispatches': 0, 'overflows': 0, 'skipped_local': 0}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def poll(self, force=False) -> int:
+        """
+        Dispatch changes committed since the last poll. Rate-limited to one check
+        per DB_CHANGE_POLL_SECONDS unless force is set. Returns the changes seen.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < DB_CHANGE_POLL_SECONDS:
+            return 0
+        with self._lock:
+            self._checked_at = now
+            self._stats['checks'] += 1
+            try:
+                changed = self._read_changes()
+            except sqlite3.Error as e:
+                print(f"⚠️ Change check on {self.db_path} failed: {e}")
+                return 0
+            applied = self._applied
+            # Marks at or below the read position can't match any later change
+            self._applied = {item: change_id for item, change_id in applied.items() if change_id > self._last_id}
+        if changed:
+            self._dispatch(changed, applied)
+        return sum(len(keys) if keys is not None else 1 for keys in changed.values())
+
+    def mark_applied(self, topic, key, change_id):
+        """
+        Record that this process already applied its own change to key, logged as
+        change_id (e.g. by an embedding listener after the write), so skip_local
+        subscribers ignore the change_log entries for key up to change_id. Changes
+        other connections log later still get through.
+        """
+        if change_id is None:
+            return
+        with self._lock:
+            self._applied[(topic, key)] = max(change_id, self._applied.get((topic, key), 0))
+
+    def _read_changes(self) -> Dict[str, Optional[Dict[str, int]]]:
+        conn = self._connection()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return {}
+        self._data_version = version
+
+        oldest, newest = conn.execute('SELECT MIN(change_id), MAX(change_id) FROM change_log').fetchone()
+        if self._last_id is None:
+            self._last_id = newest or 0  # baseline: caches load current data on their own
+            return {}
+        if newest is None or newest <= self._last_id:
+            return {}
+
+        if oldest > self._last_id + 1:
+            # Pruned past our position: we can't tell what changed
+            self._stats['overflows'] += 1
+            self._last_id = newest
+            return {topic: None for topic in TOPICS}
+
+        changed = {}
+        for change_id, topic, key in conn.execute(
+                'SELECT change_id, topic, item_key FROM change_log WHERE change_id > ? ORDER BY change_id',
+                (self._last_id,)):
+            changed.setdefault(topic, {})[key] = change_id  # newest change per key
+            self._last_id = change_id
+            self._stats['changes'] += 1
+        return changed
+
+    def _dispatch(self, changed, applied):
+        for topics, callback, skip_local in list(_subscribers):
+            for topic, newest in changed.items():
+                if topic not in topics:
+                    continue
+                keys = set(newest) if newest is not None else None
+                if skip_local and keys is not None:
+                    keys = {key for key in keys if newest[key] > applied.get((topic, key), 0)}
+                    self._stats['skipped_local'] += len(newest) - len(keys)
+                    if not keys:
+                        continue
+                try:
+                    callback(topic, keys, self.db_path)
+                    self._stats['dispatches'] += 1
+                except Exception as e:
+                    print(f"Change subscriber failed: {e}")
+
+    def stats(self) -> Dict:
+        return dict(self._stats, db_path=self.db_path, last_change_id=self._last_id)
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def get_watcher(db_path='attendance.db') -> ChangeWatcher:
+    key = os.path.abspath(db_path)
+    watcher = _watchers.get(key)
+    if watcher is None:
+        with _watchers_lock:
+            watcher = _watchers.get(key)
+            if watcher is None:
+                watcher = _watchers[key] = ChangeWatcher(key)
+                watcher.poll(force=True)  # establish the baseline
+    return watcher
+
+
+def poll_changes(db_path='attendance.db', force=False) -> int:
+    """
+    Cheap enough to call on every request: at most one PRAGMA per DB_CHANGE_POLL_SECONDS.
+    """
+    return get_watcher(db_path).poll(force)
+
+
+def change_stats() -> Dict:
+    return {key: watcher.stats() for key, watcher in _watchers.items()}
+
+
+def _on_embedding_change(action, faculty_id, embedding, db_path, change_id=None):
+    # The caches' own listeners apply this write (they re-read the faculty after it
+    # committed), so skip_local subscribers can skip its change_log entries
+    get_watcher(db_path).mark_applied('faculty', faculty_id, change_id)
+
+
+register_embedding_listener(_on_embedding_change)
+
+
+# -- cached readers -----------------------------------------------------------
+
+def cached_query(*topics):
+    """
+    Memoize a db_handler reader per arguments until one of topics changes in its
+    database. Results are shared between callers and must be treated as read-only.
+    """
+    def decorator(fn):
+        cache = {}
+        state = {'version': 0}
+        lock = threading.Lock()
+        signature = inspect.signature(fn)
+
+        def invalidate(topic, keys, db_path):
+            with lock:
+                cache.clear()
+                state['version'] += 1
+
+        subscribe(topics, invalidate)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            poll_changes(bound.arguments.get('db_path', 'attendance.db'))
+            key = tuple(sorted(bound.arguments.items()))
+            with lock:
+                if key in cache:
+                    return cache[key]
+                version = state['version']
+            result = fn(*args, **kwargs)
+            with lock:
+                # An invalidation during fn() may mean result predates the change: don't keep it
+                if state['version'] == version:
+                    cache[key] = result
+            return result
+
+        wrapper.invalidate = lambda: invalidate(None, None, None)
+        return wrapper
+    return decorator
+
+
+cached_all_attendance = cached_query('attendance')(get_all_attendance)
+cached_faculty_directory = cached_query('faculty')(get_faculty_directory)
+cached_faculty_count = cached_query('faculty')(get_faculty_count)
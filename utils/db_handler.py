@@ -3,7 +3,17 @@ from werkzeug.security import generate_password_hash
 import os
 import uuid
 from datetime import date, datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
+
+# Callbacks fired after a faculty embedding is created, updated or deleted
+_embedding_listeners = []
+
+# Entries kept in the change_log table that other processes poll for changes
+CHANGE_LOG_KEEP = 10000
+
+# Stored embeddings count only when produced by the current model; rows written
+# before model_version existed (NULL) came from the original keras-facenet weights
+_CURRENT_MODEL = "COALESCE(model_version, ?) = ?"
 
 def get_connection(db_path=None):
     if db_path is None:
@@ -51,6 +61,33 @@ def initialize_data_files(db_path='attendance.db'):
             )
         ''')
 
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_attendance_date_faculty
+            ON attendance (date, faculty_id)
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_templates (
+                template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                faculty_id TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                source TEXT,
+                created_on TEXT,
+                FOREIGN KEY(faculty_id) REFERENCES faculty(faculty_id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_face_templates_faculty
+            ON face_templates (faculty_id)
+        ''')
+
+        # Databases created before embeddings were stamped with their model
+        for table in ('faculty', 'face_templates'):
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+            if 'model_version' not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN model_version TEXT")
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS absentee_alerts (
                 alert_id TEXT PRIMARY KEY,
@@ -82,6 +119,40 @@ def initialize_data_files(db_path='attendance.db'):
             )
         ''')
 
+        # Change log for other processes' caches (see utils/db_changes.py): every
+        # write to a watched table records (topic, faculty_id); only the newest
+        # CHANGE_LOG_KEEP entries are kept
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                item_key TEXT
+            )
+        ''')
+        for table, topic in (('faculty', 'faculty'), ('face_templates', 'faculty'), ('attendance', 'attendance')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_insert_log AFTER INSERT ON {table} BEGIN
+                    INSERT INTO change_log (topic, item_key) VALUES ('{topic}', NEW.faculty_id);
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_update_log AFTER UPDATE ON {table} BEGIN
+                    INSERT INTO change_log (topic, item_key) VALUES ('{topic}', NEW.faculty_id);
+                    INSERT INTO change_log (topic, item_key)
+                        SELECT '{topic}', OLD.faculty_id WHERE OLD.faculty_id IS NOT NEW.faculty_id;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_log AFTER DELETE ON {table} BEGIN
+                    INSERT INTO change_log (topic, item_key) VALUES ('{topic}', OLD.faculty_id);
+                END
+            ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_change_log_prune AFTER INSERT ON change_log BEGIN
+                DELETE FROM change_log WHERE change_id <= NEW.change_id - {CHANGE_LOG_KEEP};
+            END
+        ''')
+
         cursor.execute("SELECT COUNT(*) FROM admins WHERE username = 'admin'")
         if cursor.fetchone()[0] == 0:
             cursor.execute('''
@@ -96,6 +167,46 @@ def initialize_data_files(db_path='attendance.db'):
 
         conn.commit()
 
+# ========== EMBEDDING CHANGE LISTENERS ==========
+def register_embedding_listener(callback):
+    """
+    Register callback(action, faculty_id, embedding, db_path, change_id) to run
+    after create_faculty / update_faculty / delete_faculty / add_face_templates /
+    delete_face_templates change a faculty's embeddings. action is one of 'upsert'
+    or 'delete'; embedding is the newest raw BLOB bytes or None; change_id is the
+    change_log entry of this write (None without a change_log). Listeners that
+    keep every template re-read them with get_faculty_templates.
+    """
+    if callback not in _embedding_listeners:
+        _embedding_listeners.append(callback)
+
+def _notify_embedding_change(action, faculty_id, embedding, db_path, change_id=None):
+    for callback in list(_embedding_listeners):
+        try:
+            callback(action, faculty_id, embedding, db_path, change_id)
+        except Exception as e:
+            print(f"Embedding listener failed: {e}")
+
+def _own_change_id(cursor, faculty_id) -> Optional[int]:
+    """
+    The change_log entry of a faculty write, read before it commits: the open write
+    transaction keeps every other connection from logging a change in between.
+    """
+    try:
+        cursor.execute("SELECT MAX(change_id) FROM change_log WHERE topic = 'faculty' AND item_key = ?", (faculty_id,))
+    except sqlite3.OperationalError:  # database initialized before change_log existed
+        return None
+    return cursor.fetchone()[0]
+
+def current_model_version() -> str:
+    """Version of the embedding model in use, stamped on every stored embedding."""
+    from utils.inference_backends import get_backend
+    return get_backend().version
+
+def _model_params():
+    from utils.inference_backends import FACENET_VERSION
+    return FACENET_VERSION, current_model_version()
+
 # ========== FACULTY FUNCTIONS ==========
 def get_all_faculty(db_path='attendance.db') -> List[Dict]:
     with get_connection(db_path) as conn:
@@ -104,6 +215,14 @@ def get_all_faculty(db_path='attendance.db') -> List[Dict]:
         columns = [desc[0] for desc in cursor.description]
         return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+def get_faculty_directory(db_path='attendance.db') -> List[Dict]:
+    """Return the listing columns of every faculty (no embeddings or password hashes)."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT faculty_id, name, department, email, phone FROM faculty")
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
 def get_faculty_by_id(faculty_id, db_path='attendance.db') -> Dict:
     with get_connection(db_path) as conn:
         cursor = conn.cursor()
@@ -114,14 +233,42 @@ def get_faculty_by_id(faculty_id, db_path='attendance.db') -> Dict:
             return dict(zip(columns, row))
         return None
 
+def get_faculty_embeddings(db_path='attendance.db') -> List[Tuple[str, bytes]]:
+    """Return (faculty_id, face_embedding) pairs of the current model without pulling the other columns."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT faculty_id, face_embedding FROM faculty WHERE face_embedding IS NOT NULL AND {_CURRENT_MODEL}",
+                       _model_params())
+        return cursor.fetchall()
+
+def get_faculty_embedding_ids(db_path='attendance.db') -> List[str]:
+    """Return the IDs of faculty with a stored embedding of the current model (no BLOBs are read)."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT faculty_id FROM faculty WHERE face_embedding IS NOT NULL AND {_CURRENT_MODEL}",
+                       _model_params())
+        return [row[0] for row in cursor.fetchall()]
+
+def get_faculty_names(faculty_ids, db_path='attendance.db') -> Dict[str, str]:
+    """Return {faculty_id: name} for the given IDs."""
+    faculty_ids = list(faculty_ids)
+    if not faculty_ids:
+        return {}
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in faculty_ids)
+        cursor.execute(f"SELECT faculty_id, name FROM faculty WHERE faculty_id IN ({placeholders})", faculty_ids)
+        return dict(cursor.fetchall())
+
 def create_faculty(faculty_data: Dict, db_path='attendance.db') -> bool:
+    model_version = faculty_data.get('model_version') or current_model_version()
     with get_connection(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO faculty (
                 faculty_id, name, department, email, phone,
-                password_hash, face_embedding, registered_on
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                password_hash, face_embedding, registered_on, model_version
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             faculty_data['faculty_id'],
             faculty_data['name'],
@@ -130,12 +277,57 @@ def create_faculty(faculty_data: Dict, db_path='attendance.db') -> bool:
             faculty_data.get('phone', ''),
             faculty_data['password_hash'],
             sqlite3.Binary(faculty_data['face_embedding']),
-            faculty_data['registered_on']
+            faculty_data['registered_on'],
+            model_version
         ))
+        change_id = _own_change_id(cursor, faculty_data['faculty_id'])
         conn.commit()
-        return True
-
-def update_faculty(faculty_id: str, updated_data: Dict, db_path='attendance.db') -> bool:
+    _notify_embedding_change('upsert', faculty_data['faculty_id'], faculty_data['face_embedding'], db_path, change_id)
+    return True
+
+def create_faculty_bulk(faculty_list: List[Dict], templates: List[Tuple[str, bytes]], db_path='attendance.db') -> int:
+    """
+    Insert many faculty and their (faculty_id, embedding) enrollment templates in a
+    single transaction. Embedding listeners are not notified: callers refresh the
+    packed gallery once afterwards. Returns the number of faculty written.
+    """
+    if not faculty_list:
+        return 0
+    now = datetime.now().isoformat()
+    model_version = current_model_version()
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO faculty (
+                faculty_id, name, department, email, phone,
+                password_hash, face_embedding, registered_on, model_version
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            f['faculty_id'],
+            f['name'],
+            f.get('department', ''),
+            f.get('email', ''),
+            f.get('phone', ''),
+            f['password_hash'],
+            sqlite3.Binary(f['face_embedding']),
+            f.get('registered_on', now),
+            model_version
+        ) for f in faculty_list])
+        cursor.executemany('''
+            INSERT INTO face_templates (faculty_id, embedding, source, created_on, model_version)
+            VALUES (?, ?, 'enroll', ?, ?)
+        ''', [(faculty_id, sqlite3.Binary(embedding), now, model_version) for faculty_id, embedding in templates])
+        conn.commit()
+    return len(faculty_list)
+
+def update_faculty(faculty_id: str, updated_data: Dict, db_path='attendance.db', replace_templates=False) -> bool:
+    """
+    Update the given columns. With replace_templates (a new face replacing the
+    old one), the faculty's extra templates are deleted in the same transaction,
+    so faces learned from or enrolled as the old face stop matching.
+    """
+    if updated_data.get('face_embedding') and 'model_version' not in updated_data:
+        updated_data = dict(updated_data, model_version=current_model_version())
     with get_connection(db_path) as conn:
         cursor = conn.cursor()
         fields = []
@@ -147,15 +339,128 @@ def update_faculty(faculty_id: str, updated_data: Dict, db_path='attendance.db')
         cursor.execute(f'''
             UPDATE faculty SET {", ".join(fields)} WHERE faculty_id = ?
         ''', values)
+        updated = cursor.rowcount > 0
+        if updated and replace_templates:
+            cursor.execute("DELETE FROM face_templates WHERE faculty_id = ?", (faculty_id,))
+        change_id = _own_change_id(cursor, faculty_id)
         conn.commit()
-        return cursor.rowcount > 0
+    if updated and (updated_data.get('face_embedding') or replace_templates):
+        _notify_embedding_change('upsert', faculty_id, updated_data.get('face_embedding'), db_path, change_id)
+    return updated
 
 def delete_faculty(faculty_id: str, db_path='attendance.db') -> bool:
     with get_connection(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM faculty WHERE faculty_id = ?", (faculty_id,))
+        deleted = cursor.rowcount > 0
+        cursor.execute("DELETE FROM face_templates WHERE faculty_id = ?", (faculty_id,))
+        change_id = _own_change_id(cursor, faculty_id)
+        conn.commit()
+    if deleted:
+        _notify_embedding_change('delete', faculty_id, None, db_path, change_id)
+    return deleted
+
+# ========== FACE TEMPLATES ==========
+def add_face_templates(faculty_id: str, embeddings: List[bytes], source='capture', max_templates=None,
+                       model_version=None, db_path='attendance.db') -> int:
+    """
+    Store extra embeddings for a faculty in one transaction, stamped with
+    model_version (default: the current model). When max_templates is given, the
+    oldest templates beyond it are pruned, capture templates before enrollment
+    ones. Returns the number of templates added.
+    """
+    if not embeddings:
+        return 0
+    now = datetime.now().isoformat()
+    model_version = model_version or current_model_version()
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO face_templates (faculty_id, embedding, source, created_on, model_version)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(faculty_id, sqlite3.Binary(embedding), source, now, model_version) for embedding in embeddings])
+        if max_templates is not None:
+            cursor.execute('''
+                DELETE FROM face_templates WHERE template_id IN (
+                    SELECT template_id FROM face_templates WHERE faculty_id = ?
+                    ORDER BY (source = 'enroll') DESC, template_id DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (faculty_id, max_templates))
+        change_id = _own_change_id(cursor, faculty_id)
+        conn.commit()
+    _notify_embedding_change('upsert', faculty_id, embeddings[-1], db_path, change_id)
+    return len(embeddings)
+
+def delete_face_templates(faculty_id: str, template_ids=None, db_path='attendance.db') -> int:
+    """
+    Delete the given extra templates of a faculty (all of them when template_ids
+    is None). The primary embedding is kept. Returns the number deleted.
+    """
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        if template_ids is None:
+            cursor.execute("DELETE FROM face_templates WHERE faculty_id = ?", (faculty_id,))
+        else:
+            cursor.executemany("DELETE FROM face_templates WHERE faculty_id = ? AND template_id = ?",
+                               [(faculty_id, template_id) for template_id in template_ids])
+        deleted = cursor.rowcount
+        change_id = _own_change_id(cursor, faculty_id)
         conn.commit()
-        return cursor.rowcount > 0
+    if deleted:
+        _notify_embedding_change('upsert', faculty_id, None, db_path, change_id)
+    return deleted
+
+def get_template_info(faculty_id: str, db_path='attendance.db') -> List[Dict]:
+    """Return template_id, source, created_on and model_version of a faculty's extra templates (no BLOBs)."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT template_id, source, created_on, model_version FROM face_templates "
+                       "WHERE faculty_id = ? ORDER BY template_id", (faculty_id,))
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def get_last_template_time(faculty_id: str, source='capture', db_path='attendance.db') -> Optional[str]:
+    """ISO timestamp of the faculty's newest template from source, or None."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(created_on) FROM face_templates WHERE faculty_id = ? AND source = ?", (faculty_id, source))
+        return cursor.fetchone()[0]
+
+def get_face_templates(db_path='attendance.db') -> List[Tuple[str, bytes]]:
+    """Return (faculty_id, embedding) for every extra template of the current model, grouped by faculty."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT faculty_id, embedding FROM face_templates WHERE {_CURRENT_MODEL} ORDER BY faculty_id, template_id",
+                       _model_params())
+        return cursor.fetchall()
+
+def get_faculty_templates(faculty_id: str, db_path='attendance.db') -> List[bytes]:
+    """Return one faculty's current-model embeddings: the primary face_embedding first, then its templates."""
+    params = _model_params()
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT face_embedding FROM faculty WHERE faculty_id = ? AND face_embedding IS NOT NULL AND {_CURRENT_MODEL}",
+                       (faculty_id,) + params)
+        primary = [row[0] for row in cursor.fetchall()]
+        if not primary:
+            return []
+        cursor.execute(f"SELECT embedding FROM face_templates WHERE faculty_id = ? AND {_CURRENT_MODEL} ORDER BY template_id",
+                       (faculty_id,) + params)
+        return primary + [row[0] for row in cursor.fetchall()]
+
+def get_face_template_count(db_path='attendance.db') -> int:
+    """Number of current-model embeddings (primary + templates) for faculty with a current-model primary embedding."""
+    params = _model_params()
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT (SELECT COUNT(*) FROM faculty WHERE face_embedding IS NOT NULL AND {_CURRENT_MODEL}) +
+                   (SELECT COUNT(*) FROM face_templates t JOIN faculty f ON f.faculty_id = t.faculty_id
+                    WHERE f.face_embedding IS NOT NULL
+                      AND COALESCE(f.model_version, ?) = ? AND COALESCE(t.model_version, ?) = ?)
+        ''', params * 3)
+        return cursor.fetchone()[0]
 
 def get_faculty_count(db_path='attendance.db') -> int:
     with get_connection(db_path) as conn:
@@ -219,6 +524,28 @@ def create_attendance(attendance_data: Dict, db_path='attendance.db') -> bool:
         print(f"Error creating attendance: {e}")
         return False
 
+def create_attendance_bulk(records: List[Dict], db_path='attendance.db') -> int:
+    """Insert many attendance rows in a single transaction. Returns rows written."""
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO attendance (faculty_id, date, time, location, status, recorded_on)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(
+                r['faculty_id'],
+                r['date'],
+                r['time'],
+                r['location'],
+                r['status'],
+                r.get('recorded_on', datetime.now().isoformat())
+            ) for r in records])
+            conn.commit()
+            return len(records)
+    except Exception as e:
+        print(f"Error creating attendance: {e}")
+        return 0
+
 def get_attendance_by_faculty(faculty_id: str, db_path='attendance.db') -> List[Dict]:
     with get_connection(db_path) as conn:
         cursor = conn.cursor()
@@ -233,6 +560,13 @@ def get_attendance_by_date(date, db_path='attendance.db') -> List[Dict]:
         columns = [desc[0] for desc in cursor.description]
         return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+def has_attendance_on(faculty_id: str, date, db_path='attendance.db') -> bool:
+    """Cheap indexed check for an existing attendance row on a given date."""
+    with get_connection(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM attendance WHERE date = ? AND faculty_id = ? LIMIT 1", (date, faculty_id))
+        return cursor.fetchone() is not None
+
 def get_attendance_stats(db_path='attendance.db') -> Dict[str, int]:
     with get_connection(db_path) as conn:
         cursor = conn.cursor()
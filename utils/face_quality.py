@@ -0,0 +1,110 @@
+import os
+import threading
+import cv2
+import numpy as np
+from typing import Dict, List, Optional
+
+# Set QUALITY_GATE=0 to send every detected crop to FaceNet
+QUALITY_GATE = os.environ.get('QUALITY_GATE', '1') != '0'
+
+# Smallest face side (pixels) worth embedding; defaults to the detector's DETECT_MIN_FACE so
+# every face the detector accepts passes the size check (a larger value drops kiosk-distance faces)
+QUALITY_MIN_FACE = int(os.environ.get('QUALITY_MIN_FACE', os.environ.get('DETECT_MIN_FACE', 48)))
+
+# Minimum variance of the Laplacian; motion-blurred crops score far below sharp ones
+QUALITY_MIN_SHARPNESS = float(os.environ.get('QUALITY_MIN_SHARPNESS', 40))
+
+# Accepted mean gray level range
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get('QUALITY_MIN_BRIGHTNESS', 40))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get('QUALITY_MAX_BRIGHTNESS', 215))
+
+# Minimum gray level standard deviation
+QUALITY_MIN_CONTRAST = float(os.environ.get('QUALITY_MIN_CONTRAST', 15))
+
+# Crops are scored on a grayscale copy of this size so thresholds don't depend on resolution
+QUALITY_SCORE_SIDE = 112
+
+# Reason codes, in the order they are checked
+TOO_SMALL = 'too_small'
+BLURRY = 'blurry'
+TOO_DARK = 'too_dark'
+TOO_BRIGHT = 'too_bright'
+LOW_CONTRAST = 'low_contrast'
+
+_lock = threading.Lock()
+_stats = {'checked': 0, 'passed': 0, 'rejected': {}}
+
+
+def score_faces(crops) -> Dict[str, np.ndarray]:
+    """
+    Score a list of BGR (or grayscale) face crops in one vectorized pass.
+    Returns arrays of size, sharpness, brightness and contrast, one entry per crop.
+    """
+    sizes = np.array([min(crop.shape[:2]) for crop in crops], dtype=np.float32)
+    grays = np.stack([
+        cv2.resize(crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY),
+                   (QUALITY_SCORE_SIDE, QUALITY_SCORE_SIDE), interpolation=cv2.INTER_AREA)
+        for crop in crops
+    ]).astype(np.float32)
+
+    # 4-neighbour Laplacian over the whole stack (same kernel as cv2.Laplacian, ksize=1)
+    laplacian = (grays[:, :-2, 1:-1] + grays[:, 2:, 1:-1] + grays[:, 1:-1, :-2] + grays[:, 1:-1, 2:]
+                 - 4 * grays[:, 1:-1, 1:-1])
+    return {
+        'size': sizes,
+        'sharpness': laplacian.var(axis=(1, 2)),
+        'brightness': grays.mean(axis=(1, 2)),
+        'contrast': grays.std(axis=(1, 2)),
+    }
+
+
+def check_faces(crops) -> List[Optional[str]]:
+    """
+    Quality-gate a list of face crops. Returns one entry per crop: None when the
+    crop is good enough to embed, otherwise the reason code it was rejected for.
+    """
+    if not crops:
+        return []
+    if not QUALITY_GATE:
+        return [None] * len(crops)
+
+    scores = score_faces(crops)
+    checks = [
+        (TOO_SMALL, scores['size'] < QUALITY_MIN_FACE),
+        (BLURRY, scores['sharpness'] < QUALITY_MIN_SHARPNESS),
+        (TOO_DARK, scores['brightness'] < QUALITY_MIN_BRIGHTNESS),
+        (TOO_BRIGHT, scores['brightness'] > QUALITY_MAX_BRIGHTNESS),
+        (LOW_CONTRAST, scores['contrast'] < QUALITY_MIN_CONTRAST),
+    ]
+    reasons = [None] * len(crops)
+    for reason, failed in reversed(checks):  # first failing check wins
+        for idx in np.flatnonzero(failed):
+            reasons[idx] = reason
+
+    with _lock:
+        _stats['checked'] += len(crops)
+        for reason in reasons:
+            if reason is None:
+                _stats['passed'] += 1
+            else:
+                _stats['rejected'][reason] = _stats['rejected'].get(reason, 0) + 1
+    return reasons
+
+
+def check_face(face_img) -> Optional[str]:
+    """
+    Quality-gate a single face crop. Returns None or the rejection reason code.
+    """
+    return check_faces([face_img])[0]
+
+
+def quality_stats() -> Dict:
+    """
+    Counters for the dashboard: every rejected crop is one FaceNet forward pass saved.
+    """
+    with _lock:
+        stats = dict(_stats, rejected=dict(_stats['rejected']))
+    stats['inference_saved'] = sum(stats['rejected'].values())
+    stats['saved_rate'] = round(stats['inference_saved'] / stats['checked'], 3) if stats['checked'] else 0.0
+    stats['enabled'] = QUALITY_GATE
+    return stats
@@ -1,26 +1,122 @@
+import os
+import time
+import threading
 import numpy as np
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 from werkzeug.datastructures import FileStorage
-from utils.db_handler import get_all_faculty
-from face_utils import get_embedding_from_image
-from scipy.spatial.distance import cosine
+from utils.ann_index import search, search_batch
+from utils.gallery import get_gallery, MAX_FACE_TEMPLATES
+from utils.db_handler import add_face_templates, get_last_template_time
+from face_utils import get_embedding_from_image, get_all_embeddings_from_image
+from utils.recognition_cache import recognition_cache, upload_digest
 
 # Set similarity threshold for FaceNet embeddings (tunable based on testing)
 THRESHOLD = 0.6
 
+# Verified captures at least this similar are kept as extra templates (0 disables learning)
+TEMPLATE_LEARN_THRESHOLD = float(os.environ.get('TEMPLATE_LEARN_THRESHOLD', 0.8))
+
+# ...unless they are this close to an existing template and add nothing new
+TEMPLATE_DUPLICATE_THRESHOLD = float(os.environ.get('TEMPLATE_DUPLICATE_THRESHOLD', 0.95))
+
+# Learn at most one capture template per faculty in this many hours
+TEMPLATE_LEARN_INTERVAL_HOURS = float(os.environ.get('TEMPLATE_LEARN_INTERVAL_HOURS', 24))
+
+# Template writes happen here, off the request thread, one at a time
+_learner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='template-learner')
+_learn_attempts = {}  # faculty_id -> monotonic time of the last accepted learning attempt in this process
+_learn_lock = threading.Lock()
+
+
 def l2_normalize(x):
     """
     Normalize a vector using L2 norm.
     """
     return x / np.linalg.norm(x)
 
-def cosine_similarity(embedding1, embedding2):
+
+def _cached_upload_embedding(image_file: FileStorage, digest: str):
+    """
+    Embedding for an upload, reusing the result of an identical earlier upload.
+    """
+    key = ('embedding', digest)
+    embedding = recognition_cache.get(key, default=False)
+    if embedding is False:
+        embedding = get_embedding_from_image(image_file)
+        recognition_cache.set(key, embedding)
+    return embedding
+
+
+def match_embedding(embedding: np.ndarray, faculty_id: str = None) -> Tuple[Optional[str], float]:
     """
-    Compute cosine similarity between two embeddings.
+    Match one embedding: 1:1 against faculty_id when given, otherwise 1:N.
+    Returns (matched faculty_id or None, similarity).
     """
-    return 1 - cosine(embedding1, embedding2)
+    embedding = l2_normalize(embedding)
+    if faculty_id:
+        similarity = get_gallery().score(faculty_id, embedding)
+        if similarity is None:
+            return None, 0.0
+        return (faculty_id if similarity >= THRESHOLD else None), similarity
+
+    matches = search(embedding, THRESHOLD)
+    if not matches:
+        return None, 0.0
+    return matches[0]
+
 
-def recognize_faces(image_file: FileStorage) -> List[str]:
+def learn_template(faculty_id: str, embedding: np.ndarray, similarity: float) -> bool:
+    """
+    Keep a confidently verified capture as an extra template for the faculty, so
+    later attempts in similar conditions (lighting, glasses, angle) match first time.
+    Near-duplicates of an existing template are skipped, and a faculty learns at
+    most one capture template per TEMPLATE_LEARN_INTERVAL_HOURS.
+    """
+    if not TEMPLATE_LEARN_THRESHOLD or embedding is None:
+        return False
+    if not TEMPLATE_LEARN_THRESHOLD <= similarity < TEMPLATE_DUPLICATE_THRESHOLD:
+        return False
+    last = get_last_template_time(faculty_id, source='capture')
+    if last and datetime.fromisoformat(last) > datetime.now() - timedelta(hours=TEMPLATE_LEARN_INTERVAL_HOURS):
+        return False
+    template = l2_normalize(np.asarray(embedding, dtype=np.float32)).astype(np.float32)
+    added = add_face_templates(faculty_id, [template.tobytes()], source='capture', max_templates=MAX_FACE_TEMPLATES) > 0
+    if added:
+        print(f"🧩 Learned new template for {faculty_id} (similarity {similarity:.4f})")
+    return added
+
+
+def schedule_template_learning(faculty_id: str, embedding: np.ndarray, similarity: float) -> bool:
+    """
+    Call once attendance for a verified capture has been recorded: learn_template
+    runs in the background, so the template write (and the gallery update it
+    triggers) stays off the request path. Returns True if learning was queued.
+    """
+    if not TEMPLATE_LEARN_THRESHOLD or embedding is None:
+        return False
+    if not TEMPLATE_LEARN_THRESHOLD <= similarity < TEMPLATE_DUPLICATE_THRESHOLD:
+        return False
+    now = time.monotonic()
+    with _learn_lock:
+        # Cheap in-process guard; learn_template checks the database across processes
+        last = _learn_attempts.get(faculty_id)
+        if last is not None and now - last < TEMPLATE_LEARN_INTERVAL_HOURS * 3600:
+            return False
+        _learn_attempts[faculty_id] = now
+    _learner.submit(_learn_in_background, faculty_id, np.array(embedding, dtype=np.float32), similarity)
+    return True
+
+
+def _learn_in_background(faculty_id, embedding, similarity):
+    try:
+        learn_template(faculty_id, embedding, similarity)
+    except Exception as e:
+        print(f"❌ Template learning failed for {faculty_id}: {e}")
+
+
+def recognize_faces(image_file: FileStorage, idempotency_key: str = None) -> List[str]:
     """
     Recognize faculty from the uploaded image using FaceNet embeddings.
     Returns a list of recognized faculty IDs.
@@ -30,7 +126,13 @@ def recognize_faces(image_file: FileStorage) -> List[str]:
         return []
 
     try:
-        uploaded_embedding = get_embedding_from_image(image_file)
+        digest = upload_digest(image_file, idempotency_key)
+        cached = recognition_cache.get(('recognize', digest))
+        if cached is not None:
+            print(f"♻️ Cached recognition result: {cached}")
+            return list(cached)
+
+        uploaded_embedding = _cached_upload_embedding(image_file, digest)
 
         if uploaded_embedding is None or not isinstance(uploaded_embedding, np.ndarray):
             print("⚠️ No face or invalid embedding from uploaded image.")
@@ -39,32 +141,100 @@ def recognize_faces(image_file: FileStorage) -> List[str]:
         uploaded_embedding = l2_normalize(uploaded_embedding)
         print("🔬 Uploaded embedding shape:", uploaded_embedding.shape)
 
-        all_faculty = get_all_faculty()
-        recognized_ids = []
+        matches = search(uploaded_embedding, THRESHOLD)
+        for faculty_id, similarity in matches:
+            print(f"✅ Match found: {faculty_id} – Similarity: {similarity:.4f}")
 
-        for faculty in all_faculty:
-            if not faculty.get('face_embedding'):
-                continue
+        recognized_ids = [faculty_id for faculty_id, _ in matches]
 
-            stored_embedding = np.frombuffer(faculty['face_embedding'], dtype=np.float32)
+        print(f"🎯 Final recognized faculty IDs: {recognized_ids}")
+        print("📸 Raw uploaded embedding (first 5):", uploaded_embedding[:5])
+        recognition_cache.set(('recognize', digest), list(recognized_ids))
+        return recognized_ids
 
-            if stored_embedding.shape != uploaded_embedding.shape:
-                print(f"⚠️ Shape mismatch for {faculty['faculty_id']} – skipping.")
-                continue
+    except Exception as e:
+        print(f"❌ Error in face recognition: {str(e)}")
+        return []
 
-            stored_embedding = l2_normalize(stored_embedding)
-            similarity = cosine_similarity(uploaded_embedding, stored_embedding)
 
-            print(f"🔍 Comparing with {faculty['name']} (ID: {faculty['faculty_id']}) – Similarity: {similarity:.4f}")
+def recognize_all_faces(image_file: FileStorage) -> List[Dict]:
+    """
+    Recognize every face in a group photo. All crops are embedded in one batch and
+    matched against the gallery in one matrix operation.
+    Returns a list of {'faculty_id', 'similarity', 'box'} for matched faces.
+    """
+    if not image_file or not image_file.filename:
+        print("⚠️ No file uploaded.")
+        return []
 
-            if similarity >= THRESHOLD:
-                print(f"✅ Match found: {faculty['faculty_id']}")
-                recognized_ids.append(faculty['faculty_id'])
+    try:
+        boxes, embeddings = get_all_embeddings_from_image(image_file)
+        if embeddings is None or len(embeddings) == 0:
+            return []
 
-        print(f"🎯 Final recognized faculty IDs: {recognized_ids}")
-        print("📸 Raw uploaded embedding (first 5):", uploaded_embedding[:5])
-        return recognized_ids
+        matches = search_batch(embeddings, THRESHOLD)
+        recognized = []
+        for box, match in zip(boxes, matches):
+            if match is None:
+                continue
+            faculty_id, similarity = match
+            print(f"✅ Match found: {faculty_id} – Similarity: {similarity:.4f}")
+            recognized.append({'faculty_id': faculty_id, 'similarity': similarity, 'box': list(box)})
+
+        print(f"🎯 Recognized {len(recognized)} of {len(boxes)} face(s).")
+        return recognized
 
     except Exception as e:
         print(f"❌ Error in face recognition: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+
+def verify_face(image_file: FileStorage, faculty_id: str, idempotency_key: str = None,
+                with_embedding: bool = False) -> Tuple:
+    """
+    1:1 verification: compare the uploaded face only against the claimed faculty's
+    stored templates. Returns (matched, similarity); similarity is None when no
+    usable face was found in the image. With with_embedding, the probe embedding
+    (or None) is returned as a third element, e.g. for schedule_template_learning
+    once the attendance row is stored.
+    """
+    matched, similarity, embedding = _verify_face(image_file, faculty_id, idempotency_key)
+    return (matched, similarity, embedding) if with_embedding else (matched, similarity)
+
+
+def _verify_face(image_file, faculty_id, idempotency_key):
+    if not image_file or not image_file.filename:
+        print("⚠️ No file uploaded.")
+        return False, None, None
+
+    try:
+        if get_gallery().get(faculty_id) is None:
+            print(f"⚠️ No stored embedding for {faculty_id}.")
+            return False, 0.0, None
+
+        digest = upload_digest(image_file, idempotency_key)
+        cached = recognition_cache.get(('verify', digest, faculty_id))
+        if cached is not None:
+            print(f"♻️ Cached verification result for {faculty_id}: {cached}")
+            return cached + (recognition_cache.get(('embedding', digest)),)
+
+        uploaded_embedding = _cached_upload_embedding(image_file, digest)
+        if uploaded_embedding is None or not isinstance(uploaded_embedding, np.ndarray):
+            print("⚠️ No face or invalid embedding from uploaded image.")
+            recognition_cache.set(('verify', digest, faculty_id), (False, None))
+            return False, None, None
+
+        uploaded_embedding = l2_normalize(uploaded_embedding)
+        similarity = get_gallery().score(faculty_id, uploaded_embedding)
+        if similarity is None:
+            print(f"⚠️ Shape mismatch for {faculty_id}.")
+            return False, 0.0, None
+
+        print(f"🔍 Verifying {faculty_id} – Similarity: {similarity:.4f}")
+        result = (similarity >= THRESHOLD, similarity)
+        recognition_cache.set(('verify', digest, faculty_id), result)
+        return result + (uploaded_embedding,)
+
+    except Exception as e:
+        print(f"❌ Error in face verification: {str(e)}")
+        return False, None, None
@@ -0,0 +1,154 @@
+import os
+import itertools
+import numpy as np
+from typing import List, Dict
+from face_utils import detect_faces, preprocess_face, embed_faces
+from utils.face_quality import check_faces
+from utils.face_recognition import match_embedding
+
+# Minimum IoU for a detection to continue an existing track
+TRACK_IOU_THRESHOLD = float(os.environ.get('TRACK_IOU_THRESHOLD', 0.3))
+
+# Frames a track survives without a matching detection
+TRACK_MAX_MISSED = int(os.environ.get('TRACK_MAX_MISSED', 5))
+
+# Re-embed an identified track every this many frames
+TRACK_REFRESH_FRAMES = int(os.environ.get('TRACK_REFRESH_FRAMES', 30))
+
+# Retry an unidentified track every this many frames
+TRACK_RETRY_FRAMES = int(os.environ.get('TRACK_RETRY_FRAMES', 5))
+
+
+def iou_matrix(boxes_a, boxes_b) -> np.ndarray:
+    """
+    Pairwise intersection-over-union of two lists of (x, y, w, h) boxes.
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class Track:
+    """
+    A face followed across frames, with the identity from its last embedding.
+    """
+    __slots__ = ('track_id', 'box', 'faculty_id', 'similarity', 'embedding', 'last_embedded', 'missed', 'age', 'quality')
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.faculty_id = None
+        self.similarity = 0.0
+        self.embedding = None
+        self.last_embedded = None
+        self.missed = 0
+        self.age = 0
+        self.quality = None
+
+
+class FaceTracker:
+    """
+    Associates face boxes across frames by greedy IoU matching so FaceNet runs
+    once per new track (plus an occasional refresh) instead of on every frame.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED,
+                 refresh_frames=TRACK_REFRESH_FRAMES, retry_frames=TRACK_RETRY_FRAMES):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.refresh_frames = refresh_frames
+        self.retry_frames = retry_frames
+        self.tracks = []
+        self.frame_index = 0
+        self._ids = itertools.count(1)
+        self._stats = {'frames': 0, 'tracks_started': 0, 'embeddings_run': 0, 'embeddings_skipped': 0,
+                       'quality_rejected': 0}
+
+    def update(self, boxes) -> List[Track]:
+        """
+        Advance one frame. Returns the tracks seen in this frame, largest first.
+        """
+        self.frame_index += 1
+        self._stats['frames'] += 1
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        seen = []
+
+        unmatched = set(range(len(boxes)))
+        if self.tracks and boxes:
+            overlaps = iou_matrix([t.box for t in self.tracks], boxes)
+            for flat in np.argsort(-overlaps, axis=None):
+                ti, bi = divmod(int(flat), len(boxes))
+                if overlaps[ti, bi] < self.iou_threshold:
+                    break
+                track = self.tracks[ti]
+                if bi not in unmatched or track in seen:
+                    continue
+                track.box = boxes[bi]
+                track.missed = 0
+                track.age += 1
+                unmatched.discard(bi)
+                seen.append(track)
+
+        for track in self.tracks:
+            if track not in seen:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        for bi in sorted(unmatched):
+            track = Track(next(self._ids), boxes[bi])
+            self.tracks.append(track)
+            seen.append(track)
+            self._stats['tracks_started'] += 1
+
+        return sorted(seen, key=lambda t: t.box[2] * t.box[3], reverse=True)
+
+    def needs_embedding(self, track) -> bool:
+        if track.last_embedded is None:
+            return True
+        interval = self.refresh_frames if track.faculty_id else self.retry_frames
+        return self.frame_index - track.last_embedded >= interval
+
+    def set_identity(self, track, embedding, faculty_id, similarity):
+        track.embedding = embedding
+        track.faculty_id = faculty_id
+        track.similarity = similarity
+        track.last_embedded = self.frame_index
+
+    def recognize(self, frame, faculty_id=None, roi=None) -> List[Track]:
+        """
+        Detect faces (within roi, if given), advance the tracks and embed (in one
+        batch) only the tracks that are new or due for a refresh. Other tracks
+        keep their identity. Crops that fail the quality gate are retried on the
+        next frame.
+        """
+        tracks = self.update(detect_faces(frame, roi=roi))
+        pending = [t for t in tracks if self.needs_embedding(t)]
+        self._stats['embeddings_skipped'] += len(tracks) - len(pending)
+        if not pending:
+            return tracks
+
+        crops = [frame[y:y+h, x:x+w] for x, y, w, h in (t.box for t in pending)]
+        for track, reason in zip(pending, check_faces(crops)):
+            track.quality = reason
+        self._stats['quality_rejected'] += sum(1 for t in pending if t.quality)
+        crops = [crop for crop, track in zip(crops, pending) if not track.quality]
+        pending = [track for track in pending if not track.quality]
+        if not pending:
+            return tracks
+
+        embeddings = embed_faces(np.concatenate([preprocess_face(crop) for crop in crops], axis=0))
+        self._stats['embeddings_run'] += len(pending)
+        for track, embedding in zip(pending, embeddings):
+            matched_id, similarity = match_embedding(embedding, faculty_id)
+            self.set_identity(track, embedding, matched_id, similarity)
+        return tracks
+
+    def stats(self) -> Dict:
+        return dict(self._stats, active_tracks=len(self.tracks))
+
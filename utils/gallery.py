@@ -0,0 +1,462 @@
+import os
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import numpy as np
+from typing import List, Tuple, Optional
+from utils.db_handler import (
+    get_faculty_embeddings, get_faculty_embedding_ids, get_face_templates,
+    get_faculty_templates, get_face_template_count, register_embedding_listener
+)
+from utils.packed_gallery import PACKED_GALLERY, PackedGallery, PackedSnapshot, get_packed_gallery
+from utils.db_changes import subscribe
+from utils.quantization import GALLERY_QUANTIZATION, QuantizedRows, faculty_scores, nbytes
+
+# Extra templates kept per faculty on top of the primary enrollment embedding
+MAX_FACE_TEMPLATES = int(os.environ.get('MAX_FACE_TEMPLATES', 5))
+
+# Above this many faculty changed at once (e.g. a bulk enrollment), reload instead of syncing one by one
+GALLERY_RESYNC_LIMIT = int(os.environ.get('GALLERY_RESYNC_LIMIT', 256))
+
+# How often (seconds) a worker checks the packed file for a generation published by another process
+GALLERY_REFRESH_SECONDS = float(os.environ.get('GALLERY_REFRESH_SECONDS', 1.0))
+
+
+def as_unit_vector(embedding) -> Optional[np.ndarray]:
+    """
+    Convert a BLOB or array embedding to a contiguous L2-normalized float32 vector.
+    """
+    if embedding is None:
+        return None
+    if isinstance(embedding, (bytes, bytearray, memoryview)):
+        vector = np.frombuffer(embedding, dtype=np.float32)
+    else:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    if vector.size == 0 or norm == 0:
+        return None
+    return np.ascontiguousarray(vector / norm, dtype=np.float32)
+
+
+def as_template_matrix(embeddings) -> Optional[np.ndarray]:
+    """
+    Convert one embedding or a list of embeddings (BLOBs or arrays) to a (k, d)
+    matrix of unit vectors. Unusable or mismatched entries are dropped.
+    """
+    if embeddings is None:
+        return None
+    if isinstance(embeddings, np.ndarray) and embeddings.ndim == 2:
+        embeddings = list(embeddings)
+    elif isinstance(embeddings, (bytes, bytearray, memoryview, np.ndarray)):
+        embeddings = [embeddings]
+    vectors = [v for v in (as_unit_vector(e) for e in embeddings) if v is not None]
+    vectors = [v for v in vectors if v.shape == vectors[0].shape]
+    return np.vstack(vectors) if vectors else None
+
+
+def claim_matches(candidates, count) -> List[Optional[Tuple[str, float]]]:
+    """
+    Score-ordered claiming for group photos: take (probe index, faculty_id,
+    similarity) candidates strongest first, giving each probe at most one faculty
+    and each faculty at most one probe. A probe whose best faculty went to a
+    closer face falls through to its next candidate.
+    """
+    results = [None] * count
+    claimed = set()
+    for probe, faculty_id, similarity in sorted(candidates, key=lambda c: (-c[2], c[0])):
+        if results[probe] is None and faculty_id not in claimed:
+            claimed.add(faculty_id)
+            results[probe] = (faculty_id, float(similarity))
+    return results
+
+
+def load_embeddings_from_db(db_path='attendance.db') -> Tuple[List[str], np.ndarray]:
+    """
+    Parse every stored embedding BLOB (primary plus extra templates) into
+    (row ids, unit-vector matrix), with each faculty's rows contiguous.
+    """
+    primaries = get_faculty_embeddings(db_path)
+    enrolled = {faculty_id for faculty_id, _ in primaries}
+    templates = [(faculty_id, blob) for faculty_id, blob in get_face_templates(db_path) if faculty_id in enrolled]
+
+    groups = {}
+    dim = None
+    for faculty_id, blob in primaries + templates:
+        vector = as_unit_vector(blob)
+        if vector is None:
+            continue
+        if dim is None:
+            dim = vector.shape[0]
+        if vector.shape[0] != dim:
+            print(f"⚠️ Shape mismatch for {faculty_id} – skipping.")
+            continue
+        groups.setdefault(faculty_id, []).append(vector)
+
+    ids = [faculty_id for faculty_id, vectors in groups.items() for _ in vectors]
+    vectors = [vector for group in groups.values() for vector in group]
+    matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    return ids, np.ascontiguousarray(matrix, dtype=np.float32)
+
+
+class FaceGallery:
+    """
+    Process-wide cache of enrolled faculty embeddings.
+
+    Every faculty has one or more templates (the primary enrollment embedding
+    plus up to MAX_FACE_TEMPLATES extra ones). All templates live in one
+    pre-normalized contiguous float32 matrix, each faculty's rows contiguous,
+    with a parallel array of row owners and the start row of every faculty.
+    1:N matching is a single matrix-vector product followed by a segmented max
+    (np.maximum.reduceat). Updates swap in a new snapshot, so readers never lock.
+
+    With PACKED_GALLERY, every worker maps the same packed file instead of holding
+    its own copy, so memory stays flat as workers are added. Changes are published
+    to the file as a new generation, and each worker remaps within
+    GALLERY_REFRESH_SECONDS of the change. Tombstoned rows stay in the mapping as
+    dead segments that never match.
+
+    With GALLERY_QUANTIZATION set to float16 or int8, the compressed codes are
+    the only per-process copy: they are scanned instead, and only the top
+    candidates are re-scored from the float32 rows, which stay file-backed (the
+    packed file, or a private one when PACKED_GALLERY is off). Rows appended in
+    place are quantized on their own; only a new epoch re-quantizes everything.
+    """
+
+    def __init__(self, db_path='attendance.db', quantization=GALLERY_QUANTIZATION):
+        self.db_path = db_path
+        self.quantization = quantization
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._generation = None
+        self._epoch = None
+        self._checked_at = 0.0
+        self._private = None
+        self._codes = QuantizedRows(quantization)
+        self._set_state([], np.empty((0, 0), dtype=np.float32))
+
+    def _set_state(self, row_ids, matrix, epoch=None):
+        row_ids = np.asarray(row_ids, dtype=object)
+        starts = np.flatnonzero(np.r_[True, row_ids[1:] != row_ids[:-1]]) if len(row_ids) else np.empty(0, dtype=np.intp)
+        faculty_ids = row_ids[starts]
+        positions = {}
+        for segment, faculty_id in enumerate(faculty_ids):
+            if faculty_id is None:
+                continue
+            if faculty_id in positions:
+                # Caught mid-replace with the old rows still alive: the newer run wins
+                faculty_ids[positions[faculty_id]] = None
+            positions[faculty_id] = segment
+        valid = np.array([faculty_id is not None for faculty_id in faculty_ids], dtype=bool)
+
+        if epoch is None or epoch != self._epoch or len(row_ids) < self._codes.count:
+            self._codes = QuantizedRows(self.quantization)
+        self._epoch = epoch
+        quantized = self._codes.extend(matrix[self._codes.count:])
+        self._state = (row_ids, matrix, faculty_ids, starts, positions, quantized, valid)
+
+    def _store(self):
+        """
+        The file the float32 rows live in: the shared packed file, a private one
+        when only the quantized codes should take memory, or None to keep them in RAM.
+        """
+        if PACKED_GALLERY:
+            return get_packed_gallery(self.db_path)
+        if self.quantization == 'none':
+            return None
+        if self._private is None or self._private[0] != os.getpid():
+            directory = tempfile.mkdtemp(prefix='gallery-')
+            atexit.register(_remove_private_store, directory, os.getpid())
+            self._private = (os.getpid(), PackedGallery(os.path.join(directory, 'gallery.packed'), db_path=self.db_path))
+        return self._private[1]
+
+    def _snapshot(self):
+        if not self._loaded:
+            self.reload()
+        elif PACKED_GALLERY and time.monotonic() - self._checked_at >= GALLERY_REFRESH_SECONDS:
+            self.refresh()
+        return self._state
+
+    def refresh(self) -> bool:
+        """
+        Remap the packed file when a newer generation was published (by any process).
+        Costs a header read when nothing changed. Returns True if the gallery changed.
+        """
+        self._checked_at = time.monotonic()
+        store = self._store()
+        if store is None or store.generation() == self._generation:
+            return False
+        loaded = store.open()
+        if loaded is None:
+            return False
+        with self._lock:
+            self._set_state(loaded.ids, loaded.matrix, loaded.epoch)
+            self._generation = loaded.generation
+        return True
+
+    def reload(self):
+        """
+        Rebuild the whole matrix. With PACKED_GALLERY the packed file is memory-mapped
+        and only IDs and row counts are read from the database to check it is in sync;
+        otherwise (or when it is stale) every BLOB is parsed and the file rewritten.
+        """
+        store = self._store()
+        loaded = store.open() if PACKED_GALLERY else None
+        if loaded is not None:
+            live = [faculty_id for faculty_id in loaded.ids if faculty_id is not None]
+            if len(live) == get_face_template_count(self.db_path) and set(live) == set(get_faculty_embedding_ids(self.db_path)):
+                print(f"🗂️ Gallery mapped from {store.path}")
+            else:
+                loaded = None
+
+        if loaded is None:
+            ids, matrix = load_embeddings_from_db(self.db_path)
+            if store is not None:
+                store.write(ids, matrix)
+                # Serve from the mapping, not the parsed copy, like every other worker
+                loaded = store.open()
+            if loaded is None:
+                loaded = PackedSnapshot(ids, matrix, None, None)
+            del matrix
+
+        with self._lock:
+            self._set_state(loaded.ids, loaded.matrix, loaded.epoch)
+            self._generation = loaded.generation
+            self._checked_at = time.monotonic()
+            self._loaded = True
+        print(f"🗂️ Gallery loaded with {len(self._state[4])} faculty, {self.template_count()} template(s).")
+
+    def upsert(self, faculty_id, embeddings):
+        """
+        Replace all templates of one faculty without reloading the DB.
+        embeddings is a single embedding or a list/matrix of them.
+        """
+        vectors = as_template_matrix(embeddings)
+        if vectors is None:
+            return self.remove(faculty_id)
+        if not self._loaded:
+            return self.reload()
+
+        store = self._store()
+        if store is not None:
+            if store.append(faculty_id, vectors):
+                self.refresh()
+            return
+
+        with self._lock:
+            row_ids, matrix, _, _, positions, _, _ = self._state
+            if matrix.size and matrix.shape[1] != vectors.shape[1]:
+                print(f"⚠️ Shape mismatch for {faculty_id} – skipping.")
+                return
+            if faculty_id in positions:
+                keep = row_ids != faculty_id
+                row_ids, matrix = row_ids[keep], matrix[keep]
+            matrix = np.vstack([matrix, vectors]) if matrix.size else vectors
+            row_ids = list(row_ids) + [faculty_id] * len(vectors)
+            self._set_state(row_ids, np.ascontiguousarray(matrix, dtype=np.float32))
+
+    def remove(self, faculty_id):
+        """
+        Drop all templates of a faculty from the gallery.
+        """
+        if not self._loaded:
+            return
+        store = self._store()
+        if store is not None:
+            if store.remove(faculty_id):
+                self.refresh()
+            return
+
+        with self._lock:
+            row_ids, matrix, _, _, positions, _, _ = self._state
+            if faculty_id not in positions:
+                return
+            keep = row_ids != faculty_id
+            self._set_state(list(row_ids[keep]), np.ascontiguousarray(matrix[keep]))
+
+    def snapshot(self):
+        """
+        Return the current (row ids, matrix) pair of live rows, one row per template;
+        both are treated as read-only. Dropping tombstoned rows copies the matrix.
+        """
+        row_ids, matrix, _, starts, _, _, valid = self._snapshot()
+        if valid.all():
+            return row_ids, matrix
+        alive = np.repeat(valid, np.diff(np.r_[starts, len(row_ids)]))
+        return row_ids[alive], np.asarray(matrix[alive])
+
+    def get(self, faculty_id) -> Optional[np.ndarray]:
+        """
+        Return the (k, d) template matrix for one faculty, or None.
+        """
+        row_ids, matrix, _, starts, positions, _, _ = self._snapshot()
+        segment = positions.get(faculty_id)
+        if segment is None:
+            return None
+        end = starts[segment + 1] if segment + 1 < len(starts) else len(row_ids)
+        return matrix[starts[segment]:end]
+
+    def score(self, faculty_id, probe) -> Optional[float]:
+        """
+        1:1 similarity: the best score of the probe against one faculty's templates,
+        or None when the faculty has no (compatible) templates.
+        """
+        templates = self.get(faculty_id)
+        probe = as_unit_vector(probe)
+        if templates is None or probe is None or templates.shape[1] != probe.shape[0]:
+            return None
+        return float(np.max(templates @ probe))
+
+    def _faculty_scores(self, state, probes, threshold=None):
+        # Segmented max over each faculty's contiguous template rows, quantized scan + re-rank if enabled
+        _, matrix, _, starts, _, quantized, valid = state
+        return faculty_scores(matrix, starts, probes, threshold, quantized, valid)
+
+    def match(self, probe, threshold) -> List[Tuple[str, float]]:
+        """
+        Return (faculty_id, similarity) pairs at or above threshold, best first.
+        A faculty's similarity is its best-scoring template.
+        """
+        state = self._snapshot()
+        _, matrix, faculty_ids, _, _, _, _ = state
+        probe = as_unit_vector(probe)
+        if probe is None or matrix.size == 0 or matrix.shape[1] != probe.shape[0]:
+            return []
+
+        scores = self._faculty_scores(state, probe, threshold)[0]
+        hits = np.flatnonzero(scores >= threshold)
+        hits = hits[np.argsort(-scores[hits])]
+        return [(faculty_ids[i], float(scores[i])) for i in hits]
+
+    def match_batch(self, probes, threshold) -> List[Optional[Tuple[str, float]]]:
+        """
+        Match several probes with one matrix product. Returns, per probe, a
+        (faculty_id, similarity) at or above threshold, or None; conflicts are
+        resolved by claim_matches.
+        """
+        state = self._snapshot()
+        _, matrix, faculty_ids, _, _, _, _ = state
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim != 2 or len(probes) == 0 or matrix.size == 0 or matrix.shape[1] != probes.shape[1]:
+            return [None] * len(probes)
+
+        norms = np.linalg.norm(probes, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scores = self._faculty_scores(state, probes / norms, threshold)
+        rows, cols = np.nonzero(scores >= threshold)
+        return claim_matches(((int(i), faculty_ids[j], scores[i, j]) for i, j in zip(rows, cols)), len(probes))
+
+    def best_match(self, probe) -> Tuple[Optional[str], float]:
+        """
+        Return the single closest faculty_id and its similarity.
+        """
+        state = self._snapshot()
+        _, matrix, faculty_ids, _, positions, _, _ = state
+        probe = as_unit_vector(probe)
+        if probe is None or not positions or matrix.shape[1] != probe.shape[0]:
+            return None, 0.0
+        scores = self._faculty_scores(state, probe)[0]
+        best = int(np.argmax(scores))
+        return faculty_ids[best], float(scores[best])
+
+    def template_count(self) -> int:
+        row_ids, _, _, starts, _, _, valid = self._snapshot()
+        return int(np.diff(np.r_[starts, len(row_ids)])[valid].sum())
+
+    def memory_stats(self):
+        """
+        Sizes of the float32 matrix (and whether it is file-backed) and the quantized copy.
+        """
+        row_ids, matrix, _, _, positions, quantized, _ = self._snapshot()
+        return {
+            'faculty': len(positions),
+            'templates': self.template_count(),
+            'rows': len(row_ids),
+            'quantization': self.quantization,
+            'float32_bytes': int(matrix.nbytes),
+            'float32_mapped': isinstance(matrix, np.memmap),
+            'generation': self._generation,
+            'epoch': self._epoch,
+            'quantized_bytes': nbytes(quantized),
+        }
+
+    def __len__(self):
+        return len(self._snapshot()[4])
+
+
+def _remove_private_store(directory, pid):
+    # Forked workers inherit the atexit hook; only the creating process cleans up
+    if os.getpid() == pid:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+
+def get_gallery(db_path='attendance.db') -> FaceGallery:
+    """
+    Return the shared gallery for a database, creating it on first use.
+    """
+    key = os.path.abspath(db_path)
+    gallery = _galleries.get(key)
+    if gallery is None:
+        with _galleries_lock:
+            gallery = _galleries.setdefault(key, FaceGallery(db_path))
+    return gallery
+
+
+def _on_embedding_change(action, faculty_id, embedding, db_path, change_id=None):
+    gallery = _galleries.get(os.path.abspath(db_path))
+    if gallery is None and not PACKED_GALLERY:
+        return
+
+    # Re-read every template of the faculty: the notification only carries the newest one
+    vectors = None if action == 'delete' else as_template_matrix(get_faculty_templates(faculty_id, db_path))
+    if PACKED_GALLERY:
+        # Published even when this process has no gallery loaded: other workers map the file
+        if vectors is None:
+            published = get_packed_gallery(db_path).remove(faculty_id)
+        else:
+            published = get_packed_gallery(db_path).append(faculty_id, vectors)
+        if published and gallery is not None and gallery._loaded:
+            gallery.refresh()  # this worker sees its own change at once, others within GALLERY_REFRESH_SECONDS
+        return
+
+    if gallery is None:
+        return
+    if vectors is None:
+        gallery.remove(faculty_id)
+    else:
+        gallery.upsert(faculty_id, vectors)
+
+
+register_embedding_listener(_on_embedding_change)
+
+
+def _on_db_change(topic, keys, db_path):
+    """
+    Faculty rows changed through another connection. Usually the writer's embedding
+    listener already published them to the packed file; anything it missed (e.g. a
+    script that never imported this module, or PACKED_GALLERY off) is synced here.
+    """
+    gallery = _galleries.get(os.path.abspath(db_path))
+    if gallery is None or not gallery._loaded:
+        return
+    if keys is None or len(keys) > GALLERY_RESYNC_LIMIT:
+        gallery.reload()
+        return
+    if PACKED_GALLERY:
+        gallery.refresh()
+    for faculty_id in keys:
+        vectors = as_template_matrix(get_faculty_templates(faculty_id, db_path))
+        current = gallery.get(faculty_id)
+        if vectors is None and current is None:
+            continue
+        if vectors is not None and current is not None and vectors.shape == current.shape and np.allclose(vectors, current):
+            continue
+        _on_embedding_change('delete' if vectors is None else 'upsert', faculty_id, None, db_path)
+
+
+subscribe('faculty', _on_db_change)
@@ -0,0 +1,70 @@
+import os
+import io
+import cv2
+import numpy as np
+from PIL import Image
+
+# Decode uploads at the largest 1/2, 1/4 or 1/8 scale whose longest side is still >= this
+DECODE_MAX_SIDE = int(os.environ.get('DECODE_MAX_SIDE', 1280))
+
+_REDUCED_COLOR = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+_REDUCED_GRAYSCALE = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+
+def reduction_factor(width, height, max_side=DECODE_MAX_SIDE) -> int:
+    """
+    Largest power-of-two reduction (1, 2, 4 or 8) that keeps the longest side >= max_side.
+    """
+    longest = max(width, height)
+    factor = 1
+    while factor < 8 and max_side and longest // (factor * 2) >= max_side:
+        factor *= 2
+    return factor
+
+
+def decode_image_bytes(data, max_side=DECODE_MAX_SIDE, grayscale=False, with_scale=False):
+    """
+    Decode encoded image bytes into a contiguous BGR (or grayscale) array.
+    Large JPEGs are decoded directly at reduced scale by libjpeg, so a 12MP
+    phone photo never materializes at full resolution.
+    Returns None when the bytes cannot be decoded. With with_scale, returns
+    (image, decoded width / full width) instead, e.g. to map full-resolution
+    coordinates onto the decoded image.
+    """
+    if with_scale:
+        image = decode_image_bytes(data, max_side, grayscale)
+        if image is None:
+            return None, 1.0
+        return image, image.shape[1] / Image.open(io.BytesIO(data)).size[0]
+    if not data:
+        return None
+
+    try:
+        width, height = Image.open(io.BytesIO(data)).size  # header only
+    except Exception:
+        return None
+    factor = reduction_factor(width, height, max_side)
+
+    flags = (_REDUCED_GRAYSCALE if grayscale else _REDUCED_COLOR)[factor]
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is not None:
+        return image
+
+    # Formats OpenCV can't decode (e.g. GIF): PIL draft mode + a single conversion
+    try:
+        pil_image = Image.open(io.BytesIO(data))
+        pil_image.draft('L' if grayscale else 'RGB', (width // factor, height // factor))
+        if grayscale:
+            return np.asarray(pil_image.convert('L'))
+        return cv2.cvtColor(np.asarray(pil_image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    except Exception:
+        return None
+
+
+def decode_upload(file_obj, max_side=DECODE_MAX_SIDE, grayscale=False) -> np.ndarray:
+    """
+    Read a FileStorage/BytesIO upload and decode it with decode_image_bytes.
+    """
+    return decode_image_bytes(file_obj.read(), max_side=max_side, grayscale=grayscale)
@@ -0,0 +1,387 @@
+import os
+import abc
+import json
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional
+from utils.inference_engine import INFERENCE_ENGINE, facenet_normalizer
+from utils.model_registry import FACENET_INPUT_SHAPE, get_model, get_engine, unload, warmup
+
+# Embedding backend: 'tf' (keras_facenet), 'onnx' / 'tflite' (exported copy of the same weights) or 'stub'
+FACE_BACKEND = os.environ.get('FACE_BACKEND', 'tf').lower()
+
+# Exported model used by the onnx/tflite backends (default: models/facenet.<backend>)
+FACE_BACKEND_MODEL = os.environ.get('FACE_BACKEND_MODEL')
+
+# CPU threads for the onnx/tflite runtimes (0 = runtime default)
+FACE_BACKEND_THREADS = int(os.environ.get('FACE_BACKEND_THREADS', 0))
+
+# Weights shipped by keras_facenet; exported copies keep this version
+FACENET_VERSION = 'keras-facenet-20180402-114759'
+FACENET_DIM = 512
+
+
+class EmbeddingBackend(abc.ABC):
+    """
+    A way of turning (N, 160, 160, 3) preprocessed faces into (N, dim) raw embeddings.
+    Backends load lazily on the first embed() call; version identifies the weights,
+    so galleries built by one model are never mixed with another's probes.
+    """
+    name = None
+    # Safe to load() before fork() and share copy-on-write (serve.py)
+    preload_before_fork = True
+
+    def __init__(self):
+        self.load_seconds = None
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    @abc.abstractmethod
+    def dim(self) -> int:
+        """Embedding width."""
+
+    @property
+    @abc.abstractmethod
+    def version(self) -> str:
+        """Identifier of the weights."""
+
+    @abc.abstractmethod
+    def _load(self):
+        """Load the model (called once, under the load lock)."""
+
+    @abc.abstractmethod
+    def _embed(self, faces) -> np.ndarray:
+        """Embed a (N, 160, 160, 3) float32 batch."""
+
+    def load(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                self._load()
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                self._loaded = True
+                print(f"🧠 Loaded '{self.name}' embedding backend ({self.version}) in {self.load_seconds}s")
+
+    def embed(self, faces) -> np.ndarray:
+        self.load()
+        faces = np.asarray(faces, dtype=np.float32)
+        if faces.ndim == len(FACENET_INPUT_SHAPE):
+            faces = faces[np.newaxis, ...]
+        return self._embed(faces)
+
+    def warmup(self):
+        self.load()
+        self.embed(np.zeros((1,) + FACENET_INPUT_SHAPE, dtype=np.float32))
+
+    def status(self) -> Dict:
+        return {'backend': self.name, 'version': self.version, 'dim': self.dim,
+                'loaded': self._loaded, 'load_seconds': self.load_seconds}
+
+
+class TensorFlowBackend(EmbeddingBackend):
+    """
+    keras_facenet on TensorFlow, through the compiled engine when INFERENCE_ENGINE is on.
+    """
+    name = 'tf'
+
+    @property
+    def dim(self) -> int:
+        return FACENET_DIM
+
+    @property
+    def version(self) -> str:
+        return FACENET_VERSION
+
+    def _load(self):
+        get_model('facenet')
+
+    def _embed(self, faces) -> np.ndarray:
+        if INFERENCE_ENGINE:
+            return get_engine('facenet').embed(faces)
+        return get_model('facenet').embeddings(faces)
+
+    def warmup(self):
+        self.load()
+        warmup('facenet')
+
+
+class ExportedBackend(EmbeddingBackend):
+    """
+    An exported copy of the FaceNet weights run on CPU. The export writes a
+    <model>.json sidecar with the version, dimension and input normalization.
+    """
+    extension = None
+    # Runtimes start thread pools on load, which don't survive fork()
+    preload_before_fork = False
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or FACE_BACKEND_MODEL or os.path.join('models', f'facenet.{self.extension}')
+        self._metadata = None
+        self._normalize = None
+
+    @property
+    def metadata(self) -> Dict:
+        if self._metadata is None:
+            try:
+                with open(self.path + '.json', encoding='utf-8') as f:
+                    self._metadata = json.load(f)
+            except (OSError, ValueError):
+                self._metadata = {}
+        return self._metadata
+
+    @property
+    def dim(self) -> int:
+        return int(self.metadata.get('dim', FACENET_DIM))
+
+    @property
+    def version(self) -> str:
+        return self.metadata.get('version', FACENET_VERSION)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No exported model at {self.path} (run: python -m utils.inference_backends export)")
+        self._normalize = facenet_normalizer(self.metadata.get('fixed_image_standardization', True))
+        self._open()
+
+    @abc.abstractmethod
+    def _open(self):
+        """Start the runtime on self.path."""
+
+    @abc.abstractmethod
+    def _run(self, batch) -> np.ndarray:
+        """Run a normalized batch through the runtime."""
+
+    def _embed(self, faces) -> np.ndarray:
+        batch = np.empty(faces.shape, dtype=np.float32)
+        self._normalize(faces, batch)
+        return np.asarray(self._run(batch), dtype=np.float32)
+
+
+class OnnxBackend(ExportedBackend):
+    """
+    ONNX Runtime on the CPU execution provider. Sessions are safe to call concurrently.
+    """
+    name = 'onnx'
+    extension = 'onnx'
+
+    def _open(self):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if FACE_BACKEND_THREADS:
+            options.intra_op_num_threads = FACE_BACKEND_THREADS
+        self._session = ort.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+
+    def _run(self, batch) -> np.ndarray:
+        return self._session.run(None, {self._input_name: batch})[0]
+
+
+class TFLiteBackend(ExportedBackend):
+    """
+    TFLite interpreter (tflite_runtime when installed, so workers don't need TensorFlow).
+    An interpreter isn't thread-safe, and resizing its input is costly, so calls are serialized.
+    """
+    name = 'tflite'
+    extension = 'tflite'
+
+    def _open(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=self.path, num_threads=FACE_BACKEND_THREADS or None)
+        self._input_index = self._interpreter.get_input_details()[0]['index']
+        self._output_index = self._interpreter.get_output_details()[0]['index']
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def _run(self, batch) -> np.ndarray:
+        with self._lock:
+            if self._batch_size != len(batch):
+                self._interpreter.resize_tensor_input(self._input_index, batch.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self._interpreter.set_tensor(self._input_index, batch)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output_index).copy()
+
+
+class StubBackend(EmbeddingBackend):
+    """
+    Deterministic numpy stand-in for tests and benchmarks: a fixed random projection
+    of the 10x10 average-pooled face. Same crop, same embedding; no model files needed.
+    Its version never matches FaceNet, so it can't be mixed with a real gallery.
+    """
+    name = 'stub'
+    POOL = 16
+
+    def __init__(self, dim=FACENET_DIM, seed=0):
+        super().__init__()
+        self._dim = dim
+        self._seed = seed
+        self._projection = None
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def version(self) -> str:
+        return f'stub-{self._seed}-{self._dim}'
+
+    def _load(self):
+        height, width, channels = FACENET_INPUT_SHAPE
+        features = (height // self.POOL) * (width // self.POOL) * channels
+        rng = np.random.default_rng(self._seed)
+        self._projection = rng.standard_normal((features, self._dim))
+
+    def _embed(self, faces) -> np.ndarray:
+        n, height, width, channels = faces.shape
+        pooled = faces.reshape(n, height // self.POOL, self.POOL, width // self.POOL, self.POOL, channels).mean(axis=(2, 4))
+        # float64 keeps each row independent of BLAS blocking, i.e. of the batch it arrived in
+        return (pooled.reshape(n, -1).astype(np.float64) @ self._projection).astype(np.float32)
+
+
+BACKENDS = {
+    'tf': TensorFlowBackend,
+    'onnx': OnnxBackend,
+    'tflite': TFLiteBackend,
+    'stub': StubBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None) -> EmbeddingBackend:
+    """
+    Return the shared backend (FACE_BACKEND by default). Nothing is loaded until it embeds.
+    """
+    name = (name or FACE_BACKEND).lower()
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {name} (choose from {', '.join(BACKENDS)})")
+        with _backends_lock:
+            backend = _backends.setdefault(name, BACKENDS[name]())
+    return backend
+
+
+def reset_backends():
+    """
+    Forget the shared backends and loaded models, so the next get_backend() reads
+    the weights (and an exported model's sidecar) from disk again.
+    """
+    with _backends_lock:
+        _backends.clear()
+    unload()
+
+
+def export(fmt, output=None) -> str:
+    """
+    Export the keras_facenet weights for the onnx or tflite backend, plus the
+    metadata sidecar. Needs TensorFlow (and tf2onnx for onnx) once, at export time.
+    """
+    import tensorflow as tf
+
+    face_net = get_model('facenet')
+    model = face_net.model
+    output = output or os.path.join('models', f'facenet.{fmt}')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    if fmt == 'onnx':
+        import tf2onnx
+        spec = (tf.TensorSpec((None,) + FACENET_INPUT_SHAPE, tf.float32, name='faces'),)
+        tf2onnx.convert.from_keras(model, input_signature=spec, output_path=output)
+    elif fmt == 'tflite':
+        with open(output, 'wb') as f:
+            f.write(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    with open(output + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'version': FACENET_VERSION, 'dim': int(model.output_shape[-1]),
+                   'fixed_image_standardization': bool(face_net.metadata['fixed_image_standardization'])}, f)
+    print(f"✅ Exported FaceNet to {output}")
+    return output
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _benchmark(name, batch_size, iterations, results):
+    # Runs in a fresh process, so RSS reflects this backend's runtime alone
+    report = {'backend': name, 'rss_before_mb': _rss_mb()}
+    try:
+        backend = get_backend(name)
+        backend.warmup()
+        faces = np.random.default_rng(0).uniform(0, 255, (batch_size,) + FACENET_INPUT_SHAPE).astype(np.float32)
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            backend.embed(faces)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+        report.update(backend.status(), rss_after_mb=_rss_mb(),
+                      p50_ms=round(float(np.percentile(latencies, 50)), 2),
+                      p95_ms=round(float(np.percentile(latencies, 95)), 2))
+    except Exception as e:
+        report['error'] = str(e)
+    results.put(report)
+
+
+def benchmark(names, batch_size=16, iterations=20):
+    """
+    Load time, warm latency per batch and resident memory of each backend, each in its own process.
+    """
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    reports = []
+    for name in names:
+        results = context.Queue()
+        process = context.Process(target=_benchmark, args=(name, batch_size, iterations, results))
+        process.start()
+        reports.append(results.get())
+        process.join()
+    return reports
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Export FaceNet for other backends or compare backends.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export_parser = sub.add_parser('export', help='export the TensorFlow weights to onnx or tflite')
+    export_parser.add_argument('--format', choices=['onnx', 'tflite'], default='onnx')
+    export_parser.add_argument('--output')
+    bench_parser = sub.add_parser('bench', help='compare load time, latency and RSS per backend')
+    bench_parser.add_argument('--backends', default=','.join(BACKENDS))
+    bench_parser.add_argument('--batch', type=int, default=16)
+    bench_parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        export(args.format, args.output)
+        return
+    for report in benchmark(args.backends.split(','), args.batch, args.iterations):
+        if 'error' in report:
+            print(f"❌ {report['backend']}: {report['error']}")
+            continue
+        print(f"⚡ {report['backend']:<6} load {report['load_seconds']}s, batch of {args.batch}: "
+              f"p50 {report['p50_ms']}ms p95 {report['p95_ms']}ms, "
+              f"RSS {report['rss_before_mb']} → {report['rss_after_mb']} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Dict
+
+# Use the compiled, shape-bucketed engine instead of Keras predict()/embeddings()
+INFERENCE_ENGINE = os.environ.get('INFERENCE_ENGINE', '1').lower() in ('1', 'true', 'yes', 'on')
+
+# Fixed batch sizes the model is traced for; inputs are padded up to the nearest one
+INFERENCE_BUCKETS = tuple(sorted(int(b) for b in os.environ.get('INFERENCE_BUCKETS', '1,4,16,64').split(',')))
+
+
+class InferenceEngine:
+    """
+    Wraps a Keras model in a tf.function traced once per batch-size bucket.
+
+    Inputs are normalized straight into preallocated float32 buffers, padded to
+    the nearest bucket and run through the matching concrete function, so calls
+    never retrace and skip the per-call overhead of Model.predict().
+    """
+
+    def __init__(self, model, input_shape=(160, 160, 3), buckets=INFERENCE_BUCKETS, normalize=None):
+        import tensorflow as tf
+
+        self.input_shape = tuple(input_shape)
+        self.buckets = tuple(sorted(buckets))
+        self.normalize = normalize or _copy_into
+
+        traced = tf.function(lambda x: model(x, training=False))
+        self._functions = {
+            b: traced.get_concrete_function(tf.TensorSpec((b,) + self.input_shape, tf.float32))
+            for b in self.buckets
+        }
+        self._buffers = {b: np.zeros((b,) + self.input_shape, dtype=np.float32) for b in self.buckets}
+        self._locks = {b: threading.Lock() for b in self.buckets}
+        self._tf = tf
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'faces': 0,
+            'padded_faces': 0,
+            'total_seconds': 0.0,
+            'last_call_ms': 0.0,
+            'bucket_calls': {b: 0 for b in self.buckets},
+        }
+
+    def _bucket_for(self, n) -> int:
+        for b in self.buckets:
+            if b >= n:
+                return b
+        return self.buckets[-1]
+
+    def embed(self, faces) -> np.ndarray:
+        """
+        Embed a (N, H, W, C) batch of preprocessed faces; returns (N, D).
+        """
+        faces = np.asarray(faces)
+        if faces.ndim == len(self.input_shape):
+            faces = faces[np.newaxis, ...]
+
+        started = time.perf_counter()
+        outputs = []
+        largest = self.buckets[-1]
+        for start in range(0, len(faces), largest):
+            chunk = faces[start:start + largest]
+            n = len(chunk)
+            bucket = self._bucket_for(n)
+            with self._locks[bucket]:
+                buffer = self._buffers[bucket]
+                self.normalize(chunk, buffer[:n])
+                result = self._functions[bucket](self._tf.constant(buffer))
+                outputs.append(np.asarray(result)[:n])
+            with self._stats_lock:
+                self._stats['bucket_calls'][bucket] += 1
+                self._stats['padded_faces'] += bucket - n
+
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats['calls'] += 1
+            self._stats['faces'] += len(faces)
+            self._stats['total_seconds'] += elapsed
+            self._stats['last_call_ms'] = round(elapsed * 1000.0, 3)
+
+        return np.concatenate(outputs, axis=0) if outputs else np.empty((0, 0), dtype=np.float32)
+
+    def warmup(self):
+        """
+        Run every bucket once so the first real call hits an already-built graph.
+        """
+        for b in self.buckets:
+            with self._locks[b]:
+                self._functions[b](self._tf.constant(self._buffers[b]))
+
+    def stats(self) -> Dict:
+        """
+        Call, face and padding counters plus average latency per call.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats, bucket_calls=dict(self._stats['bucket_calls']))
+        stats['avg_call_ms'] = round(stats['total_seconds'] * 1000.0 / stats['calls'], 3) if stats['calls'] else 0.0
+        return stats
+
+
+def _copy_into(src, out):
+    out[...] = src
+
+
+def keras_facenet_normalizer(face_net):
+    """
+    Reproduce keras_facenet.FaceNet's input normalization, writing into the engine buffer.
+    """
+    return facenet_normalizer(face_net.metadata['fixed_image_standardization'])
+
+
+def facenet_normalizer(fixed_image_standardization):
+    """
+    FaceNet input normalization: fixed (x - 127.5) / 127.5 scaling or per-image
+    standardization, written into a preallocated buffer.
+    """
+    if fixed_image_standardization:
+        def normalize(src, out):
+            np.subtract(src, 127.5, out=out, dtype=np.float32)
+            out *= np.float32(1.0 / 127.5)
+    else:
+        def normalize(src, out):
+            out[...] = src
+            axes = tuple(range(1, out.ndim))
+            mean = out.mean(axis=axes, keepdims=True)
+            std = out.std(axis=axes, keepdims=True)
+            std = np.maximum(std, 1.0 / np.sqrt(out[0].size))
+            out -= mean
+            out /= std
+    return normalize
@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Dict
+
+# Route FaceNet calls through the micro-batching scheduler when enabled
+INFERENCE_SCHEDULER = os.environ.get('INFERENCE_SCHEDULER', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# Flush a batch once it holds this many face crops...
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 16))
+
+# ...or once the oldest queued crop has waited this long
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 5))
+
+
+class InferenceScheduler:
+    """
+    Collects preprocessed face batches from concurrent requests and runs them
+    through the embedding function as one larger batch.
+
+    A background thread flushes the queue when it holds max_batch_size crops or
+    when the first queued crop has waited max_wait_ms. Each submit() gets a
+    Future that resolves to the embeddings for its own crops.
+    """
+
+    def __init__(self, embed_fn, max_batch_size=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'faces': 0,
+            'batches': 0,
+            'max_batch_size_seen': 0,
+            'last_batch_size': 0,
+            'inference_seconds': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, faces) -> Future:
+        """
+        Queue a (N, H, W, C) batch of preprocessed faces; the Future resolves to (N, D) embeddings.
+        Batches larger than max_batch_size are queued in max_batch_size chunks.
+        """
+        faces = np.asarray(faces, dtype=np.float32)
+        if faces.ndim == 3:
+            faces = faces[np.newaxis, ...]
+        future = Future()
+        if len(faces) <= self.max_batch_size:
+            self._queue.put((faces, future))
+            return future
+
+        parts = [Future() for _ in range(0, len(faces), self.max_batch_size)]
+
+        def gather(_):
+            # Parts resolve one at a time on the scheduler thread; the last one completes the request
+            if future.done() or not all(part.done() for part in parts):
+                return
+            errors = [part.exception() for part in parts if part.exception() is not None]
+            if errors:
+                future.set_exception(errors[0])
+            else:
+                future.set_result(np.concatenate([part.result() for part in parts], axis=0))
+
+        for i, part in enumerate(parts):
+            part.add_done_callback(gather)
+            self._queue.put((faces[i * self.max_batch_size:(i + 1) * self.max_batch_size], part))
+        return future
+
+    def embed(self, faces) -> np.ndarray:
+        """
+        Blocking helper: submit and wait for the result.
+        """
+        return self.submit(faces).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=1)
+
+    def _run(self):
+        held = None
+        while True:
+            first = held if held is not None else self._queue.get()
+            held = None
+            if first is None:
+                return
+
+            items = [first]
+            rows = len(first[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                if rows + len(item[0]) > self.max_batch_size:
+                    held = item  # would overflow the cap: it starts the next batch
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            self._flush(items, rows)
+            if stop:
+                return
+
+    def _flush(self, items, rows):
+        started = time.perf_counter()
+        try:
+            embeddings = np.asarray(self.embed_fn(np.concatenate([faces for faces, _ in items], axis=0)))
+            offset = 0
+            for faces, future in items:
+                future.set_result(embeddings[offset:offset + len(faces)])
+                offset += len(faces)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+        with self._stats_lock:
+            self._stats['requests'] += len(items)
+            self._stats['faces'] += rows
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = rows
+            self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], rows)
+            self._stats['inference_seconds'] += time.perf_counter() - started
+
+    def stats(self) -> Dict:
+        """
+        Queue depth and batch-size counters.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch_size'] = round(stats['faces'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['max_batch_size'] = self.max_batch_size
+        stats['max_wait_ms'] = self.max_wait * 1000.0
+        return stats
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(embed_fn=None):
+    """
+    Return the process-wide scheduler, creating it with embed_fn on first use.
+    """
+    global _scheduler
+    if _scheduler is None and embed_fn is not None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(embed_fn)
+    return _scheduler
+
+
+def scheduler_stats() -> Dict:
+    """
+    Stats of the running scheduler, or just the enabled flag when none was started.
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return {'enabled': INFERENCE_SCHEDULER, 'running': False}
+    return dict(scheduler.stats(), enabled=INFERENCE_SCHEDULER, running=True)
@@ -0,0 +1,289 @@
+import io
+import os
+import json
+import time
+import socket
+import struct
+import threading
+import socketserver
+import numpy as np
+from typing import Dict, Optional
+
+# Unix socket of the shared inference server; empty = embed in-process
+INFERENCE_SERVER = os.environ.get('INFERENCE_SERVER', '')
+
+# Socket the server listens on when started without --socket
+INFERENCE_SERVER_SOCKET = INFERENCE_SERVER or os.environ.get('INFERENCE_SERVER_SOCKET', '/tmp/faculty-attendance-inference.sock')
+
+# Seconds a worker waits for an embedding before treating the server as down
+INFERENCE_SERVER_TIMEOUT = float(os.environ.get('INFERENCE_SERVER_TIMEOUT', 10))
+
+# Embed in-process while the server is unreachable (loads the model in the worker)
+INFERENCE_SERVER_FALLBACK = os.environ.get('INFERENCE_SERVER_FALLBACK', '1').lower() in ('1', 'true', 'yes', 'on')
+
+# After a failure, skip the server for this long before trying it again
+INFERENCE_SERVER_RETRY_SECONDS = float(os.environ.get('INFERENCE_SERVER_RETRY_SECONDS', 5))
+
+# Frame header: one op/status byte and the payload length
+HEADER = struct.Struct('!cI')
+OP_EMBED, OP_HEALTH = b'E', b'H'
+STATUS_OK, STATUS_ERROR = b'O', b'X'
+
+
+class InferenceServerUnavailable(ConnectionError):
+    pass
+
+
+def _recv_exact(sock, size) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise InferenceServerUnavailable('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send_frame(sock, tag, payload):
+    sock.sendall(HEADER.pack(tag, len(payload)) + payload)
+
+
+def _recv_frame(sock):
+    tag, size = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return tag, _recv_exact(sock, size)
+
+
+def _pack_array(array) -> bytes:
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.ascontiguousarray(array, dtype=np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _unpack_array(payload) -> np.ndarray:
+    return np.lib.format.read_array(io.BytesIO(payload), allow_pickle=False)
+
+
+# -- server -------------------------------------------------------------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    One worker connection: serve frames until the worker hangs up. Embeddings go
+    through the shared micro-batching scheduler, so concurrent workers batch together.
+    """
+
+    def handle(self):
+        while True:
+            try:
+                op, payload = _recv_frame(self.request)
+            except (InferenceServerUnavailable, OSError):
+                return
+            try:
+                if op == OP_EMBED:
+                    reply = _pack_array(self.server.scheduler.embed(_unpack_array(payload)))
+                elif op == OP_HEALTH:
+                    reply = json.dumps(self.server.health()).encode()
+                else:
+                    raise ValueError(f"unknown op {op!r}")
+                _send_frame(self.request, STATUS_OK, reply)
+            except OSError:
+                return
+            except Exception as e:
+                _send_frame(self.request, STATUS_ERROR, str(e).encode())
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The one process that owns the embedding model; web workers talk to it over a
+    local Unix socket instead of each loading their own copy.
+    """
+    daemon_threads = True
+
+    def __init__(self, path=INFERENCE_SERVER_SOCKET):
+        from utils.inference_backends import get_backend
+        from utils.inference_scheduler import get_scheduler
+
+        self.backend = get_backend()
+        self.scheduler = get_scheduler(self.backend.embed)
+        self.started = time.time()
+        if os.path.exists(path):
+            os.remove(path)  # stale socket from a previous run
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+
+    def health(self) -> Dict:
+        return {
+            'status': 'ok',
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started, 1),
+            'model': self.backend.status(),
+            'scheduler': self.scheduler.stats(),
+        }
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def serve(path=INFERENCE_SERVER_SOCKET):
+    """
+    Warm the model up, then bind and accept workers. Until then connecting fails
+    at once, so workers fall back instead of waiting out INFERENCE_SERVER_TIMEOUT.
+    """
+    import signal
+    from utils.inference_backends import get_backend
+
+    get_backend().warmup()
+    server = InferenceServer(path)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"🚀 Inference server ({server.backend.name}) listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("👋 Inference server stopped")
+
+
+# -- client -------------------------------------------------------------------
+
+class InferenceClient:
+    """
+    Worker side: one persistent socket per thread. Any transport failure closes
+    that socket and raises InferenceServerUnavailable.
+    """
+
+    def __init__(self, path=INFERENCE_SERVER_SOCKET, timeout=INFERENCE_SERVER_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _socket(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                raise InferenceServerUnavailable(f"cannot connect to {self.path}: {e}") from e
+            self._local.sock = sock
+        return sock
+
+    def _call(self, op, payload=b'') -> bytes:
+        sock = self._socket()
+        try:
+            _send_frame(sock, op, payload)
+            status, reply = _recv_frame(sock)
+        except (OSError, InferenceServerUnavailable) as e:
+            self.close()
+            raise InferenceServerUnavailable(str(e)) from e
+        if status != STATUS_OK:
+            raise RuntimeError(f"Inference server error: {reply.decode(errors='replace')}")
+        return reply
+
+    def embed(self, faces) -> np.ndarray:
+        return _unpack_array(self._call(OP_EMBED, _pack_array(faces)))
+
+    def health(self) -> Dict:
+        return json.loads(self._call(OP_HEALTH))
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.sock = None
+            sock.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+_down_until = 0.0
+_fallbacks = 0
+
+
+def get_client() -> InferenceClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InferenceClient(INFERENCE_SERVER)
+    return _client
+
+
+def embed_via_server(faces, fallback=None) -> np.ndarray:
+    """
+    Embed on the inference server. While it is unreachable, use fallback (in-process
+    inference) if INFERENCE_SERVER_FALLBACK allows, and retry the server after
+    INFERENCE_SERVER_RETRY_SECONDS.
+    """
+    global _down_until, _fallbacks
+    with _client_lock:
+        down = time.monotonic() < _down_until
+    if not down:
+        try:
+            return get_client().embed(faces)
+        except InferenceServerUnavailable as e:
+            with _client_lock:
+                _down_until = time.monotonic() + INFERENCE_SERVER_RETRY_SECONDS
+            print(f"⚠️ Inference server unavailable ({e})"
+                  f"{' – embedding in-process' if INFERENCE_SERVER_FALLBACK and fallback else ''}")
+            if not (INFERENCE_SERVER_FALLBACK and fallback):
+                raise
+    elif not (INFERENCE_SERVER_FALLBACK and fallback):
+        raise InferenceServerUnavailable('inference server marked down')
+    with _client_lock:
+        _fallbacks += 1
+    return fallback(faces)
+
+
+def server_status() -> Dict:
+    """
+    Health of the configured inference server as seen from this worker.
+    """
+    if not INFERENCE_SERVER:
+        return {'enabled': False}
+    with _client_lock:
+        fallbacks = _fallbacks
+    status = {'enabled': True, 'socket': INFERENCE_SERVER, 'fallbacks': fallbacks,
+              'fallback_enabled': INFERENCE_SERVER_FALLBACK}
+    try:
+        status.update(get_client().health(), reachable=True)
+    except (InferenceServerUnavailable, RuntimeError) as e:
+        status.update(status='down', reachable=False, error=str(e))
+    return status
+
+
+def check_health(path=INFERENCE_SERVER_SOCKET, timeout=2.0) -> Optional[Dict]:
+    """
+    One-off health probe (for supervisors and scripts); None when the server is down.
+    """
+    client = InferenceClient(path, timeout)
+    try:
+        return client.health()
+    except (InferenceServerUnavailable, RuntimeError):
+        return None
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Shared FaceNet inference server for web workers.')
+    parser.add_argument('--socket', default=INFERENCE_SERVER_SOCKET)
+    parser.add_argument('--health', action='store_true', help='probe a running server and exit 0 if healthy')
+    args = parser.parse_args(argv)
+
+    if args.health:
+        health = check_health(args.socket)
+        print(json.dumps(health, indent=2) if health else f"❌ No healthy inference server on {args.socket}")
+        raise SystemExit(0 if health else 1)
+    serve(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Dict
+from utils.inference_engine import INFERENCE_ENGINE, InferenceEngine, keras_facenet_normalizer
+
+# Keras FaceNet weights used by facenet_model.py
+FACENET_H5_PATH = os.environ.get('FACENET_H5_PATH', os.path.join('models', 'facenet_keras.h5'))
+
+# Input size shared by every FaceNet variant
+FACENET_INPUT_SHAPE = (160, 160, 3)
+
+
+def _load_keras_facenet():
+    from keras_facenet import FaceNet
+    return FaceNet()
+
+
+def _load_facenet_h5():
+    from keras.models import load_model
+    return load_model(FACENET_H5_PATH)
+
+
+def _warmup_keras_facenet(model, batch):
+    model.embeddings(batch)
+
+
+def _warmup_facenet_h5(model, batch):
+    model.predict(batch, verbose=0)
+
+
+def _engine_spec_keras_facenet(model):
+    return model.model, keras_facenet_normalizer(model)
+
+
+def _engine_spec_facenet_h5(model):
+    return model, None
+
+
+# name -> (loader, warmup forward pass, (keras model, input normalizer) for the engine)
+MODELS = {
+    'facenet': (_load_keras_facenet, _warmup_keras_facenet, _engine_spec_keras_facenet),
+    'facenet_h5': (_load_facenet_h5, _warmup_facenet_h5, _engine_spec_facenet_h5),
+}
+
+_models = {}
+_engines = {}
+_timings = {}
+_lock = threading.Lock()
+
+
+def get_model(name='facenet'):
+    """
+    Return a loaded model, importing TensorFlow and loading weights on first use only.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            loader = MODELS[name][0]
+            started = time.perf_counter()
+            model = loader()
+            _timings.setdefault(name, {})['load_seconds'] = round(time.perf_counter() - started, 3)
+            _models[name] = model
+            print(f"🧠 Loaded model '{name}' in {_timings[name]['load_seconds']}s")
+    return model
+
+
+def get_engine(name='facenet') -> InferenceEngine:
+    """
+    Return the compiled, shape-bucketed inference engine wrapping a registered model.
+    """
+    engine = _engines.get(name)
+    if engine is not None:
+        return engine
+
+    keras_model, normalize = MODELS[name][2](get_model(name))
+    with _lock:
+        engine = _engines.get(name)
+        if engine is None:
+            started = time.perf_counter()
+            engine = InferenceEngine(keras_model, FACENET_INPUT_SHAPE, normalize=normalize)
+            _timings[name]['engine_build_seconds'] = round(time.perf_counter() - started, 3)
+            _engines[name] = engine
+    return engine
+
+
+def unload(name=None):
+    """
+    Drop a loaded model (default: all) and its engine, so the next get_model()
+    loads the weights from disk again.
+    """
+    with _lock:
+        for key in ([name] if name else list(_models)):
+            _models.pop(key, None)
+            _engines.pop(key, None)
+            _timings.pop(key, None)
+
+
+def warmup(name='facenet') -> Dict:
+    """
+    Load the model (if needed) and run one dummy forward pass so the first real
+    request doesn't pay graph-tracing latency. Returns load/warmup timings.
+    """
+    model = get_model(name)
+    run_warmup = MODELS[name][1]
+    started = time.perf_counter()
+    if INFERENCE_ENGINE:
+        get_engine(name).warmup()
+    else:
+        run_warmup(model, np.zeros((1,) + FACENET_INPUT_SHAPE, dtype=np.float32))
+    _timings[name]['warmup_seconds'] = round(time.perf_counter() - started, 3)
+    print(f"🔥 Warmed up model '{name}' in {_timings[name]['warmup_seconds']}s")
+    return dict(_timings[name])
+
+
+def is_loaded(name='facenet') -> bool:
+    return name in _models
+
+
+def model_status() -> Dict:
+    """
+    Which models are loaded, with their load/warmup timings and engine counters.
+    """
+    status = {name: dict(_timings.get(name, {}), loaded=name in _models) for name in MODELS}
+    for name, engine in _engines.items():
+        status[name]['engine'] = engine.stats()
+    return status
+
+
+if __name__ == '__main__':
+    import sys
+    for model_name in sys.argv[1:] or ['facenet']:
+        print(model_name, warmup(model_name))
@@ -0,0 +1,445 @@
+import os
+import glob
+import threading
+import numpy as np
+from collections import namedtuple
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+# Set PACKED_GALLERY=0 to always load the gallery from the database
+PACKED_GALLERY = os.environ.get('PACKED_GALLERY', '1') != '0'
+
+# Embedding model the packed vectors were produced by (empty: the configured backend's); a mismatch forces a rebuild
+GALLERY_MODEL_VERSION = os.environ.get('GALLERY_MODEL_VERSION', '')
+
+# Compact the file once this fraction of its published rows are tombstoned (0 disables; it still compacts when full)
+GALLERY_COMPACT_RATIO = float(os.environ.get('GALLERY_COMPACT_RATIO', 0.5))
+
+MAGIC = b'FACEGAL1'
+HEADER_SIZE = 128
+ID_WIDTH = 64
+MIN_CAPACITY = 64
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('dim', '<u4'),
+    ('dtype', 'S8'),
+    ('model', 'S32'),
+    ('capacity', '<u8'),
+    ('count', '<u8'),
+    ('live', '<u8'),
+    ('generation', '<u8'),  # zero in files written before generations existed
+    ('epoch', '<u8'),  # generation of the last full rewrite; rows below count never change within an epoch
+])
+ID_DTYPE = np.dtype([('id', f'S{ID_WIDTH}'), ('alive', 'u1')])
+
+# What open() returns: ids has None for tombstoned rows, matrix maps every row
+PackedSnapshot = namedtuple('PackedSnapshot', ['ids', 'matrix', 'generation', 'epoch'])
+
+
+def packed_path_for(db_path) -> str:
+    """
+    The packed gallery lives next to the database, e.g. attendance.gallery.
+    """
+    base, _ = os.path.splitext(os.path.abspath(db_path))
+    return base + '.gallery'
+
+
+def _layout(capacity, dim):
+    """
+    Byte offsets of the ID table and the (64-byte aligned) embedding matrix.
+    """
+    ids_offset = HEADER_SIZE
+    matrix_offset = ids_offset + capacity * ID_DTYPE.itemsize
+    matrix_offset += -matrix_offset % 64
+    return ids_offset, matrix_offset, matrix_offset + capacity * dim * 4
+
+
+class PackedGallery:
+    """
+    Single-file gallery: a header (dimension, dtype, model version, counts,
+    generation, epoch), a fixed-width ID table with an alive flag per row and a
+    contiguous float32 matrix with one row per template (a faculty's live rows
+    are contiguous).
+
+    Readers np.memmap the matrix, so startup doesn't parse the database and every
+    worker process shares the same page-cache pages. Each change publishes a new
+    generation in place: new rows are written behind the published row count, the
+    header is published, and only then are replaced rows tombstoned, so a reader
+    never sees a half-written row and a faculty is never missing. A reader that
+    still sees the old rows alive also sees the newer run, which wins. Only when
+    the capacity runs out is the file compacted into a new epoch and atomically
+    renamed over the old one; a reader keeps its old generation mapped until it
+    notices the new generation number and remaps. The file is also compacted
+    once GALLERY_COMPACT_RATIO of its rows are tombstoned.
+
+    A writer that finds the file unusable (another model, truncated or missing)
+    rebuilds it from db_path rather than publishing only its own faculty.
+    """
+
+    def __init__(self, path, model_version=None, db_path=None):
+        self.path = path
+        self._model_version = model_version or GALLERY_MODEL_VERSION
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+    @property
+    def model_version(self) -> str:
+        # Resolved on use, so a backend reloaded with new weights (serve.py SIGHUP) is picked up
+        if self._model_version:
+            return self._model_version
+        from utils.inference_backends import get_backend
+        return get_backend().version
+
+    # -- reading -------------------------------------------------------------
+
+    def _read_header(self, f=None):
+        try:
+            if f is not None:
+                f.seek(0)
+            header = np.fromfile(f if f is not None else self.path, dtype=HEADER_DTYPE, count=1)
+        except (OSError, ValueError):
+            return None
+        if len(header) != 1 or header['magic'][0] != MAGIC:
+            return None
+        return header[0]
+
+    def _problem(self, header, size) -> Optional[str]:
+        """
+        Why a header (of a file of the given size) can't be used, or None.
+        """
+        if header is None:
+            return 'missing or corrupt'
+        if header['model'].decode() != self.model_version or header['dtype'].decode() != 'float32':
+            return 'built for another model'
+        if header['count'] and size < _layout(int(header['capacity']), int(header['dim']))[2]:
+            return 'truncated'
+        return None
+
+    def _file_size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def generation(self) -> Optional[int]:
+        """
+        The published generation (a 128-byte read), or None without a usable file.
+        """
+        header = self._read_header()
+        return int(header['generation']) if header is not None else None
+
+    def open(self) -> Optional[PackedSnapshot]:
+        """
+        Map the file and return a PackedSnapshot of every published row (None ids
+        for tombstoned ones), or None when the file is missing, corrupt or was
+        written by a different model. Header, IDs and matrix come from one open
+        file, so a concurrent rename can't mix epochs, and the header is re-read
+        after the IDs so an in-place change racing the read is retried. The
+        matrix is a zero-copy read-only view of the mapping.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return None
+        with f:
+            for _ in range(3):
+                header = self._read_header(f)
+                problem = self._problem(header, os.fstat(f.fileno()).st_size)
+                if problem is not None:
+                    if header is not None:
+                        print(f"⚠️ Packed gallery {self.path} is {problem} – ignoring.")
+                    return None
+
+                dim, capacity, count = int(header['dim']), int(header['capacity']), int(header['count'])
+                generation, epoch = int(header['generation']), int(header['epoch'])
+                if count == 0:
+                    return PackedSnapshot([], np.empty((0, 0), dtype=np.float32), generation, epoch)
+                ids_offset, matrix_offset, _ = _layout(capacity, dim)
+                f.seek(ids_offset)
+                table = np.fromfile(f, dtype=ID_DTYPE, count=count)
+                again = self._read_header(f)
+                if again is not None and int(again['generation']) == generation:
+                    break
+            matrix = np.memmap(f, dtype=np.float32, mode='r', offset=matrix_offset, shape=(count, dim))
+        ids = [fid.decode('utf-8') if alive else None for fid, alive in zip(table['id'].tolist(), table['alive'].tolist())]
+        return PackedSnapshot(ids, matrix, generation, epoch)
+
+    def stats(self) -> Dict:
+        header = self._read_header()
+        if header is None:
+            return {'path': self.path, 'exists': False}
+        return {
+            'path': self.path,
+            'exists': True,
+            'dim': int(header['dim']),
+            'model': header['model'].decode(),
+            'generation': int(header['generation']),
+            'epoch': int(header['epoch']),
+            'capacity': int(header['capacity']),
+            'count': int(header['count']),
+            'live': int(header['live']),
+            'bytes': os.path.getsize(self.path),
+        }
+
+    # -- writing -------------------------------------------------------------
+
+    def _locked(self):
+        return _FileLock(self.path + '.lock')
+
+    def write(self, ids, matrix, capacity=None):
+        """
+        Atomically (re)write the whole file from live ids and a unit-vector matrix
+        as the next generation and epoch.
+        """
+        with self._lock, self._locked():
+            self._write(ids, matrix, capacity)
+
+    def _write(self, ids, matrix, capacity=None):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        count = len(ids)
+        dim = matrix.shape[1] if matrix.size else 0
+        capacity = max(capacity or 0, MIN_CAPACITY, count + count // 4)
+        ids_offset, matrix_offset, end = _layout(capacity, dim)
+        generation = (self.generation() or 0) + 1
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (MAGIC, dim, b'float32', self.model_version.encode(), capacity, count, count, generation, generation)
+        table = np.zeros(capacity, dtype=ID_DTYPE)
+        table['id'][:count] = [fid.encode('utf-8') for fid in ids]
+        table['alive'][:count] = 1
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.truncate(end)
+            f.write(header.tobytes())
+            f.seek(ids_offset)
+            f.write(table.tobytes())
+            f.seek(matrix_offset)
+            f.write(matrix.tobytes())
+        os.replace(tmp_path, self.path)
+
+    def _publish(self, header):
+        header['generation'] += 1
+        with open(self.path, 'r+b') as f:
+            f.write(np.array([header], dtype=HEADER_DTYPE).tobytes())
+
+    def _rebuild(self) -> bool:
+        """
+        Rewrite the file from the database, e.g. after another model wrote it.
+        """
+        if self.db_path is None:
+            print(f"⚠️ Packed gallery {self.path} is unusable and has no database to rebuild from – not written.")
+            return False
+        from utils.gallery import load_embeddings_from_db
+        ids, matrix = load_embeddings_from_db(self.db_path)
+        self._write(ids, matrix)
+        print(f"🗂️ Packed gallery {self.path} rebuilt from the database: {len(ids)} row(s).")
+        return True
+
+    def _compact(self, faculty_id=None, vectors=None):
+        """
+        Publish a new epoch with the live rows only, without faculty_id's rows
+        (plus its new vectors, if any).
+        """
+        loaded = self.open()
+        if loaded is None:
+            return self._rebuild()
+        keep = [i for i, fid in enumerate(loaded.ids) if fid is not None and fid != faculty_id]
+        ids = [loaded.ids[i] for i in keep]
+        matrix = np.asarray(loaded.matrix[keep]) if keep else np.empty((0, 0), dtype=np.float32)
+        if vectors is not None:
+            ids.extend([faculty_id] * len(vectors))
+            matrix = np.vstack([matrix, vectors]) if matrix.size else vectors
+        self._write(ids, matrix, capacity=2 * len(ids))
+        return True
+
+    def _compact_if_sparse(self, header):
+        count, live = int(header['count']), int(header['live'])
+        if GALLERY_COMPACT_RATIO > 0 and count >= MIN_CAPACITY and count - live >= GALLERY_COMPACT_RATIO * count:
+            self._compact()
+            print(f"🗜️ Packed gallery compacted: {count - live} of {count} row(s) were tombstoned.")
+
+    def _live_rows(self, table, count, faculty_id):
+        return np.flatnonzero((table['id'][:count] == faculty_id.encode('utf-8')) & (table['alive'][:count] == 1))
+
+    def append(self, faculty_id, vectors) -> bool:
+        """
+        Add or replace a faculty's templates (a single vector or a (k, d) matrix).
+        The rows are appended in place and any old ones tombstoned; the file is
+        only compacted when its capacity runs out. Returns False when the vectors
+        can't be packed.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if len(faculty_id.encode('utf-8')) > ID_WIDTH:
+            print(f"⚠️ Faculty ID {faculty_id} is too long for the packed gallery – skipping.")
+            return False
+        with self._lock, self._locked():
+            header = self._read_header()
+            if self._problem(header, self._file_size()) is not None:
+                return self._rebuild()
+            if not header['count']:
+                self._write([faculty_id] * len(vectors), vectors)
+                return True
+            if header['dim'] != vectors.shape[1]:
+                print(f"⚠️ Shape mismatch for {faculty_id} – not packed.")
+                return False
+
+            dim, capacity, count = int(header['dim']), int(header['capacity']), int(header['count'])
+            added = len(vectors)
+            if count + added > capacity:
+                return self._compact(faculty_id, vectors)
+
+            ids_offset, matrix_offset, _ = _layout(capacity, dim)
+            table = np.memmap(self.path, dtype=ID_DTYPE, mode='r+', offset=ids_offset, shape=(capacity,))
+            old = self._live_rows(table, count, faculty_id)
+            matrix = np.memmap(self.path, dtype=np.float32, mode='r+', offset=matrix_offset, shape=(capacity, dim))
+            matrix[count:count + added] = vectors
+            table[count:count + added] = (faculty_id.encode('utf-8'), 1)
+            matrix.flush()
+            table.flush()
+            header['count'] = count + added
+            header['live'] = int(header['live']) - len(old) + added
+            self._publish(header)  # only after the rows
+            if len(old):
+                # Tombstone the replaced rows last: a reader that still sees them also sees the newer run, which wins
+                table['alive'][old] = 0
+                table.flush()
+                self._compact_if_sparse(header)
+        return True
+
+    def remove(self, faculty_id) -> bool:
+        """
+        Tombstone the faculty's rows in place and publish a generation without them.
+        """
+        with self._lock, self._locked():
+            header = self._read_header()
+            if self._problem(header, self._file_size()) is not None:
+                return self._rebuild()
+            dim, capacity, count = int(header['dim']), int(header['capacity']), int(header['count'])
+            if not count:
+                return True
+            ids_offset, _, _ = _layout(capacity, dim)
+            table = np.memmap(self.path, dtype=ID_DTYPE, mode='r+', offset=ids_offset, shape=(capacity,))
+            old = self._live_rows(table, count, faculty_id)
+            if len(old):
+                table['alive'][old] = 0
+                table.flush()
+                header['live'] = int(header['live']) - len(old)
+                self._publish(header)
+                self._compact_if_sparse(header)
+        return True
+
+    def compact(self):
+        """
+        Rewrite the file with live rows only, dropping tombstoned ones.
+        """
+        with self._lock, self._locked():
+            if self._compact():
+                print(f"🗜️ Packed gallery compacted: {self.stats()['live']} live row(s).")
+
+
+class _FileLock:
+    """
+    Exclusive advisory lock so several worker processes don't interleave writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+_packed = {}
+_packed_lock = threading.Lock()
+
+
+def get_packed_gallery(db_path='attendance.db') -> PackedGallery:
+    """
+    Return the shared packed gallery file for a database.
+    """
+    key = os.path.abspath(db_path)
+    packed = _packed.get(key)
+    if packed is None:
+        with _packed_lock:
+            packed = _packed.setdefault(key, PackedGallery(packed_path_for(db_path), db_path=db_path))
+    return packed
+
+
+def rebuild(db_path='attendance.db') -> int:
+    """
+    Rebuild the packed file from the faculty table. Returns the number of rows written.
+    """
+    from utils.gallery import load_embeddings_from_db
+    ids, matrix = load_embeddings_from_db(db_path)
+    get_packed_gallery(db_path).write(ids, matrix)
+    return len(ids)
+
+
+def import_legacy_npy(faces_dir='faces', db_path='attendance.db') -> int:
+    """
+    Store the legacy faces/<faculty_id>.npy backups as the primary embedding of
+    faculty that have none for the current model, then rebuild the packed file
+    from the database. Faculty that are already enrolled keep their stored
+    embeddings. Returns the number of vectors imported.
+    """
+    from utils.gallery import as_unit_vector
+    from utils.db_handler import get_faculty_directory, get_faculty_embedding_ids, update_faculty
+    from utils.inference_backends import get_backend
+
+    existing = {row['faculty_id'] for row in get_faculty_directory(db_path)}
+    enrolled = set(get_faculty_embedding_ids(db_path))
+    dim = get_backend().dim
+    imported = 0
+    for path in sorted(glob.glob(os.path.join(faces_dir, '*.npy'))):
+        faculty_id = os.path.splitext(os.path.basename(path))[0]
+        if faculty_id not in existing:
+            print(f"⚠️ {faculty_id}.npy has no faculty record – skipping.")
+            continue
+        if faculty_id in enrolled:
+            continue
+        vector = as_unit_vector(np.load(path))
+        if vector is None or vector.shape[0] != dim:
+            print(f"⚠️ {faculty_id}.npy is not a usable embedding – skipping.")
+            continue
+        update_faculty(faculty_id, {'face_embedding': vector.astype(np.float32).tobytes()}, db_path)
+        imported += 1
+
+    rebuild(db_path)
+    return imported
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Manage the packed face gallery file.')
+    parser.add_argument('command', choices=['rebuild', 'import-npy', 'compact', 'stats'])
+    parser.add_argument('--db', default='attendance.db')
+    parser.add_argument('--faces-dir', default='faces')
+    args = parser.parse_args(argv)
+
+    packed = get_packed_gallery(args.db)
+    if args.command == 'rebuild':
+        print(f"✅ Packed {rebuild(args.db)} embedding(s) into {packed.path}")
+    elif args.command == 'import-npy':
+        print(f"✅ Imported {import_legacy_npy(args.faces_dir, args.db)} legacy .npy file(s) into {args.db}")
+    elif args.command == 'compact':
+        packed.compact()
+    print(packed.stats())
+
+
+if __name__ == '__main__':
+    main()
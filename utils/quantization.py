@@ -0,0 +1,215 @@
+import os
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+# Gallery coarse-scan storage: 'none' (float32 only), 'float16' or 'int8' (per-vector scale)
+GALLERY_QUANTIZATION = os.environ.get('GALLERY_QUANTIZATION', 'none').lower()
+
+# Faculty whose coarse score is within this margin of the threshold are re-ranked in float32
+RERANK_MARGIN = float(os.environ.get('RERANK_MARGIN', 0.05))
+
+# The best this many coarse candidates are always re-ranked in float32
+RERANK_TOP_K = int(os.environ.get('RERANK_TOP_K', 8))
+
+QUANTIZATION_MODES = ('none', 'float16', 'int8')
+SCAN_CHUNK = 1024  # rows widened per step; small enough for the float32 block to stay in cache
+
+
+def quantize(matrix, mode=GALLERY_QUANTIZATION) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """
+    Compress a unit-vector matrix for the coarse scan. Returns (codes, scales):
+    float16 codes with no scales, or int8 codes with one float32 scale per row.
+    Returns None for mode 'none' or an empty matrix.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown gallery quantization mode: {mode}")
+    if mode == 'none' or matrix.size == 0:
+        return None
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if mode == 'float16':
+        return np.ascontiguousarray(matrix, dtype=np.float16), None
+
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+    return np.ascontiguousarray(codes), scales.astype(np.float32)
+
+
+class QuantizedRows:
+    """
+    Quantized codes of an append-only row store (the packed gallery within one
+    epoch): each row is quantized once, into an over-allocated buffer, and the
+    (codes, scales) views handed out stay valid as more rows are appended.
+    """
+
+    def __init__(self, mode=GALLERY_QUANTIZATION):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown gallery quantization mode: {mode}")
+        self.mode = mode
+        self.count = 0
+        self._codes = None
+        self._scales = None
+
+    def extend(self, rows) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Quantize and append rows; returns the codes of every row so far (None for mode 'none').
+        """
+        new = quantize(rows, self.mode)
+        if new is not None:
+            codes, scales = new
+            total = self.count + len(codes)
+            if self._codes is None or total > len(self._codes):
+                # Grow geometrically; the old buffer stays behind any view already handed out
+                self._codes = self._grow(self._codes, (max(total, 2 * self.count), codes.shape[1]), codes.dtype)
+                if scales is not None:
+                    self._scales = self._grow(self._scales, (len(self._codes),), np.float32)
+            self._codes[self.count:total] = codes
+            if scales is not None:
+                self._scales[self.count:total] = scales
+            self.count = total
+        if self._codes is None:
+            return None
+        return self._codes[:self.count], (self._scales[:self.count] if self._scales is not None else None)
+
+    def _grow(self, old, shape, dtype):
+        grown = np.empty(shape, dtype=dtype)
+        if old is not None:
+            grown[:self.count] = old[:self.count]
+        return grown
+
+
+def coarse_scores(quantized, probes) -> np.ndarray:
+    """
+    Approximate (P, N) similarities of unit probes against quantized rows. Codes are
+    widened into one reused float32 buffer a chunk at a time, so the scan never
+    materializes the full float32 matrix. int8 scans about as fast as float32;
+    numpy's float16 widening is slower, so float16 trades latency for precision.
+    """
+    codes, scales = quantized
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    scores = np.empty((len(probes), len(codes)), dtype=np.float32)
+    block = np.empty((min(SCAN_CHUNK, len(codes)), codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), SCAN_CHUNK):
+        chunk = codes[start:start + SCAN_CHUNK]
+        np.copyto(block[:len(chunk)], chunk, casting='unsafe')
+        scores[:, start:start + len(chunk)] = probes @ block[:len(chunk)].T
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def faculty_scores(matrix, starts, probes, threshold=None, quantized=None, valid=None) -> np.ndarray:
+    """
+    (P, F) similarity of each probe to each faculty: the max over that faculty's
+    contiguous template rows (segments beginning at starts). Segments that valid
+    marks False (tombstoned rows) score -inf.
+
+    Without quantized codes this is one float32 product plus np.maximum.reduceat.
+    With them, the whole gallery is scanned coarsely, and only the RERANK_TOP_K best
+    faculty (plus any within RERANK_MARGIN of threshold) are re-scored from the
+    float32 rows; every other faculty gets -inf.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    dead = None if valid is None or valid.all() else ~valid
+    if quantized is None:
+        scores = np.maximum.reduceat(probes @ np.asarray(matrix).T, starts, axis=1)
+        if dead is not None:
+            scores[:, dead] = -np.inf
+        return scores
+
+    coarse = np.maximum.reduceat(coarse_scores(quantized, probes), starts, axis=1)
+    if dead is not None:
+        coarse[:, dead] = -np.inf
+    ends = np.r_[starts[1:], len(matrix)]
+    scores = np.full_like(coarse, -np.inf)
+    k = min(RERANK_TOP_K, coarse.shape[1])
+    for p in range(len(probes)):
+        candidates = np.argpartition(-coarse[p], k - 1)[:k]
+        if threshold is not None:
+            candidates = np.union1d(candidates, np.flatnonzero(coarse[p] >= threshold - RERANK_MARGIN))
+        lengths = ends[candidates] - starts[candidates]
+        local_starts = np.r_[0, np.cumsum(lengths)[:-1]]
+        rows = np.arange(lengths.sum()) + np.repeat(starts[candidates] - local_starts, lengths)
+        exact = np.asarray(matrix[rows], dtype=np.float32) @ probes[p]
+        scores[p, candidates] = np.maximum.reduceat(exact, local_starts)
+    if dead is not None:
+        scores[:, dead] = -np.inf
+    return scores
+
+
+def nbytes(quantized) -> int:
+    if quantized is None:
+        return 0
+    codes, scales = quantized
+    return codes.nbytes + (scales.nbytes if scales is not None else 0)
+
+
+def decision_diff(row_ids, matrix, probes, threshold, mode=GALLERY_QUANTIZATION) -> Dict:
+    """
+    Run the same probes through the float32 path and the quantized + re-rank path
+    and report every probe whose match decision (accepted faculty or rejection) differs.
+    """
+    if mode not in QUANTIZATION_MODES or mode == 'none':
+        raise ValueError("Pick a quantization mode to compare against float32")
+    row_ids = np.asarray(row_ids, dtype=object)
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    probes = probes / np.maximum(np.linalg.norm(probes, axis=1, keepdims=True), 1e-12)
+    report = {'mode': mode, 'probes': len(probes), 'templates': len(row_ids), 'decisions_changed': 0,
+              'changes': [], 'max_coarse_error': 0.0, 'float32_bytes': int(np.asarray(matrix).nbytes), 'quantized_bytes': 0}
+    if len(row_ids) == 0:
+        return report
+
+    starts = np.flatnonzero(np.r_[True, row_ids[1:] != row_ids[:-1]])
+    faculty_ids = row_ids[starts]
+    quantized = quantize(matrix, mode)
+    exact = faculty_scores(matrix, starts, probes)
+    approx = faculty_scores(matrix, starts, probes, threshold, quantized)
+
+    for i, (exact_row, approx_row) in enumerate(zip(exact, approx)):
+        e, a = int(np.argmax(exact_row)), int(np.argmax(approx_row))
+        exact_decision = faculty_ids[e] if exact_row[e] >= threshold else None
+        approx_decision = faculty_ids[a] if approx_row[a] >= threshold else None
+        if exact_decision != approx_decision:
+            report['changes'].append({'probe': i, 'float32': exact_decision, 'quantized': approx_decision,
+                                      'float32_score': round(float(exact_row[e]), 4),
+                                      'quantized_score': round(float(approx_row[a]), 4)})
+
+    coarse = coarse_scores(quantized, probes)
+    report['decisions_changed'] = len(report['changes'])
+    report['max_coarse_error'] = round(float(np.abs(coarse - probes @ np.asarray(matrix, dtype=np.float32).T).max()), 5)
+    report['quantized_bytes'] = nbytes(quantized)
+    return report
+
+
+def main(argv=None):
+    import argparse
+    from utils.gallery import get_gallery
+    from utils.face_recognition import THRESHOLD
+
+    parser = argparse.ArgumentParser(description='Compare quantized and float32 gallery match decisions.')
+    parser.add_argument('--db', default='attendance.db')
+    parser.add_argument('--mode', choices=['float16', 'int8'], default='int8')
+    parser.add_argument('--probes', help='.npy file of probe embeddings (default: perturbed gallery templates)')
+    parser.add_argument('--noise', type=float, default=0.04, help='per-dimension noise for perturbed probes')
+    args = parser.parse_args(argv)
+
+    row_ids, matrix = get_gallery(args.db).snapshot()
+    if args.probes:
+        probes = np.load(args.probes)
+    else:
+        # Stored templates with noise land around the threshold, where decisions are fragile
+        rng = np.random.default_rng(0)
+        probes = np.asarray(matrix, dtype=np.float32) + args.noise * rng.standard_normal(matrix.shape).astype(np.float32)
+
+    report = decision_diff(row_ids, matrix, probes, THRESHOLD, mode=args.mode)
+    for change in report['changes']:
+        print(f"⚠️ Probe {change['probe']}: float32={change['float32']} ({change['float32_score']}) "
+              f"{args.mode}={change['quantized']} ({change['quantized_score']})")
+    status = "✅" if report['decisions_changed'] == 0 else "❌"
+    print(f"{status} {report['decisions_changed']} of {report['probes']} decision(s) changed; "
+          f"max coarse error {report['max_coarse_error']}; "
+          f"{report['float32_bytes']} → {report['quantized_bytes']} bytes")
+
+
+if __name__ == '__main__':
+    main()
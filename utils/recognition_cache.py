@@ -0,0 +1,120 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict
+from utils.db_handler import register_embedding_listener
+from utils.db_changes import subscribe
+
+# Max cached upload results
+RECOGNITION_CACHE_SIZE = int(os.environ.get('RECOGNITION_CACHE_SIZE', 512))
+
+# Seconds a cached result stays valid
+RECOGNITION_CACHE_TTL = float(os.environ.get('RECOGNITION_CACHE_TTL', 30))
+
+_MISSING = object()
+
+
+class RecognitionCache:
+    """
+    Bounded LRU + TTL cache of recognition results keyed by upload content hash.
+
+    Kiosk retries and double-clicks re-send identical bytes; a hit skips the
+    decode, detection and FaceNet inference entirely.
+    """
+
+    def __init__(self, max_size=RECOGNITION_CACHE_SIZE, ttl=RECOGNITION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+            self._stats['misses'] += 1
+            return default
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate_faculty(self, faculty_id) -> int:
+        """
+        Drop the results a change to one faculty's templates can affect: its 1:1
+        verifications and the 1:N results that matched it or matched nobody.
+        Upload embeddings don't depend on the gallery and are kept.
+        Returns the number of entries dropped.
+        """
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items()
+                     if (key[0] == 'verify' and key[2] == faculty_id)
+                     or (key[0] == 'recognize' and (not value or faculty_id in value))]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += 1
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['max_size'] = self.max_size
+        stats['ttl'] = self.ttl
+        return stats
+
+
+recognition_cache = RecognitionCache()
+
+
+def upload_digest(file_obj, idempotency_key=None) -> str:
+    """
+    Fast content hash of an upload (optionally combined with a client idempotency key).
+    The stream is rewound so it can still be decoded afterwards.
+    """
+    digest = hashlib.blake2b(file_obj.read(), digest_size=16)
+    file_obj.seek(0)
+    if idempotency_key:
+        digest.update(b'\0' + str(idempotency_key).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _on_embedding_change(action, faculty_id, embedding, db_path, change_id=None):
+    # Cached matches depend on the gallery contents
+    recognition_cache.invalidate_faculty(faculty_id)
+
+
+register_embedding_listener(_on_embedding_change)
+
+
+def _on_db_change(topic, keys, db_path):
+    # Another process changed the gallery contents (this process's own writes were invalidated by the listener)
+    if keys is None:
+        recognition_cache.clear()
+        return
+    for faculty_id in keys:
+        recognition_cache.invalidate_faculty(faculty_id)
+
+
+subscribe('faculty', _on_db_change, skip_local=True)
@@ -0,0 +1,303 @@
+import os
+import time
+import uuid
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import cv2
+import numpy as np
+from face_utils import detect_faces, preprocess_face, embed_faces
+from utils.face_quality import check_faces
+from utils.ann_index import search_batch
+from utils.face_recognition import THRESHOLD
+from utils.db_handler import create_attendance, has_attendance_on
+
+# Frames sampled per second of video
+VIDEO_SAMPLE_FPS = float(os.environ.get('VIDEO_SAMPLE_FPS', 2))
+
+# Sampled frames whose faces are detected in parallel and embedded together
+VIDEO_BATCH_FRAMES = int(os.environ.get('VIDEO_BATCH_FRAMES', 32))
+
+# Threads running Haar detection and preprocessing (OpenCV releases the GIL)
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', os.cpu_count() or 4))
+
+# Videos processed at the same time; further uploads wait in the queue
+VIDEO_MAX_JOBS = int(os.environ.get('VIDEO_MAX_JOBS', 2))
+
+# Uploads waiting for a free slot before new ones are turned away
+VIDEO_MAX_QUEUED = int(os.environ.get('VIDEO_MAX_QUEUED', 8))
+
+# Seconds a finished job's result stays queryable, and how many finished jobs are kept at most
+VIDEO_JOB_TTL = float(os.environ.get('VIDEO_JOB_TTL', 3600))
+VIDEO_JOBS_KEPT = int(os.environ.get('VIDEO_JOBS_KEPT', 100))
+
+# Bytes copied per read when a raw request body is streamed to disk
+VIDEO_COPY_CHUNK = 1024 * 1024
+
+# Where uploaded videos are kept while they are processed, under the app's UPLOAD_FOLDER
+VIDEO_UPLOAD_SUBDIR = os.path.join('videos', 'ingest')
+
+_DONE = object()
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=max(1, VIDEO_MAX_JOBS), thread_name_prefix='video-job')
+
+
+class VideoQueueFull(RuntimeError):
+    pass
+
+
+class VideoJob:
+    """
+    One background ingestion of a recorded video. Progress lives in memory, so
+    it is only visible from the process that started the job.
+    """
+
+    def __init__(self, path, recorded_at, location):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.recorded_at = recorded_at
+        self.location = location
+        self.status = 'queued'
+        self.error = None
+        self.duration = 0.0
+        self.position = 0.0
+        self.frames_sampled = 0
+        self.faces_embedded = 0
+        self.started = None
+        self.finished = None
+        self.recognized = {}  # faculty_id -> first sighting
+
+    def to_dict(self) -> Dict:
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'error': self.error,
+            'progress': round(self.position / self.duration, 3) if self.duration else 0.0,
+            'video_seconds': round(self.position, 1),
+            'duration': round(self.duration, 1),
+            'frames_sampled': self.frames_sampled,
+            'faces_embedded': self.faces_embedded,
+            'elapsed': round(elapsed, 1),
+            'realtime_factor': round(self.position / elapsed, 1) if elapsed else 0.0,
+            'recognized': list(self.recognized.values()),
+        }
+
+
+def _read_frames(cap, sample_fps, frames, job, stop):
+    """
+    Decoder thread: grab every frame (cheap), but only retrieve/convert the sampled ones.
+    """
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps / sample_fps))) if sample_fps > 0 else 1
+        index = 0
+        while not stop.is_set() and cap.grab():
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    _put(frames, (index / fps, frame), stop)
+            index += 1
+            job.position = index / fps
+    finally:
+        _put(frames, _DONE, stop)
+
+
+def _put(frames, item, stop):
+    # Bounded queue: wait for the consumer, but give up once the job is stopping
+    while not stop.is_set():
+        try:
+            frames.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+
+
+def _prepare_frame(item):
+    """
+    Detect faces in one sampled frame and return (timestamp, preprocessed faces).
+    """
+    timestamp, frame = item
+    crops = [frame[y:y+h, x:x+w] for x, y, w, h in detect_faces(frame)]
+    crops = [crop for crop, reason in zip(crops, check_faces(crops)) if reason is None]
+    return timestamp, [preprocess_face(crop) for crop in crops]
+
+
+def _take_batch(frames, size):
+    batch = []
+    while len(batch) < size:
+        item = frames.get()
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def _record(job, faculty_id, similarity, timestamp):
+    """
+    First sighting of a faculty in the video: mark attendance at the frame's wall-clock time.
+    """
+    seen_at = job.recorded_at + timedelta(seconds=timestamp)
+    sighting = {
+        'faculty_id': faculty_id,
+        'similarity': round(similarity, 4),
+        'video_time': round(timestamp, 1),
+        'time': seen_at.strftime('%H:%M:%S'),
+        'status': 'Already marked',
+    }
+    job.recognized[faculty_id] = sighting
+
+    current_date = seen_at.strftime('%Y-%m-%d')
+    if has_attendance_on(faculty_id, current_date):
+        return
+    if create_attendance({
+        'faculty_id': faculty_id,
+        'date': current_date,
+        'time': sighting['time'],
+        'location': job.location,
+        'status': 'Present'
+    }):
+        sighting['status'] = 'Marked'
+        print(f"✅ {faculty_id} marked from video at {sighting['time']} (similarity {similarity:.4f})")
+
+
+def run_job(job, sample_fps=VIDEO_SAMPLE_FPS, batch_frames=VIDEO_BATCH_FRAMES, workers=VIDEO_WORKERS):
+    """
+    Decode in a background thread, detect faces on a thread pool, embed every face
+    of a batch of frames in one forward pass and keep each faculty's first sighting.
+    """
+    job.status = 'running'
+    job.started = time.time()
+    cap = cv2.VideoCapture(job.path)
+    stop = threading.Event()
+    reader = None
+    try:
+        if not cap.isOpened():
+            raise ValueError('Could not open video file')
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        job.duration = (cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) / fps
+
+        frames = queue.Queue(maxsize=batch_frames * 2)
+        reader = threading.Thread(target=_read_frames, args=(cap, sample_fps, frames, job, stop), daemon=True)
+        reader.start()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            finished = False
+            while not finished:
+                batch, finished = _take_batch(frames, batch_frames)
+                prepared = list(pool.map(_prepare_frame, batch))
+                job.frames_sampled += len(batch)
+
+                faces = [face for _, frame_faces in prepared for face in frame_faces]
+                if not faces:
+                    continue
+                embeddings = embed_faces(np.concatenate(faces, axis=0))
+                job.faces_embedded += len(faces)
+
+                # Match frame by frame: faces in one frame are different people
+                offset = 0
+                for timestamp, frame_faces in prepared:
+                    if not frame_faces:
+                        continue
+                    matches = search_batch(embeddings[offset:offset + len(frame_faces)], THRESHOLD)
+                    offset += len(frame_faces)
+                    for match in matches:
+                        if match and match[0] not in job.recognized:
+                            _record(job, match[0], match[1], timestamp)
+
+        job.position = job.duration or job.position
+        job.status = 'done'
+        print(f"🎬 Video job {job.job_id}: {len(job.recognized)} faculty recognized in "
+              f"{time.time() - job.started:.1f}s ({job.duration:.0f}s of video)")
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        print(f"❌ Video job {job.job_id} failed: {e}")
+    finally:
+        stop.set()
+        if reader is not None:
+            reader.join()  # never release the capture while the decoder still uses it
+        cap.release()
+        job.finished = time.time()
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+
+
+def _prune_jobs(now=None):
+    """
+    Forget finished jobs older than VIDEO_JOB_TTL, and the oldest beyond VIDEO_JOBS_KEPT.
+    Call with _jobs_lock held.
+    """
+    now = now or time.time()
+    finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.finished)
+    expired = [job for job in finished if now - job.finished > VIDEO_JOB_TTL]
+    expired += finished[len(expired):max(len(expired), len(finished) - VIDEO_JOBS_KEPT)]
+    for job in expired:
+        del _jobs[job.job_id]
+
+
+def queue_full() -> bool:
+    """
+    True when VIDEO_MAX_QUEUED uploads are already waiting; check before reading a large upload.
+    """
+    with _jobs_lock:
+        _prune_jobs()
+        return sum(job.status == 'queued' for job in _jobs.values()) >= VIDEO_MAX_QUEUED
+
+
+def start_job(video, upload_folder, location='Unknown', recorded_at: Optional[datetime] = None,
+              filename=None) -> VideoJob:
+    """
+    Save an uploaded video under upload_folder and queue it for processing; at
+    most VIDEO_MAX_JOBS run at once. video is an uploaded FileStorage or a
+    binary stream (e.g. a raw request body), which is copied to disk in
+    VIDEO_COPY_CHUNK pieces. Raises VideoQueueFull when VIDEO_MAX_QUEUED uploads
+    are already waiting, and ValueError for an empty upload. recorded_at is when
+    the recording started; by default the video is assumed to have ended when it
+    was uploaded.
+    """
+    if queue_full():
+        raise VideoQueueFull(f"{VIDEO_MAX_QUEUED} videos are already waiting")
+
+    upload_dir = os.path.join(upload_folder, VIDEO_UPLOAD_SUBDIR)
+    os.makedirs(upload_dir, exist_ok=True)
+    extension = os.path.splitext(filename or getattr(video, 'filename', None) or '')[1] or '.mp4'
+    path = os.path.join(upload_dir, f"{uuid.uuid4().hex}{extension}")
+    try:
+        if hasattr(video, 'save'):
+            video.save(path)
+        else:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(video, f, VIDEO_COPY_CHUNK)
+        if not os.path.getsize(path):
+            raise ValueError("the uploaded video is empty")
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    if recorded_at is None:
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        duration = (cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) / fps
+        cap.release()
+        recorded_at = datetime.now() - timedelta(seconds=duration)
+
+    job = VideoJob(path, recorded_at, location)
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    _executor.submit(run_job, job)
+    return job
+
+
+def get_job(job_id) -> Optional[VideoJob]:
+    with _jobs_lock:
+        _prune_jobs()
+        return _jobs.get(job_id)